@@ -44,13 +44,17 @@ echo "[step2] starting quickstart (docker compose)"
 docker compose -f "$ZITI_COMPOSE_FILE" up -d
 
 echo "[step2] waiting for quickstart to be healthy"
-# quickstart has a healthcheck; poll it.
-for _ in $(seq 1 60); do
+# quickstart has a healthcheck; poll it, starting fast and backing off to 2s (up to 2 minutes).
+status=""
+delay=0.1
+deadline=$((SECONDS + 120))
+while ((SECONDS < deadline)); do
   status=$(docker inspect -f '{{.State.Health.Status}}' "$(docker compose -f "$ZITI_COMPOSE_FILE" ps -q quickstart)" 2>/dev/null || true)
   if [[ "$status" == "healthy" ]]; then
     break
   fi
-  sleep 2
+  sleep "$delay"
+  delay=$(awk -v d="$delay" 'BEGIN { d *= 2; print (d > 2 ? 2 : d) }')
 done
 
 if [[ "$status" != "healthy" ]]; then
@@ -69,6 +73,16 @@ if [[ -n "$ZITI_CA_FILE" ]]; then
   login_args+=(--ca "$ZITI_CA_FILE")
 fi
 
+# The ziti CLI keeps a single login session (in the container, or in ~/.config/ziti
+# locally). Hold a shared lock from login until the script exits, so step2 and step3
+# run side by side cannot log in over each other's session mid-way. Without flock
+# (e.g. stock macOS) the steps must not be run concurrently.
+ZITI_CLI_LOCK=${ZITI_CLI_LOCK:-${TMPDIR:-/tmp}/zentry-ziti-cli.lock}
+if command -v flock >/dev/null 2>&1; then
+  exec 9>"$ZITI_CLI_LOCK"
+  flock 9
+fi
+
 echo "[step2] logging in to controller as $ZITI_USER"
 if ! docker compose -f "$ZITI_COMPOSE_FILE" exec -T quickstart ziti edge login "${login_args[@]}"; then
   cat >&2 <<EOF
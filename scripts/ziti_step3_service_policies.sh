@@ -60,6 +60,16 @@ if [[ -n "$ZITI_CA_FILE" ]]; then
 	login_args+=(--ca "$ZITI_CA_FILE")
 fi
 
+# The ziti CLI keeps a single login session (in the container, or in ~/.config/ziti
+# locally). Hold a shared lock from login until the script exits, so step2 and step3
+# run side by side cannot log in over each other's session mid-way. Without flock
+# (e.g. stock macOS) the steps must not be run concurrently.
+ZITI_CLI_LOCK=${ZITI_CLI_LOCK:-${TMPDIR:-/tmp}/zentry-ziti-cli.lock}
+if command -v flock >/dev/null 2>&1; then
+	exec 9>"$ZITI_CLI_LOCK"
+	flock 9
+fi
+
 if ! _ziti edge login "${login_args[@]}"; then
 	cat >&2 <<EOF
 
@@ -78,16 +88,29 @@ EOF
 	exit 1
 fi
 
+# Creates an entity unless one with that name already exists, so reruns against
+# an existing lab are no-ops instead of failing.
+#   _ensure <list-type> <create-type> <name> [create args...]
+_ensure() {
+	local list_type=$1 create_type=$2 name=$3
+	shift 3
+	if _ziti edge list "$list_type" "name=\"${name}\"" -j | grep -Eq '"totalCount": *[1-9]'; then
+		echo "Exists: ${create_type} ${name}"
+		return
+	fi
+	_ziti edge create "$create_type" "$name" "$@"
+}
+
 # Create the service
-_ziti edge create service "$SERVICE_NAME"
+_ensure services service "$SERVICE_NAME"
 
 # Allow hosting and dialing
-_ziti edge create service-policy "${SERVICE_NAME}-bind" Bind --service-roles "@${SERVICE_NAME}" --identity-roles "@${SENTINEL_NAME}"
-_ziti edge create service-policy "${SERVICE_NAME}-dial" Dial --service-roles "@${SERVICE_NAME}" --identity-roles "@${CLIENT_NAME}"
+_ensure service-policies service-policy "${SERVICE_NAME}-bind" Bind --service-roles "@${SERVICE_NAME}" --identity-roles "@${SENTINEL_NAME}"
+_ensure service-policies service-policy "${SERVICE_NAME}-dial" Dial --service-roles "@${SERVICE_NAME}" --identity-roles "@${CLIENT_NAME}"
 
 # Allow identities to use routers; and allow the service on routers.
 # In a lab, "#all" is simplest; tighten these roles later.
-_ziti edge create edge-router-policy "${SERVICE_NAME}-identities" --edge-router-roles "#all" --identity-roles "@${SENTINEL_NAME},@${CLIENT_NAME}"
-_ziti edge create service-edge-router-policy "${SERVICE_NAME}-service" --edge-router-roles "#all" --service-roles "@${SERVICE_NAME}"
+_ensure edge-router-policies edge-router-policy "${SERVICE_NAME}-identities" --edge-router-roles "#all" --identity-roles "@${SENTINEL_NAME},@${CLIENT_NAME}"
+_ensure service-edge-router-policies service-edge-router-policy "${SERVICE_NAME}-service" --edge-router-roles "#all" --service-roles "@${SERVICE_NAME}"
 
-echo "Created service and policies for service: ${SERVICE_NAME}"
\ No newline at end of file
+echo "Created service and policies for service: ${SERVICE_NAME}"
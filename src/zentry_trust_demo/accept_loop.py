@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+SATURATION_POLICIES = ("reject", "backoff")
+
+
+@dataclass(frozen=True)
+class WorkerLimits:
+    """How many connections a host serves at once, and what happens beyond that.
+
+    ``max_workers`` connections are handled concurrently and up to
+    ``queue_depth`` more wait for a free worker. A connection that moves no
+    bytes for ``idle_timeout`` seconds (0 = never) is closed, so idle clients
+    cannot hold every worker. When workers and queue are both full:
+
+    - ``reject``: accept and immediately close new connections;
+    - ``backoff``: stop accepting (the listen backlog holds new clients) and
+      poll for a free slot with exponential backoff up to ``backoff_max``.
+    """
+
+    max_workers: int = 128
+    queue_depth: int = 256
+    policy: str = "reject"
+    backoff_max: float = 0.5
+    idle_timeout: float = 30.0
+
+    def __post_init__(self) -> None:
+        if self.max_workers < 1 or self.queue_depth < 0:
+            raise ValueError(f"invalid worker limits: workers={self.max_workers} queue={self.queue_depth}")
+        if self.idle_timeout < 0:
+            raise ValueError(f"idle timeout must be >= 0, got {self.idle_timeout}")
+        if self.policy not in SATURATION_POLICIES:
+            raise ValueError(f"unknown saturation policy {self.policy!r} (expected 'reject' or 'backoff')")
+
+
+class BoundedExecutor:
+    """A thread pool whose backlog of queued work is capped."""
+
+    def __init__(self, limits: WorkerLimits, name: str) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=limits.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(limits.max_workers + limits.queue_depth)
+
+    def try_submit(
+        self,
+        fn: Callable[..., None],
+        *args: object,
+        on_cancel: Callable[[], None] | None = None,
+    ) -> bool:
+        """Queue ``fn(*args)`` if there is room; return False when saturated.
+
+        ``on_cancel`` runs instead of ``fn`` if the work is still queued at shutdown.
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        def done(f: Future[None]) -> None:
+            self._slots.release()
+            if f.cancelled() and on_cancel is not None:
+                on_cancel()
+
+        future.add_done_callback(done)
+        return True
+
+    def wait_for_slot(self, backoff_max: float) -> None:
+        """Block until a slot frees up, polling with exponential backoff."""
+        delay = 0.001
+        while not self._slots.acquire(blocking=False):
+            time.sleep(delay)
+            delay = min(backoff_max, delay * 2)
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        # Queued work is cancelled, which runs its ``on_cancel``.
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self) -> "BoundedExecutor":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.shutdown()
+
+
+def serve_connections(
+    accept: Callable[[], socket.socket],
+    handle: Callable[[socket.socket], None],
+    limits: WorkerLimits,
+    name: str,
+) -> None:
+    """Accept connections forever and hand each to ``handle`` on a bounded pool.
+
+    ``handle`` owns the socket it is given (and must close it); sockets still
+    queued when the loop stops are closed here.
+    """
+    rejected = 0
+    last_report = 0.0
+    with BoundedExecutor(limits, name) as pool:
+        while True:
+            if limits.policy == "backoff":
+                pool.wait_for_slot(limits.backoff_max)
+            conn = accept()
+            if pool.try_submit(handle, conn, on_cancel=conn.close):
+                continue
+            conn.close()
+            rejected += 1
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                print(f"[{name}] saturated ({limits.max_workers} workers busy): rejected {rejected} connection(s)")
+                rejected = 0
+                last_report = now
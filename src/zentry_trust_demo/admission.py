@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import contextlib
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import ContextManager, Iterator
+
+from zentry_trust_demo.metrics import LATENCY_BUCKETS, Histogram
+
+# What a browser gets when its connection is turned away before it reaches the service.
+REJECT_RESPONSES = {
+    502: b"HTTP/1.1 502 Bad Gateway\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 16\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+    b"502 Bad Gateway\n",
+    503: b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 24\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+    b"503 Service Unavailable\n",
+}
+
+
+@dataclass(frozen=True)
+class AdmissionConfig:
+    """Limits on Ziti dials the proxy starts at once.
+
+    At most ``max_dials`` dials are in flight (0 = no global cap), and at
+    most ``per_client`` of them for one client IP (0 = no per-client cap).
+    Connections over the limit wait in a FIFO of ``queue_size`` for up to
+    ``queue_timeout`` seconds; beyond that they are rejected at once.
+    """
+
+    max_dials: int = 0
+    per_client: int = 0
+    queue_size: int = 256
+    queue_timeout: float = 5.0
+
+    def __post_init__(self) -> None:
+        if self.max_dials < 0 or self.per_client < 0 or self.queue_size < 0 or self.queue_timeout < 0:
+            raise ValueError(f"invalid admission limits: {self}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_dials > 0 or self.per_client > 0
+
+
+class DialRejected(RuntimeError):
+    """The dial queue was full, or the wait for a dial slot ran past its deadline."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("client", "admitted")
+
+    def __init__(self, client: str) -> None:
+        self.client = client
+        self.admitted = False
+
+
+class DialGate:
+    """Admission control in front of ``ctx.connect``: smooths a burst of new connections into a steady dial rate.
+
+    A page load can open dozens of connections at once; without a gate each
+    one dials the edge router immediately. Here they queue instead, and a
+    freed slot goes to the oldest waiter whose client is under its own limit,
+    so one busy client cannot hold up everyone queued behind it.
+    """
+
+    def __init__(self, config: AdmissionConfig, label: str = "proxy") -> None:
+        self.config = config
+        self.label = label
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected: dict[str, int] = {}
+        self.wait = Histogram(LATENCY_BUCKETS)
+        self._per_client: dict[str, int] = {}
+        self._queue: deque[_Waiter] = deque()
+        self._cond = threading.Condition()
+        self._logged_at = 0.0
+        self._unlogged = 0
+
+    def _has_slot(self, client: str) -> bool:
+        c = self.config
+        if c.max_dials and self.in_flight >= c.max_dials:
+            return False
+        return not c.per_client or self._per_client.get(client, 0) < c.per_client
+
+    def _take(self, client: str) -> None:
+        self.in_flight += 1
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+
+    def _hand_off(self) -> None:
+        """Admit queued waiters, oldest first, while slots allow (lock held)."""
+        woke = False
+        for w in list(self._queue):
+            if self.config.max_dials and self.in_flight >= self.config.max_dials:
+                break
+            if self._has_slot(w.client):
+                self._queue.remove(w)
+                self._take(w.client)
+                w.admitted = True
+                woke = True
+        if woke:
+            self._cond.notify_all()
+
+    def acquire(self, client: str) -> float:
+        """Block until ``client`` may dial; return the seconds spent waiting.
+
+        Raises :class:`DialRejected` when the queue is full or the wait times out.
+        """
+        start = time.monotonic()
+        with self._cond:
+            if not self._queue and self._has_slot(client):
+                self._take(client)
+                self._admit(0.0)
+                return 0.0
+            if len(self._queue) >= self.config.queue_size:
+                self._reject("QueueFull")
+            me = _Waiter(client)
+            self._queue.append(me)
+            self._hand_off()  # the waiters ahead may all be stuck on their own client's limit
+            deadline = start + self.config.queue_timeout
+            while not me.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(me)
+                    self._hand_off()  # we may have been the one blocking others' turn
+                    self._reject("QueueTimeout")
+                self._cond.wait(remaining)
+            waited = time.monotonic() - start
+            self._admit(waited)
+            return waited
+
+    def release(self, client: str) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            n = self._per_client.get(client, 0) - 1
+            if n > 0:
+                self._per_client[client] = n
+            else:
+                self._per_client.pop(client, None)
+            self._hand_off()
+
+    @contextlib.contextmanager
+    def dial(self, client: str) -> Iterator[float]:
+        """Hold a dial slot for ``client`` for the duration of the ``with`` block."""
+        waited = self.acquire(client)
+        try:
+            yield waited
+        finally:
+            self.release(client)
+
+    def _admit(self, waited: float) -> None:
+        self.admitted += 1
+        self.wait.observe(waited)
+
+    def _reject(self, reason: str) -> None:
+        """Count (and at most once a second, log) a rejection, then raise it (lock held)."""
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        self._unlogged += 1
+        now = time.monotonic()
+        if now - self._logged_at >= 1.0:
+            print(
+                f"[{self.label}] rejected {self._unlogged} connection(s) with 503 ({reason}): "
+                f"queue={len(self._queue)}/{self.config.queue_size} dialing={self.in_flight} "
+                f"mean wait={self.wait.mean() * 1e3:.1f}ms",
+                flush=True,
+            )
+            self._logged_at, self._unlogged = now, 0
+        raise DialRejected(reason)
+
+    def summary(self) -> str:
+        with self._cond:
+            return (
+                f"dialing={self.in_flight} queued={len(self._queue)} "
+                f"dial_wait={self.wait.mean() * 1e3:.1f}ms rejected={sum(self.rejected.values())}"
+            )
+
+    def render(self) -> list[str]:
+        """Prometheus lines for the proxy's ``/metrics`` endpoint."""
+        with self._cond:
+            out = [
+                "# HELP zentry_proxy_dials_in_flight Ziti dials admitted and not yet finished.",
+                "# TYPE zentry_proxy_dials_in_flight gauge",
+                f"zentry_proxy_dials_in_flight {self.in_flight}",
+                "# HELP zentry_proxy_dial_queue_depth Connections waiting for a dial slot.",
+                "# TYPE zentry_proxy_dial_queue_depth gauge",
+                f"zentry_proxy_dial_queue_depth {len(self._queue)}",
+                "# HELP zentry_proxy_dial_rejected_total Connections turned away before dialing, by reason.",
+                "# TYPE zentry_proxy_dial_rejected_total counter",
+            ]
+            for reason in ("QueueFull", "QueueTimeout"):
+                out.append(f'zentry_proxy_dial_rejected_total{{reason="{reason}"}} {self.rejected.get(reason, 0)}')
+            name = "zentry_proxy_dial_wait_seconds"
+            out += [f"# HELP {name} Time spent queued for a dial slot.", f"# TYPE {name} histogram"]
+            out += self.wait.render(name)
+        return out
+
+
+def gated(gate: DialGate | None, client: str) -> ContextManager[object]:
+    """``gate.dial(client)``, or a no-op when admission control is off."""
+    return gate.dial(client) if gate is not None else contextlib.nullcontext()
+
+
+def client_key(sock: socket.socket) -> str:
+    """The address per-client limits are counted against (the peer IP)."""
+    try:
+        peer = sock.getpeername()
+    except OSError:
+        return ""
+    return peer[0] if isinstance(peer, tuple) else str(peer)
+
+
+def reject_connection(sock: socket.socket, http: bool = True, status: int = 503) -> None:
+    """Answer a raw client connection with ``status`` (only when it speaks HTTP)."""
+    try:
+        if http:
+            sock.setblocking(False)
+            # Read what the client already sent so closing does not reset the
+            # connection before it has read the response.
+            with contextlib.suppress(OSError):
+                while sock.recv(65536):
+                    pass
+            sock.setblocking(True)
+            sock.settimeout(1.0)
+            sock.sendall(REJECT_RESPONSES[status])
+            sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
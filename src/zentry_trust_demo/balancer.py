@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import openziti
+
+BALANCE_POLICIES = ("least-active", "ewma")
+
+# Weight of each new latency sample in the moving average.
+_EWMA_ALPHA = 0.3
+
+_METRICS = (
+    ("active", "gauge", "Open connections per upstream replica."),
+    ("latency_seconds", "gauge", "Moving average of dial and first-byte latency per replica."),
+    ("ejected", "gauge", "1 while a replica is ejected after failures."),
+    ("dials_total", "counter", "Dials attempted per replica."),
+    ("dial_failures_total", "counter", "Failed dials and health probes per replica."),
+)
+
+
+@dataclass(frozen=True)
+class BalancerConfig:
+    """How the proxy spreads connections over replicas of a service.
+
+    ``least-active`` picks the replica with the fewest open connections;
+    ``ewma`` weighs that by each replica's recent dial and first-byte latency.
+    ``eject_after`` consecutive failed dials or probes take a replica out for
+    ``cooldown`` seconds. A failed dial is retried on up to ``retries`` other
+    replicas. ``probe_interval`` > 0 dials every replica that often in the
+    background.
+    """
+
+    policy: str = "least-active"
+    eject_after: int = 2
+    cooldown: float = 10.0
+    retries: int = 2
+    probe_interval: float = 5.0
+
+    def __post_init__(self) -> None:
+        if self.policy not in BALANCE_POLICIES:
+            raise ValueError(f"unknown balancing policy {self.policy!r} (expected 'least-active' or 'ewma')")
+        if self.eject_after < 1 or self.cooldown < 0 or self.retries < 0 or self.probe_interval < 0:
+            raise ValueError(f"invalid balancer settings: {self}")
+
+
+def replicas(spec: str) -> list[str]:
+    """``"web-a,web-b"`` -> ``["web-a", "web-b"]``: a service name may list interchangeable replicas."""
+    names = list(dict.fromkeys(s.strip() for s in spec.split(",") if s.strip()))
+    if not names:
+        raise ValueError(f"no service named in {spec!r}")
+    return names
+
+
+class Replica:
+    """Load and health of one Ziti service inside an :class:`UpstreamGroup`."""
+
+    __slots__ = ("service", "active", "ewma", "failures", "ejected_until", "dials", "failed")
+
+    def __init__(self, service: str) -> None:
+        self.service = service
+        self.active = 0
+        self.ewma = 0.0  # seconds; 0 until the first sample
+        self.failures = 0  # consecutive
+        self.ejected_until = 0.0
+        self.dials = 0
+        self.failed = 0
+
+    def observe(self, seconds: float) -> None:
+        self.ewma = seconds if not self.ewma else self.ewma + _EWMA_ALPHA * (seconds - self.ewma)
+
+
+class Lease:
+    """A connection dialed through a group; release it when the connection closes."""
+
+    __slots__ = ("group", "replica", "sock", "connected_at", "_released")
+
+    def __init__(self, group: "UpstreamGroup", replica: Replica, sock: socket.socket) -> None:
+        self.group = group
+        self.replica = replica
+        self.sock = sock
+        self.connected_at = time.monotonic()
+        self._released = False
+
+    @property
+    def service(self) -> str:
+        return self.replica.service
+
+    def release(self, first_byte_at: float = 0.0) -> None:
+        """Give the slot back; ``first_byte_at`` (monotonic) feeds the replica's latency average."""
+        if not self._released:
+            self._released = True
+            ttfb = first_byte_at - self.connected_at if first_byte_at else None
+            self.group._released(self.replica, ttfb)
+
+
+class UpstreamGroup:
+    """Replicas of one service: picks one per connection, ejects failing ones, retries dials elsewhere.
+
+    When every replica is ejected the one due back soonest is still tried, so
+    a group never refuses outright just because its replicas all stumbled.
+    """
+
+    def __init__(self, spec: str, config: BalancerConfig, label: str = "proxy") -> None:
+        self.spec = spec
+        self.config = config
+        self.label = label
+        self.replicas = [Replica(name) for name in replicas(spec)]
+        self._lock = threading.Lock()
+
+    def _pick(self, tried: set[str]) -> Replica | None:
+        now = time.monotonic()
+        candidates = [r for r in self.replicas if r.service not in tried]
+        if not candidates:
+            return None
+        healthy = [r for r in candidates if r.ejected_until <= now]
+        if not healthy:
+            return min(candidates, key=lambda r: r.ejected_until)
+        if self.config.policy == "ewma":
+            # Peak-EWMA style: expected latency grows with the work already queued.
+            # A replica without a sample yet is scored at the group's mean, so it
+            # gets its share instead of every connection; with no samples at all
+            # this is least-active.
+            sampled = [r.ewma for r in self.replicas if r.ewma]
+            mean = sum(sampled) / len(sampled) if sampled else 1.0
+            scores = {r.service: (r.ewma or mean) * (r.active + 1) for r in healthy}
+            score = min(scores.values())
+            best = [r for r in healthy if scores[r.service] == score]
+        else:
+            fewest = min(r.active for r in healthy)
+            best = [r for r in healthy if r.active == fewest]
+        return random.choice(best)
+
+    def connect(self, dial: Callable[[str], socket.socket]) -> Lease:
+        """Dial the best replica with ``dial(service)``, moving on to others if it fails.
+
+        Raises the last dial error once ``1 + retries`` replicas have failed.
+        """
+        tried: set[str] = set()
+        last: Exception | None = None
+        for _ in range(min(1 + self.config.retries, len(self.replicas))):
+            with self._lock:
+                replica = self._pick(tried)
+                if replica is None:
+                    break
+                tried.add(replica.service)
+                replica.active += 1
+                replica.dials += 1
+            started = time.monotonic()
+            try:
+                sock = dial(replica.service)
+            except Exception as e:
+                last = e
+                with self._lock:
+                    replica.active -= 1
+                self._failed(replica, e)
+                continue
+            with self._lock:
+                replica.observe(time.monotonic() - started)
+                self._recovered(replica)
+            return Lease(self, replica, sock)
+        assert last is not None
+        raise last
+
+    def _released(self, replica: Replica, ttfb: float | None) -> None:
+        with self._lock:
+            replica.active -= 1
+            if ttfb is not None:
+                replica.observe(ttfb)
+
+    def _failed(self, replica: Replica, error: BaseException | str) -> None:
+        with self._lock:
+            replica.failed += 1
+            replica.failures += 1
+            if replica.failures < self.config.eject_after or len(self.replicas) == 1:
+                return
+            now = time.monotonic()
+            already = replica.ejected_until > now
+            replica.ejected_until = now + self.config.cooldown
+        if already:
+            return  # a failed probe just extends the cooldown
+        print(
+            f"[{self.label}] ejecting replica {replica.service!r} for {self.config.cooldown:g}s "
+            f"after {replica.failures} failure(s): {error}",
+            flush=True,
+        )
+
+    def _recovered(self, replica: Replica) -> None:
+        """A dial or probe succeeded (lock held)."""
+        if replica.ejected_until:
+            print(f"[{self.label}] replica {replica.service!r} is healthy again", flush=True)
+        replica.failures = 0
+        replica.ejected_until = 0.0
+
+    def probe(self, ctx: openziti.ZitiContext) -> None:
+        """Dial (and hang up on) every replica once, ejecting or readmitting it by the outcome."""
+        for replica in self.replicas:
+            try:
+                ctx.connect(replica.service).close()
+            except Exception as e:
+                self._failed(replica, e)
+            else:
+                with self._lock:
+                    self._recovered(replica)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """``(metric, service, value)`` for each replica, for :meth:`Upstreams.render`."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                sample
+                for r in self.replicas
+                for sample in (
+                    ("active", r.service, r.active),
+                    ("latency_seconds", r.service, r.ewma),
+                    ("ejected", r.service, int(r.ejected_until > now)),
+                    ("dials_total", r.service, r.dials),
+                    ("dial_failures_total", r.service, r.failed),
+                )
+            ]
+
+
+class Upstreams:
+    """Every :class:`UpstreamGroup` a proxy forwards to, keyed by service spec."""
+
+    def __init__(self, specs: list[str], config: BalancerConfig, label: str = "proxy") -> None:
+        self.config = config
+        self.groups = {spec: UpstreamGroup(spec, config, label) for spec in specs}
+
+    def __getitem__(self, spec: str) -> UpstreamGroup:
+        return self.groups[spec]
+
+    def get(self, spec: str) -> UpstreamGroup | None:
+        return self.groups.get(spec)
+
+    @property
+    def services(self) -> list[str]:
+        """Every replica of every group, each once."""
+        return list(dict.fromkeys(r.service for g in self.groups.values() for r in g.replicas))
+
+    @property
+    def replicated(self) -> bool:
+        return any(len(g.replicas) > 1 for g in self.groups.values())
+
+    def start_probes(self, ctx: openziti.ZitiContext) -> None:
+        """Health-check replicated groups every ``probe_interval`` seconds on a daemon thread."""
+        if not self.config.probe_interval or not self.replicated:
+            return
+
+        def loop() -> None:
+            while True:
+                time.sleep(self.config.probe_interval)
+                for group in self.groups.values():
+                    if len(group.replicas) > 1:
+                        group.probe(ctx)
+
+        threading.Thread(target=loop, name="ziti-upstream-probe", daemon=True).start()
+
+    def render(self) -> list[str]:
+        """Prometheus lines for the proxy's ``/metrics`` endpoint."""
+        samples = [(group.spec, *sample) for group in self.groups.values() for sample in group.samples()]
+        out = []
+        for metric, kind, help_text in _METRICS:
+            name = f"zentry_proxy_upstream_{metric}"
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for spec, m, service, value in samples:
+                if m == metric:
+                    out.append(f'{name}{{group="{spec}",service="{service}"}} {value:g}')
+        return out
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import functools
+import http.client
+import http.server
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable
+
+from zentry_trust_demo.accept_loop import WorkerLimits
+from zentry_trust_demo.compression import (
+    Codec,
+    CompressedSocket,
+    CompressionConfig,
+    CompressionStats,
+    accept_compression,
+)
+from zentry_trust_demo.loopback import LoopbackContext
+from zentry_trust_demo.traditional import TcpTarget, run_echo_client, serve_echo
+from zentry_trust_demo.ziti_echo import run_ziti_echo_client
+from zentry_trust_demo.ziti_proxy import ProxyBind, serve_ziti_http_proxy
+from zentry_trust_demo.zitify_http import ziti_http_get
+
+CASES = (
+    "tcp-echo",
+    "ziti-echo",
+    "ziti-echo-zlib",
+    "http-direct",
+    "ziti-http-get",
+    "ziti-http-proxy",
+    "ziti-http-proxy-zlib",
+)
+# Cases that talk to the service through compressed framing.
+COMPRESSED_CASES = ("ziti-echo-zlib", "ziti-http-proxy-zlib")
+CONTENTS = ("text", "random")
+
+
+@dataclass(frozen=True)
+class BenchConfig:
+    cases: tuple[str, ...] = CASES
+    concurrency: int = 8
+    duration: float = 3.0
+    payload_sizes: tuple[int, ...] = (64, 4096, 65536)
+    echo_service: str = "bench-echo"
+    http_service: str = "bench-http"
+    proxy_engine: str = "threads"
+    content: str = "text"
+    compression: CompressionConfig = CompressionConfig()
+
+    def __post_init__(self) -> None:
+        unknown = set(self.cases) - set(CASES)
+        if unknown:
+            raise ValueError(f"unknown bench case(s): {', '.join(sorted(unknown))}")
+        if self.content not in CONTENTS:
+            raise ValueError(f"unknown payload content {self.content!r} (expected 'text' or 'random')")
+        if self.concurrency < 1 or self.duration <= 0:
+            raise ValueError("concurrency must be >= 1 and duration > 0")
+
+
+@dataclass
+class BenchResult:
+    case: str
+    payload: int
+    concurrency: int
+    ops: int
+    errors: int
+    seconds: float
+    bytes: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    wire_bytes: int = -1  # what crossed the Ziti leg; -1 = same as ``bytes`` (no compression)
+    rps: float = field(init=False)
+    mbps: float = field(init=False)
+    wire_mbps: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        if self.wire_bytes < 0:
+            self.wire_bytes = self.bytes
+        self.rps = self.ops / self.seconds if self.seconds else 0.0
+        self.mbps = self.bytes / self.seconds / 1e6 if self.seconds else 0.0
+        self.wire_mbps = self.wire_bytes / self.seconds / 1e6 if self.seconds else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def _measure(
+    case: str,
+    payload: int,
+    op: Callable[[], int],
+    concurrency: int,
+    duration: float,
+    stats: CompressionStats | None = None,
+) -> BenchResult:
+    """Call ``op`` from ``concurrency`` threads for ``duration`` seconds.
+
+    With ``stats`` (of the codec ``op`` compresses with), the bytes moved are
+    scaled by the wire/raw ratio seen meanwhile to give ``wire_bytes``.
+    """
+    before = stats.totals() if stats is not None else (0, 0)
+    latencies: list[list[float]] = [[] for _ in range(concurrency)]
+    moved = [0] * concurrency
+    errors = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    def worker(i: int) -> None:
+        lat = latencies[i]
+        while True:
+            start = time.perf_counter()
+            if start >= deadline:
+                return
+            try:
+                moved[i] += op()
+            except Exception:
+                errors[i] += 1
+                time.sleep(0.01)  # don't spin on a dead endpoint
+                continue
+            lat.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    merged = sorted(x for lat in latencies for x in lat)
+    wire_bytes = -1
+    if stats is not None:
+        raw, wire = (now - then for now, then in zip(stats.totals(), before))
+        wire_bytes = round(sum(moved) * wire / raw) if raw else 0
+    return BenchResult(
+        case=case,
+        payload=payload,
+        concurrency=concurrency,
+        ops=len(merged),
+        errors=sum(errors),
+        seconds=elapsed,
+        bytes=sum(moved),
+        p50_ms=_percentile(merged, 50) * 1e3,
+        p95_ms=_percentile(merged, 95) * 1e3,
+        p99_ms=_percentile(merged, 99) * 1e3,
+        wire_bytes=wire_bytes,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def make_payload(size: int, content: str) -> bytes:
+    """``size`` bytes of JSON lines (``text``, what APIs and logs look like) or of noise (``random``)."""
+    if content == "random":
+        return random.Random(size).randbytes(size)
+    rng = random.Random(size)
+    lines = []
+    total = 0
+    while total < size:
+        record = {
+            "id": len(lines),
+            "user": f"user-{rng.randrange(500)}",
+            "status": rng.choice(("active", "idle", "suspended")),
+            "latency_ms": round(rng.random() * 250, 2),
+            "path": rng.choice(("/api/items", "/api/orders", "/healthz")),
+        }
+        line = json.dumps(record).encode() + b"\n"
+        lines.append(line)
+        total += len(line)
+    return b"".join(lines)[:size]
+
+
+class _PayloadHandler(http.server.BaseHTTPRequestHandler):
+    """``GET /<n>`` returns ``n`` bytes of ``content``; stands in for the ghost HTTP server.
+
+    Like a ghost server run with ``--compress``, it accepts compressed framing
+    from clients that offer it.
+    """
+
+    content = "text"
+    codec: Codec | None = None
+
+    def setup(self) -> None:
+        if self.codec is not None and accept_compression(self.request):
+            self.request = CompressedSocket(self.request, self.codec)  # type: ignore[assignment]
+        super().setup()
+
+    def do_GET(self) -> None:  # noqa: N802
+        try:
+            size = int(self.path.strip("/") or 0)
+        except ValueError:
+            size = 0
+        body = make_payload(size, self.content)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt: str, *args) -> None:  # noqa: D401
+        return
+
+
+def _start_thread(target: Callable[..., Any], *args: Any) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def _http_get(host: str, port: int, path: str) -> int:
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request("GET", path, headers={"Connection": "close"})
+        resp = conn.getresponse()
+        body = resp.read()
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}")
+        return len(body)
+    finally:
+        conn.close()
+
+
+def _echo_op(call: Callable[[bytes], bytes], payload: bytes) -> Callable[[], int]:
+    def op() -> int:
+        data = call(payload)
+        if len(data) != len(payload):
+            raise RuntimeError(f"short echo: {len(data)}/{len(payload)} bytes")
+        return len(data)
+
+    return op
+
+
+def _start_proxy(
+    ctx: Any,
+    config: BenchConfig,
+    stop: threading.Event,
+    codec: Codec | None = None,
+) -> tuple[tuple[str, int], threading.Thread]:
+    addr: list[tuple[str, int]] = []
+    ready = threading.Event()
+    thread = _start_thread(
+        lambda: serve_ziti_http_proxy(
+            ctx,
+            config.http_service,
+            ProxyBind("127.0.0.1", 0),
+            engine=config.proxy_engine,
+            on_ready=lambda a: (addr.append(a), ready.set()),
+            codec=codec,
+            stop=stop,
+        )
+    )
+    if not ready.wait(10):
+        stop.set()
+        raise RuntimeError("bench proxy did not start")
+    return addr[0], thread
+
+
+def run_bench(config: BenchConfig, ctx: Any = None) -> list[BenchResult]:
+    """Benchmark each case in ``config`` and return one result per case and payload size.
+
+    Local loopback servers stand in for the public TCP echo and HTTP servers.
+    Without ``ctx`` the Ziti cases also run against them through a
+    :class:`LoopbackContext`, which isolates the client/proxy overhead and
+    works offline; pass a real context to measure the overlay itself.
+
+    The ``-zlib`` cases use compressed framing (so with a real context the
+    services' hosts must run with ``--compress``); their ``wire_bytes`` is
+    what actually crossed the Ziti leg, measured by the client's codec.
+    """
+    # The local servers accept compressed framing like hosts run with --compress.
+    server_codec = Codec(config.compression)
+    client_codec = Codec(config.compression)
+
+    echo_listener = socket.create_server(("127.0.0.1", 0), backlog=1024)
+    echo_addr = echo_listener.getsockname()[:2]
+    limits = WorkerLimits(max_workers=max(128, 2 * config.concurrency))
+    _start_thread(serve_echo, echo_listener, limits, server_codec)
+
+    class Handler(_PayloadHandler):
+        content = config.content
+        codec = server_codec
+
+    http_server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    http_server.daemon_threads = True
+    http_addr = http_server.server_address[:2]
+    _start_thread(http_server.serve_forever)
+
+    if ctx is None:
+        ctx = LoopbackContext({config.echo_service: echo_addr, config.http_service: http_addr})
+
+    def echo_client(codec: Codec | None = None) -> Callable[[bytes], bytes]:
+        return lambda m: run_ziti_echo_client(ctx, config.echo_service, m, codec)
+
+    results: list[BenchResult] = []
+    proxies: dict[str, tuple[str, int]] = {}
+    proxy_threads: list[threading.Thread] = []
+    stop = threading.Event()
+    try:
+        for case, codec in (("ziti-http-proxy", None), ("ziti-http-proxy-zlib", client_codec)):
+            if case in config.cases:
+                proxies[case], thread = _start_proxy(ctx, config, stop, codec)
+                proxy_threads.append(thread)
+        for size in config.payload_sizes:
+            payload = make_payload(size, config.content)
+            ops: dict[str, Callable[[], int]] = {
+                "tcp-echo": _echo_op(lambda m: run_echo_client(TcpTarget(*echo_addr), m), payload),
+                "ziti-echo": _echo_op(echo_client(), payload),
+                "ziti-echo-zlib": _echo_op(echo_client(client_codec), payload),
+                "http-direct": lambda: _http_get(http_addr[0], http_addr[1], f"/{size}"),
+                "ziti-http-get": lambda: len(ziti_http_get(ctx, config.http_service, f"/{size}")),
+            }
+            for case, (host, port) in proxies.items():
+                ops[case] = functools.partial(_http_get, host, port, f"/{size}")
+            for case in config.cases:
+                stats = client_codec.stats if case in COMPRESSED_CASES else None
+                results.append(_measure(case, size, ops[case], config.concurrency, config.duration, stats))
+    finally:
+        stop.set()
+        for thread in proxy_threads:
+            thread.join(10)
+        http_server.shutdown()
+        http_server.server_close()
+        echo_listener.close()
+    return results
+
+
+def format_results(results: list[BenchResult]) -> str:
+    header = (
+        f"{'case':<20} {'payload':>8} {'req/s':>10} {'MB/s':>9} {'wire MB/s':>9} {'wire %':>6} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    last_payload = None
+    for r in results:
+        if last_payload is not None and r.payload != last_payload:
+            lines.append("")
+        last_payload = r.payload
+        wire_pct = 100 * r.wire_bytes / r.bytes if r.bytes else 100.0
+        lines.append(
+            f"{r.case:<20} {r.payload:>8} {r.rps:>10.1f} {r.mbps:>9.2f} {r.wire_mbps:>9.2f} {wire_pct:>6.0f} "
+            f"{r.p50_ms:>8.2f} {r.p95_ms:>8.2f} {r.p99_ms:>8.2f} {r.errors:>7}"
+        )
+    return "\n".join(lines)
@@ -1,22 +1,32 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import json
 import os
-import subprocess
 import sys
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from zentry_trust_demo.common import load_context
-from zentry_trust_demo.zitify_http import HttpBind, run_traditional_http_server, run_zitified_http_server, ziti_http_get
-from zentry_trust_demo.traditional import TcpTarget, run_echo_client, run_echo_server
-from zentry_trust_demo.ziti_echo import run_ziti_echo_client, run_ziti_echo_host
-from zentry_trust_demo.ziti_proxy import ProxyBind, run_ziti_http_proxy
+# Only what the parser itself needs is imported up front. Command handlers
+# import their modules when they run, so commands that never touch Ziti
+# (``--help``, ``traditional-*``) do not load openziti and its native library.
+from zentry_trust_demo.accept_loop import SATURATION_POLICIES, WorkerLimits
+from zentry_trust_demo.relay import DEFAULT_BUFFER_SIZE
+
+if TYPE_CHECKING:
+    from zentry_trust_demo.compression import Codec, CompressionConfig
+    from zentry_trust_demo.tracing import TraceConfig, Tracer
+    from zentry_trust_demo.ziti_http_client import StreamingResponse
+    from zentry_trust_demo.zitify_http import KeepAlive
 
 
 def _add_traditional(sub: argparse._SubParsersAction) -> None:
     srv = sub.add_parser("traditional-server", help="Run a public TCP echo server")
     srv.add_argument("--bind", default="0.0.0.0")
     srv.add_argument("--port", type=int, default=9000)
+    _add_worker_limits(srv)
 
     cli = sub.add_parser("traditional-client", help="Call the public TCP echo server")
     cli.add_argument("--host", default="127.0.0.1")
@@ -24,38 +34,792 @@ def _add_traditional(sub: argparse._SubParsersAction) -> None:
     cli.add_argument("--message", default="hello")
 
 
+def _add_worker_limits(parser: argparse.ArgumentParser) -> None:
+    """Concurrency limits shared by the echo hosts."""
+    defaults = WorkerLimits()
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=defaults.max_workers,
+        help=f"Connections served concurrently (default: {defaults.max_workers})",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=defaults.queue_depth,
+        help=f"Accepted connections that may wait for a worker (default: {defaults.queue_depth})",
+    )
+    parser.add_argument(
+        "--when-saturated",
+        choices=list(SATURATION_POLICIES),
+        default=defaults.policy,
+        help="reject: close new connections at once; backoff: pause accepting until a worker frees up",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=defaults.idle_timeout,
+        help=f"Close a connection idle for this many seconds (default: {defaults.idle_timeout:g}, 0 = never)",
+    )
+
+
+def _worker_limits(args: argparse.Namespace) -> WorkerLimits:
+    return WorkerLimits(
+        max_workers=args.max_workers,
+        queue_depth=args.queue_depth,
+        policy=args.when_saturated,
+        idle_timeout=args.idle_timeout,
+    )
+
+
+def _add_compression(parser: argparse.ArgumentParser, host: bool) -> None:
+    """Opt-in compressed framing; hosts accept it, clients (and the proxy) ask for it."""
+    if host:
+        help_text = "Accept compressed framing from zentry clients that ask for it (raw clients still work)"
+    else:
+        help_text = "Compress traffic to the service with zlib framing (its host must run with --compress)"
+    parser.add_argument("--compress", action="store_true", help=help_text)
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        choices=range(1, 10),
+        default=1,
+        metavar="1-9",
+        help="zlib level with --compress (default: 1, fastest)",
+    )
+    parser.add_argument(
+        "--compress-min-size",
+        type=int,
+        default=256,
+        help="With --compress, send writes smaller than this many bytes uncompressed (default: 256)",
+    )
+
+
+def _compression(args: argparse.Namespace) -> CompressionConfig | None:
+    if not args.compress:
+        return None
+    from zentry_trust_demo.compression import CompressionConfig
+
+    return CompressionConfig(level=args.compress_level, min_size=args.compress_min_size)
+
+
+def _codec(args: argparse.Namespace) -> Codec | None:
+    """What a client command compresses with, if ``--compress`` was given."""
+    compression = _compression(args)
+    if compression is None:
+        return None
+    from zentry_trust_demo.compression import Codec
+
+    return Codec(compression)
+
+
+def _add_tracing(parser: argparse.ArgumentParser) -> None:
+    """Opt-in per-connection timelines, written as JSON lines."""
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Append a JSON timeline per Ziti connection (dial, first bytes, close, bytes) to FILE ('-' = stderr)",
+    )
+    parser.add_argument(
+        "--trace-sample",
+        type=float,
+        default=1.0,
+        metavar="RATE",
+        help="With --trace, the fraction of connections traced (default: 1, all)",
+    )
+
+
+def _trace(args: argparse.Namespace) -> TraceConfig | None:
+    if not args.trace:
+        return None
+    from zentry_trust_demo.tracing import TraceConfig
+
+    return TraceConfig(args.trace, args.trace_sample)
+
+
+def _tracer(args: argparse.Namespace, label: str) -> Tracer | None:
+    """What a client command traces its connections with, if ``--trace`` was given."""
+    trace = _trace(args)
+    if trace is None:
+        return None
+    from zentry_trust_demo.tracing import Tracer
+
+    return Tracer(trace, label)
+
+
+def _profile_env_ok(label: str) -> bool:
+    """Report unusable ``ZENTRY_PROFILE*`` settings once, before any worker trips over them."""
+    from zentry_trust_demo.tracing import profile_settings
+
+    try:
+        profile_settings(os.environ)
+    except ValueError as e:
+        print(f"[{label}] {e}", file=sys.stderr)
+        return False
+    return True
+
+
 def _add_ziti(sub: argparse._SubParsersAction) -> None:
     host = sub.add_parser("ziti-host", help="Host an echo service over OpenZiti")
     host.add_argument("--identity", required=True, help="Path to enrolled identity JSON (e.g. ZentrySentinel.json)")
     host.add_argument("--service", required=True, help="Ziti service name (must exist on controller)")
+    _add_worker_limits(host)
+    _add_compression(host, host=True)
 
     cli = sub.add_parser("ziti-client", help="Call the echo service over OpenZiti")
     cli.add_argument("--identity", required=True, help="Path to enrolled identity JSON (e.g. ZentryClient.json)")
     cli.add_argument("--service", required=True, help="Ziti service name (must exist on controller)")
     cli.add_argument("--message", default="hello")
+    _add_compression(cli, host=False)
+
+
+def _add_keep_alive(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--keepalive-requests",
+        type=int,
+        default=100,
+        help="Requests served per connection before closing it (default: 100; 0 = no limit, 1 = no keep-alive)",
+    )
+    parser.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        default=5.0,
+        help="Seconds an idle keep-alive connection stays open (default: 5; 0 = no limit)",
+    )
+
+
+def _keep_alive(args: argparse.Namespace) -> KeepAlive:
+    from zentry_trust_demo.zitify_http import KeepAlive
+
+    return KeepAlive(max_requests=args.keepalive_requests, idle_timeout=args.keepalive_timeout)
 
 
 def _add_http(sub: argparse._SubParsersAction) -> None:
     srv = sub.add_parser("traditional-http-server", help="Run a public HTTP server")
     srv.add_argument("--bind", default="0.0.0.0")
     srv.add_argument("--port", type=int, default=8080)
+    _add_keep_alive(srv)
 
     ghost = sub.add_parser("zitify-http-server", help="Run an HTTP server bound to a Ziti service (monkeypatch)")
     ghost.add_argument("--identity", required=True, help="Path to enrolled identity JSON (e.g. ZentrySentinel.json)")
     ghost.add_argument("--service", required=True, help="Ziti service name (must exist on controller)")
     ghost.add_argument("--bind", default="127.0.0.1")
     ghost.add_argument("--port", type=int, default=8080)
+    ghost.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Server processes sharing the Ziti service (default: 1; SIGHUP restarts them gracefully)",
+    )
+    _add_keep_alive(ghost)
+    ghost.add_argument("--root", help="Serve the files in this directory instead of the welcome page")
+    ghost.add_argument(
+        "--max-age",
+        type=int,
+        default=0,
+        help="With --root: Cache-Control max-age in seconds (default: 0, clients revalidate with ETag)",
+    )
+    ghost.add_argument(
+        "--file-cache-size",
+        type=int,
+        default=32,
+        help="With --root: MiB of small files kept in memory (default: 32)",
+    )
+    ghost.add_argument(
+        "--file-cache-max",
+        type=int,
+        default=256,
+        help="With --root: largest file kept in memory, in KiB; larger ones use sendfile (default: 256)",
+    )
+    _add_compression(ghost, host=True)
 
     cli = sub.add_parser("ziti-http-get", help="Send a basic HTTP GET over a Ziti service")
     cli.add_argument("--identity", required=True, help="Path to enrolled identity JSON (e.g. ZentryClient.json)")
     cli.add_argument("--service", required=True, help="Ziti service name (must exist on controller)")
     cli.add_argument("--path", default="/")
+    cli.add_argument("--count", type=int, default=1, help="Number of GETs to send (default: 1)")
+    cli.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Parallel keep-alive connections used with --count (default: 1)",
+    )
+    cli.add_argument(
+        "--pipeline",
+        type=int,
+        default=1,
+        help="Requests sent back-to-back per connection round trip (default: 1)",
+    )
+    cli.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Seconds to wait for the server at each step before failing (default: 10, 0 = forever)",
+    )
+    _add_compression(cli, host=False)
+    _add_tracing(cli)
+    _add_output_options(cli)
 
     proxy = sub.add_parser("ziti-http-proxy", help="Expose a local port that forwards HTTP over a Ziti service")
     proxy.add_argument("--identity", required=True, help="Path to enrolled identity JSON (e.g. ZentryClient.json)")
     proxy.add_argument("--service", default="ZentryWeb", help="Ziti service name (default: ZentryWeb)")
     proxy.add_argument("--bind", default="127.0.0.1")
     proxy.add_argument("--port", type=int, default=8080)
+    _add_proxy_tuning(proxy)
+
+
+def _add_output_options(parser: argparse.ArgumentParser) -> None:
+    """Where a single streamed GET response goes."""
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Write the response body to this file instead of headers+body to stdout",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Report bytes received and transfer rate on stderr while downloading",
+    )
+
+
+def _add_proxy_tuning(parser: argparse.ArgumentParser) -> None:
+    """Performance options shared by every command that runs the HTTP proxy."""
+    parser.add_argument(
+        "--pool-min",
+        type=int,
+        default=0,
+        help="Pre-dialed Ziti connections to keep warm (default: 0, pooling disabled)",
+    )
+    parser.add_argument("--pool-max", type=int, default=8, help="Upper bound on warm connections during bursts")
+    parser.add_argument("--pool-idle-ttl", type=float, default=60.0, help="Seconds a spare connection may sit unused")
+    parser.add_argument("--pool-health-interval", type=float, default=5.0, help="Seconds between spare health checks")
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "async"],
+        default="threads",
+        help="threads: one thread per connection; async: multiplex connections on event loops",
+    )
+    parser.add_argument(
+        "--loops",
+        type=int,
+        default=1,
+        help="Event loops for --engine async (0 = one per CPU core)",
+    )
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE,
+        help=f"Bytes moved per read when forwarding (default: {DEFAULT_BUFFER_SIZE})",
+    )
+    parser.add_argument(
+        "--forwarding",
+        choices=["buffered", "splice"],
+        default="buffered",
+        help="buffered: reusable user-space buffer; splice: zero-copy os.splice on Linux",
+    )
+    parser.add_argument(
+        "--stats-port",
+        type=int,
+        help="Serve Prometheus metrics at http://<stats-bind>:<port>/metrics (default: off)",
+    )
+    parser.add_argument("--stats-bind", default="127.0.0.1", help="Address for --stats-port (default: 127.0.0.1)")
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=0.0,
+        help="Print a metrics summary every N seconds (default: 0, off)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["tcp", "l7"],
+        default="tcp",
+        help="tcp: relay bytes per connection; l7: parse HTTP, reuse Ziti connections, optionally cache",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=0,
+        help="MiB of responses to cache in --mode l7 (default: 0, caching disabled)",
+    )
+    parser.add_argument(
+        "--cache-max-entry",
+        type=int,
+        default=8,
+        help="Largest response to cache, in MiB (default: 8)",
+    )
+    parser.add_argument(
+        "--route",
+        action="append",
+        default=[],
+        metavar="KIND:MATCH=SERVICE",
+        help="Route by host:NAME, path:/PREFIX or sni:NAME to another Ziti service (repeatable; "
+        "unmatched traffic goes to --service), e.g. --route host:grafana.local=Grafana",
+    )
+    parser.add_argument(
+        "--max-dials",
+        type=int,
+        default=0,
+        help="Ziti dials allowed in flight at once; extra connections queue (default: 0, unlimited)",
+    )
+    parser.add_argument(
+        "--max-dials-per-client",
+        type=int,
+        default=0,
+        help="In-flight dials allowed per client IP (default: 0, unlimited)",
+    )
+    parser.add_argument(
+        "--dial-queue",
+        type=int,
+        default=256,
+        help="Connections that may wait for a dial slot before new ones get a 503 (default: 256)",
+    )
+    parser.add_argument(
+        "--dial-queue-timeout",
+        type=float,
+        default=5.0,
+        help="Seconds a connection may wait for a dial slot before it gets a 503 (default: 5)",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=10.0,
+        help="Seconds from accept until the Ziti connection must be up (default: 10, 0 = off)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=30.0,
+        help="Close connections with no traffic for this many seconds (default: 30, 0 = never; "
+        "raise it for SSE or WebSockets)",
+    )
+    parser.add_argument(
+        "--max-lifetime",
+        type=float,
+        default=0.0,
+        help="Close connections after this many seconds regardless of traffic (default: 0, off)",
+    )
+    parser.add_argument(
+        "--balance",
+        choices=["least-active", "ewma"],
+        default="least-active",
+        help="How to pick among replicas when --service or a --route target lists several, e.g. "
+        "--service web-a,web-b (default: least-active)",
+    )
+    parser.add_argument(
+        "--dial-retries",
+        type=int,
+        default=2,
+        help="Other replicas to try when a dial fails, before the client gets a 502 (default: 2)",
+    )
+    parser.add_argument(
+        "--eject-after",
+        type=int,
+        default=2,
+        help="Consecutive failed dials or health probes that take a replica out of rotation (default: 2)",
+    )
+    parser.add_argument(
+        "--eject-cooldown",
+        type=float,
+        default=10.0,
+        help="Seconds an ejected replica stays out of rotation (default: 10)",
+    )
+    parser.add_argument(
+        "--health-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between health-probe dials to each replica (default: 5, 0 = off)",
+    )
+    _add_compression(parser, host=False)
+    _add_tracing(parser)
+
+
+def _run_proxy(args: argparse.Namespace) -> int:
+    from zentry_trust_demo.admission import AdmissionConfig
+    from zentry_trust_demo.balancer import BalancerConfig
+    from zentry_trust_demo.deadlines import Timeouts
+    from zentry_trust_demo.metrics import StatsConfig
+    from zentry_trust_demo.routing import parse_route
+    from zentry_trust_demo.ziti_pool import PoolConfig
+    from zentry_trust_demo.ziti_proxy import ProxyBind, run_ziti_http_proxy
+
+    try:
+        routes = [parse_route(spec) for spec in args.route]
+        admission = AdmissionConfig(
+            max_dials=args.max_dials,
+            per_client=args.max_dials_per_client,
+            queue_size=args.dial_queue,
+            queue_timeout=args.dial_queue_timeout,
+        )
+        timeouts = Timeouts(connect=args.connect_timeout, idle=args.idle_timeout, lifetime=args.max_lifetime)
+        balancer = BalancerConfig(
+            policy=args.balance,
+            eject_after=args.eject_after,
+            cooldown=args.eject_cooldown,
+            retries=args.dial_retries,
+            probe_interval=args.health_interval,
+        )
+        compression = _compression(args)
+        trace = _trace(args)
+        pool = None
+        if args.pool_min > 0:
+            pool = PoolConfig(
+                min_size=args.pool_min,
+                max_size=max(args.pool_max, args.pool_min),
+                idle_ttl=args.pool_idle_ttl,
+                health_interval=args.pool_health_interval,
+            )
+    except ValueError as e:
+        print(f"[proxy] {e}", file=sys.stderr)
+        return 2
+    try:
+        # Raises ValueError before serving if the trace file or ZENTRY_PROFILE* settings are unusable.
+        run_ziti_http_proxy(
+            args.identity,
+            args.service,
+            ProxyBind(args.bind, args.port),
+            pool=pool,
+            engine=args.engine,
+            loops=args.loops,
+            buffer_size=args.buffer_size,
+            forwarding=args.forwarding,
+            stats=StatsConfig(args.stats_port, args.stats_bind, args.stats_interval),
+            mode=args.mode,
+            cache_bytes=args.cache_size * 2**20,
+            cache_max_entry=args.cache_max_entry * 2**20,
+            routes=routes or None,
+            admission=admission if admission.enabled else None,
+            timeouts=timeouts,
+            balancer=balancer,
+            compression=compression,
+            trace=trace,
+        )
+    except ValueError as e:
+        print(f"[proxy] {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def _add_bench(sub: argparse._SubParsersAction) -> None:
+    bench = sub.add_parser("bench", help="Benchmark traditional vs Ziti access paths side by side")
+    bench.add_argument(
+        "--cases",
+        default="",
+        help="Comma-separated cases to run: tcp-echo, ziti-echo, ziti-echo-zlib, http-direct, ziti-http-get, "
+        "ziti-http-proxy, ziti-http-proxy-zlib (default: all)",
+    )
+    bench.add_argument("--concurrency", type=int, default=8, help="Parallel clients per case (default: 8)")
+    bench.add_argument("--duration", type=float, default=3.0, help="Seconds per case and payload size (default: 3)")
+    bench.add_argument(
+        "--payload-sizes",
+        default="64,4096,65536",
+        help="Comma-separated payload sizes in bytes (default: 64,4096,65536)",
+    )
+    bench.add_argument(
+        "--identity",
+        help="Enrolled identity JSON for the Ziti cases (default: offline loopback stand-in)",
+    )
+    bench.add_argument("--echo-service", default="bench-echo", help="Ziti echo service (with --identity)")
+    bench.add_argument("--http-service", default="bench-http", help="Ziti HTTP service (with --identity)")
+    bench.add_argument("--proxy-engine", choices=["threads", "async"], default="threads")
+    bench.add_argument(
+        "--content",
+        choices=["text", "random"],
+        default="text",
+        help="Payload bytes: text (JSON lines, compresses well) or random (incompressible) (default: text)",
+    )
+    bench.add_argument(
+        "--compress-level",
+        type=int,
+        choices=range(1, 10),
+        default=1,
+        metavar="1-9",
+        help="zlib level for the -zlib cases (default: 1)",
+    )
+    bench.add_argument("--json", action="store_true", help="Print results as JSON")
+
+
+def _bench(args: argparse.Namespace) -> int:
+    from zentry_trust_demo.bench import CASES, BenchConfig, format_results, run_bench
+    from zentry_trust_demo.common import load_context
+    from zentry_trust_demo.compression import CompressionConfig
+
+    config = BenchConfig(
+        cases=tuple(c.strip() for c in args.cases.split(",") if c.strip()) or CASES,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        payload_sizes=tuple(int(n) for n in args.payload_sizes.split(",") if n.strip()),
+        echo_service=args.echo_service,
+        http_service=args.http_service,
+        proxy_engine=args.proxy_engine,
+        content=args.content,
+        compression=CompressionConfig(level=args.compress_level),
+    )
+    ctx = load_context(args.identity) if args.identity else None
+    # Servers started by the bench print status lines; keep stdout for results.
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_bench(config, ctx)
+    if args.json:
+        print(json.dumps([r.to_dict() for r in results], indent=2))
+    else:
+        print(format_results(results))
+    return 0
+
+
+def _add_soak(sub: argparse._SubParsersAction) -> None:
+    soak = sub.add_parser(
+        "soak",
+        help="Run the proxy, echo host and ghost server under connection churn and fail on resource leaks",
+    )
+    soak.add_argument("--duration", type=float, default=3600.0, help="Seconds to run (default: 3600)")
+    soak.add_argument("--interval", type=float, default=60.0, help="Seconds between samples (default: 60)")
+    soak.add_argument(
+        "--warmup",
+        type=float,
+        default=300.0,
+        help="Seconds of samples to ignore while pools and caches fill (default: 300)",
+    )
+    soak.add_argument("--concurrency", type=int, default=8, help="Parallel churning clients (default: 8)")
+    soak.add_argument("--engine", choices=["threads", "async"], default="threads", help="Proxy engine")
+    soak.add_argument("--mode", choices=["tcp", "l7"], default="tcp", help="Proxy mode (l7 needs threads)")
+    soak.add_argument(
+        "--settle",
+        type=float,
+        default=10.0,
+        help="Seconds to let connections drain before each sample (default: 10)",
+    )
+    soak.add_argument("--top", type=int, default=10, help="Allocation sites to list in the report (default: 10)")
+    soak.add_argument("--max-fd-growth", type=float, default=5.0, help="Open fds per hour (default: 5)")
+    soak.add_argument("--max-thread-growth", type=float, default=2.0, help="Threads per hour (default: 2)")
+    soak.add_argument("--max-rss-growth", type=float, default=64.0, help="RSS MiB per hour (default: 64)")
+    soak.add_argument("--max-heap-growth", type=float, default=16.0, help="Traced heap MiB per hour (default: 16)")
+    _add_compression(soak, host=False)
+
+
+def _soak(args: argparse.Namespace) -> int:
+    from zentry_trust_demo.soak import SoakConfig, SoakLimits, format_report, run_soak
+
+    config = SoakConfig(
+        duration=args.duration,
+        interval=args.interval,
+        warmup=args.warmup,
+        concurrency=args.concurrency,
+        engine=args.engine,
+        mode=args.mode,
+        compression=_compression(args),
+        settle=args.settle,
+        top=args.top,
+        limits=SoakLimits(
+            fds=args.max_fd_growth,
+            threads=args.max_thread_growth,
+            rss=args.max_rss_growth,
+            heap=args.max_heap_growth,
+        ),
+    )
+    report = run_soak(config)
+    print(format_report(report))
+    return 1 if report.failed else 0
+
+
+class _Progress:
+    """Throttled one-line download progress on stderr."""
+
+    def __init__(self, label: str, total: int | None, interval: float = 0.25) -> None:
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.received = 0
+        self._started = self._last = time.monotonic()
+
+    def update(self, n: int) -> None:
+        self.received += n
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._print(now, end="\r")
+
+    def finish(self) -> None:
+        self._print(time.monotonic(), end="\n")
+
+    def _print(self, now: float, end: str) -> None:
+        mib = self.received / 2**20
+        rate = mib / max(now - self._started, 1e-6)
+        done = f"{mib:.1f} MiB"
+        if self.total:
+            done += f" / {self.total / 2**20:.1f} MiB ({100 * self.received // self.total}%)"
+        print(f"[{self.label}] {done} at {rate:.1f} MiB/s", end=end, file=sys.stderr, flush=True)
+
+
+def _write_streamed(resp: StreamingResponse, output: str | None, progress: bool, label: str) -> int:
+    """Copy ``resp`` to stdout (headers and body) or its body to ``output``, chunk by chunk.
+
+    The client de-chunks bodies, so on stdout a chunked body is framed again
+    to match the head it follows.
+    """
+    from zentry_trust_demo.http1 import encode_chunk
+
+    meter = _Progress(label, resp.content_length) if progress else None
+    rechunk = not output and resp.head.chunked and resp.head.has_body
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(resp)
+        if output:
+            out = stack.enter_context(open(output, "wb"))
+        else:
+            out = sys.stdout.buffer
+            out.write(resp.head.raw)
+        for chunk in resp:
+            out.write(encode_chunk(chunk) if rechunk else chunk)
+            if meter:
+                meter.update(len(chunk))
+        if rechunk:
+            out.write(encode_chunk(b""))
+        out.flush()
+    if meter:
+        meter.finish()
+    if output:
+        print(f"[{label}] HTTP {resp.status} {resp.head.reason} -> {output}", file=sys.stderr)
+    return 0
+
+
+def _ziti_http_get_many(ctx: object, args: argparse.Namespace, tracer: Tracer | None = None) -> int:
+    from zentry_trust_demo.ziti_http_client import ZitiHttpClient, fetch_many
+
+    if min(args.count, args.concurrency, args.pipeline) < 1:
+        print("ERROR: --count, --concurrency and --pipeline must be >= 1", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+    client = ZitiHttpClient(
+        ctx,  # type: ignore[arg-type]
+        timeout=args.timeout or None,
+        codec=_codec(args),
+        tracer=tracer,
+    )
+    with client:
+        results = fetch_many(client, args.service, args.path, args.count, args.concurrency, args.pipeline)
+        dials = client.dials
+    elapsed = time.perf_counter() - started
+
+    statuses: dict[str, int] = {}
+    for r in results:
+        key = type(r).__name__ if isinstance(r, Exception) else str(r.status)
+        statuses[key] = statuses.get(key, 0) + 1
+    summary = ", ".join(f"{k}: {v}" for k, v in sorted(statuses.items()))
+    print(
+        f"[ziti-http-get] {len(results)} requests in {elapsed:.2f}s "
+        f"({len(results) / elapsed:.1f} req/s) over {dials} Ziti connection(s) -> {summary}"
+    )
+    failed = sum(1 for r in results if isinstance(r, Exception) or r.status >= 400)
+    return 1 if failed else 0
+
+
+def _add_controller(sub: argparse._SubParsersAction) -> None:
+    ctrl = sub.add_parser(
+        "controller",
+        help="Manage the Ziti controller over its REST API (identities, services, policies)",
+    )
+    ctrl.add_argument(
+        "--controller",
+        default=os.environ.get("ZITI_CTRL", "https://localhost:1280"),
+        help="Edge management API base URL (default: $ZITI_CTRL or https://localhost:1280)",
+    )
+    ctrl.add_argument("--user", default=os.environ.get("ZITI_USER", "admin"), help="Admin user (default: $ZITI_USER)")
+    ctrl.add_argument("--password", default=None, help="Admin password (default: $ZITI_PWD)")
+    ctrl.add_argument("--ca-file", default=os.environ.get("ZITI_CA_FILE"), help="Verify the controller against this CA")
+    ctrl.add_argument(
+        "--insecure",
+        action="store_true",
+        default=os.environ.get("ZITI_INSECURE") == "1",
+        help="Do not verify the controller's certificate, e.g. the quickstart's self-signed one "
+        "(default: on if $ZITI_INSECURE=1)",
+    )
+    ctrl_sub = ctrl.add_subparsers(dest="action", required=True)
+    ctrl_sub.add_parser("login", help="Log in and cache the session token for later commands")
+    ctrl_sub.add_parser("version", help="Show the controller version")
+    ls = ctrl_sub.add_parser("list", help="List entities of one kind")
+    ls.add_argument(
+        "kind",
+        choices=["identities", "services", "service-policies", "edge-router-policies", "service-edge-router-policies"],
+    )
+    ls.add_argument("--filter", help="Controller filter expression, e.g. 'name contains \"Zentry\"'")
+    ls.add_argument("--json", action="store_true", help="Print the entities as JSON")
+    prov = ctrl_sub.add_parser(
+        "provision",
+        help="Create the lab identities, service and policies, and enroll the identities",
+    )
+    prov.add_argument("--service", default="ZentryWeb", help="Service name (default: ZentryWeb)")
+    prov.add_argument("--sentinel", default="ZentrySentinel", help="Hosting identity (default: ZentrySentinel)")
+    prov.add_argument("--client", default="ZentryClient", help="Dialing identity (default: ZentryClient)")
+    prov.add_argument("--out-dir", default=".", help="Where to write <name>.jwt / <name>.json (default: .)")
+    prov.add_argument("--no-enroll", action="store_true", help="Only write enrollment tokens (<name>.jwt)")
+    prov.add_argument("--recreate", action="store_true", help="Delete existing identities and issue new tokens")
+    advise = ctrl_sub.add_parser("advise", help="Check that identities may dial/bind a service (policy advisor)")
+    advise.add_argument("--service", default="ZentryWeb", help="Service name (default: ZentryWeb)")
+    advise.add_argument(
+        "--identities",
+        default="ZentrySentinel,ZentryClient",
+        help="Comma-separated identity names (default: ZentrySentinel,ZentryClient)",
+    )
+
+
+def _controller(args: argparse.Namespace) -> int:
+    from zentry_trust_demo.controller import (
+        ControllerConfig,
+        ControllerError,
+        ManagementClient,
+        default_token_cache,
+        format_advice,
+        provision_lab,
+    )
+
+    config = ControllerConfig(
+        url=args.controller.rstrip("/"),
+        username=args.user,
+        password=args.password if args.password is not None else os.environ.get("ZITI_PWD", ""),
+        insecure=args.insecure,
+        ca_file=args.ca_file or None,
+    )
+    started = time.monotonic()
+    with ManagementClient(config, default_token_cache()) as api:
+        try:
+            if args.action == "login":
+                api.login()
+                print(f"[controller] logged in to {config.url} as {config.username}; session cached")
+            elif args.action == "version":
+                print(json.dumps(api.version(), indent=2))
+            elif args.action == "list":
+                entities = api.list(args.kind, args.filter)
+                if args.json:
+                    print(json.dumps(entities, indent=2))
+                else:
+                    for e in entities:
+                        print(f"{e.get('id', '')}  {e.get('name', '')}")
+            elif args.action == "provision":
+                provision_lab(
+                    api,
+                    args.service,
+                    args.sentinel,
+                    args.client,
+                    Path(args.out_dir),
+                    enroll_identities=not args.no_enroll,
+                    recreate=args.recreate,
+                )
+                print(f"[controller] done in {time.monotonic() - started:.2f}s ({api.requests} API requests)")
+            elif args.action == "advise":
+                names = [n.strip() for n in args.identities.split(",") if n.strip()]
+                ids = api.ids("identities", names)
+                service_id = api.ids("services", [args.service]).get(args.service)
+                if service_id is None:
+                    print(f"ERROR: no service named {args.service!r}", file=sys.stderr)
+                    return 1
+                missing = [n for n in names if n not in ids]
+                if missing:
+                    print(f"ERROR: no identity named {', '.join(missing)}", file=sys.stderr)
+                    return 1
+                for name in names:
+                    print(format_advice(name, args.service, api.policy_advice(ids[name], service_id)))
+        except ControllerError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 1
+    return 0
 
 
 def _add_demo(sub: argparse._SubParsersAction) -> None:
@@ -78,6 +842,7 @@ def _add_demo(sub: argparse._SubParsersAction) -> None:
         default="ZentryWeb",
         help="Ziti service name to use for the demo (default: ZentryWeb)",
     )
+    _add_output_options(connect)
 
 
 def _add_shortcuts(sub: argparse._SubParsersAction) -> None:
@@ -103,6 +868,7 @@ def _add_shortcuts(sub: argparse._SubParsersAction) -> None:
             default="ZentryWeb",
             help="Ziti service name to use for the demo (default: ZentryWeb)",
         )
+        _add_output_options(connect)
 
     # 'http' and ultra-short 'h'
     for cmd in ["http", "h"]:
@@ -119,22 +885,24 @@ def _add_shortcuts(sub: argparse._SubParsersAction) -> None:
             default="ZentryClient.json",
             help="Path to enrolled client identity JSON (default: ZentryClient.json)",
         )
+        _add_proxy_tuning(http)
 
     # 'proxy' and ultra-short 'p'
     for cmd in ["proxy", "p"]:
         proxy = sub.add_parser(cmd, help="Alias for 'http' (opens a local Ziti tunnel)")
         proxy.add_argument("--bind", default="127.0.0.1")
         proxy.add_argument("--port", type=int, default=8080)
-    proxy.add_argument(
-        "--service",
-        default="ZentryWeb",
-        help="Ziti service name to use for the demo (default: ZentryWeb)",
-    )
-    proxy.add_argument(
-        "--identity",
-        default="ZentryClient.json",
-        help="Path to enrolled client identity JSON (default: ZentryClient.json)",
-    )
+        proxy.add_argument(
+            "--service",
+            default="ZentryWeb",
+            help="Ziti service name to use for the demo (default: ZentryWeb)",
+        )
+        proxy.add_argument(
+            "--identity",
+            default="ZentryClient.json",
+            help="Path to enrolled client identity JSON (default: ZentryClient.json)",
+        )
+        _add_proxy_tuning(proxy)
 
 
 def _project_root() -> Path:
@@ -142,108 +910,35 @@ def _project_root() -> Path:
     return Path(__file__).resolve().parents[2]
 
 
-def _run_step(desc: str, cmd: list[str], cwd: Path, env: dict[str, str] | None = None) -> None:
-    print(f"[demo] {desc} -> {' '.join(cmd)}")
-    result = subprocess.run(cmd, cwd=str(cwd), env=env)
-    if result.returncode != 0:
-        print(f"[demo] FAILED: {desc} (exit code {result.returncode})", file=sys.stderr)
-        raise SystemExit(result.returncode)
-
-
 def _demo_up(service: str) -> int:
+    from zentry_trust_demo.demo import STATE_FILE, Lab, bring_up
+    from zentry_trust_demo.orchestrator import StepFailed
+
     root = _project_root()
     compose = root / "zentry-trust" / "compose.yml"
-    scripts_dir = root / "scripts"
     env = os.environ.copy()
     # Use sensible lab defaults so users don't have to export env vars.
     env.setdefault("ZITI_PWD", "admin")
-    # For the self-contained demo we always start from a clean quickstart volume.
-    env.setdefault("ZITI_RESET", "1")
+    # Start from a clean quickstart volume unless this checkout already set one
+    # up; then enrolled identities are reused (ZITI_RESET=1 forces a fresh lab).
+    env.setdefault("ZITI_RESET", "0" if (root / STATE_FILE).is_file() else "1")
     env.setdefault("ZITI_COMPOSE_FILE", str(compose))
+    # The local quickstart controller's certificate is self-signed.
+    env.setdefault("ZITI_INSECURE", "1")
 
-    # 1) Ensure quickstart is up and identities exist
-    step2 = scripts_dir / "ziti_step2_identities_quickstart.sh"
-    if not step2.is_file():
-        print(f"ERROR: missing script: {step2}", file=sys.stderr)
-        return 1
-
-    _run_step("creating Sentinel/Client identities (and starting quickstart)", ["bash", str(step2)], cwd=root, env=env)
-
-    # 2) Enroll identities on this machine for the demo
-    enroll = scripts_dir / "ziti_step2_enroll_quickstart.sh"
-    if not enroll.is_file():
-        print(f"ERROR: missing script: {enroll}", file=sys.stderr)
+    lab = Lab(root=root, service=service, env=env)
+    try:
+        report = bring_up(lab)
+    except StepFailed as e:
+        print(f"[demo] FAILED: {e.step}: {e.__cause__}", file=sys.stderr)
+        if e.report is not None:
+            print(e.report.format(), file=sys.stderr)
         return 1
 
-    _run_step(
-        "enrolling Sentinel identity",
-        ["bash", str(enroll), "ZentrySentinel.jwt", "ZentrySentinel.json"],
-        cwd=root,
-        env=env,
-    )
-    _run_step(
-        "enrolling Client identity",
-        ["bash", str(enroll), "ZentryClient.jwt", "ZentryClient.json"],
-        cwd=root,
-        env=env,
-    )
-
-    # 3) Create the demo service and policies
-    step3 = scripts_dir / "ziti_step3_service_policies.sh"
-    if not step3.is_file():
-        print(f"ERROR: missing script: {step3}", file=sys.stderr)
-        return 1
-    print(f"[demo] creating {service} service + policies -> bash {step3}")
-    result = subprocess.run(["bash", str(step3)], cwd=str(root), env=env)
-    if result.returncode != 0:
-        print(f"[demo] FAILED: creating {service} service + policies (exit code {result.returncode})", file=sys.stderr)
-        return result.returncode
-
-    # 4) Start the Sentinel HTTP server bound to the Ziti service
-    print("[demo] starting Sentinel HTTP server via zitify-http-server ...")
-    sentinel_proc = subprocess.Popen(
-        [
-            sys.executable,
-            "-m",
-            "zentry_trust_demo.cli",
-            "zitify-http-server",
-            "--identity",
-            "ZentrySentinel.json",
-            "--service",
-            service,
-        ],
-        cwd=str(root),
-    )
-    print(f"[demo] Sentinel HTTP server running in background (PID {sentinel_proc.pid}).")
-
-    # 5) Quick policy-advisor check for the service
-    print("[demo] checking policy-advisor status for services ...")
-    pa = subprocess.run(
-        [
-            "docker",
-            "compose",
-            "-f",
-            str(compose),
-            "exec",
-            "-T",
-            "quickstart",
-            "ziti",
-            "edge",
-            "policy-advisor",
-            "services",
-            "-q",
-        ],
-        cwd=str(root),
-        capture_output=True,
-        text=True,
-    )
-    if pa.returncode == 0:
-        print(pa.stdout.strip())
-    else:
-        print("[demo] WARNING: policy-advisor failed; check your controller logs.", file=sys.stderr)
-        if pa.stderr:
-            print(pa.stderr.strip(), file=sys.stderr)
-
+    print(f"[demo] Sentinel HTTP server running in background (PID {lab.sentinel_pid}).")
+    print()
+    print("[demo] step timings:")
+    print(report.format())
     print()
     print("="*60)
     print("✓ Zentry-Trust is LIVE")
@@ -262,7 +957,10 @@ def _demo_up(service: str) -> int:
     return 0
 
 
-def _demo_connect(service: str) -> int:
+def _demo_connect(args: argparse.Namespace) -> int:
+    from zentry_trust_demo.common import load_context
+    from zentry_trust_demo.ziti_http_client import ZitiHttpClient
+
     root = _project_root()
     client_identity = root / "ZentryClient.json"
     if not client_identity.is_file():
@@ -274,9 +972,8 @@ def _demo_connect(service: str) -> int:
         return 1
 
     ctx = load_context(str(client_identity))
-    data = ziti_http_get(ctx, service, "/")
-    sys.stdout.buffer.write(data)
-    return 0
+    with ZitiHttpClient(ctx) as client:
+        return _write_streamed(client.stream(args.service, "/"), args.output, args.progress, "connect")
 
 
 def main(argv: list[str] | None = None) -> int:
@@ -293,64 +990,124 @@ def main(argv: list[str] | None = None) -> int:
     _add_http(sub)
     _add_shortcuts(sub)
     _add_demo(sub)
+    _add_controller(sub)
+    _add_bench(sub)
+    _add_soak(sub)
 
     args = parser.parse_args(argv)
 
     if args.cmd == "traditional-server":
-        run_echo_server(TcpTarget(args.bind, args.port))
+        from zentry_trust_demo.traditional import TcpTarget, run_echo_server
+
+        run_echo_server(TcpTarget(args.bind, args.port), _worker_limits(args))
         return 0
 
     if args.cmd == "traditional-client":
+        from zentry_trust_demo.traditional import TcpTarget, run_echo_client
+
         data = run_echo_client(TcpTarget(args.host, args.port), args.message.encode("utf-8"))
         print(data.decode("utf-8", errors="replace"))
         return 0
 
     if args.cmd == "ziti-host":
+        from zentry_trust_demo.common import load_context
+        from zentry_trust_demo.ziti_echo import run_ziti_echo_host
+
+        if not _profile_env_ok("ziti"):
+            return 2
         ctx = load_context(args.identity)
-        run_ziti_echo_host(ctx, args.service)
+        run_ziti_echo_host(ctx, args.service, limits=_worker_limits(args), compression=_compression(args))
         return 0
 
     if args.cmd == "ziti-client":
+        from zentry_trust_demo.common import load_context
+        from zentry_trust_demo.ziti_echo import run_ziti_echo_client
+
+        codec = _codec(args)
         ctx = load_context(args.identity)
-        data = run_ziti_echo_client(ctx, args.service, args.message.encode("utf-8"))
+        data = run_ziti_echo_client(ctx, args.service, args.message.encode("utf-8"), codec)
         print(data.decode("utf-8", errors="replace"))
         return 0
 
     if args.cmd == "traditional-http-server":
-        run_traditional_http_server(HttpBind(args.bind, args.port))
+        from zentry_trust_demo.zitify_http import HttpBind, run_traditional_http_server
+
+        run_traditional_http_server(HttpBind(args.bind, args.port), _keep_alive(args))
         return 0
 
     if args.cmd == "zitify-http-server":
-        run_zitified_http_server(args.identity, args.service, HttpBind(args.bind, args.port))
+        from zentry_trust_demo.zitify_http import HttpBind, run_zitified_http_server
+
+        if not _profile_env_ok("ziti"):
+            return 2
+        static = None
+        if args.root:
+            from zentry_trust_demo.static_site import StaticConfig
+
+            static = StaticConfig(
+                root=args.root,
+                max_age=args.max_age,
+                cache_bytes=args.file_cache_size * 2**20,
+                cache_max_file=args.file_cache_max * 1024,
+            )
+        run_zitified_http_server(
+            args.identity,
+            args.service,
+            HttpBind(args.bind, args.port),
+            workers=args.workers,
+            keep_alive=_keep_alive(args),
+            static=static,
+            compression=_compression(args),
+        )
         return 0
 
     if args.cmd == "ziti-http-get":
+        from zentry_trust_demo.common import load_context
+        from zentry_trust_demo.ziti_http_client import ZitiHttpClient
+
+        try:
+            tracer = _tracer(args, "ziti-http-get")
+        except ValueError as e:
+            print(f"[ziti-http-get] {e}", file=sys.stderr)
+            return 2
         ctx = load_context(args.identity)
-        data = ziti_http_get(ctx, args.service, args.path)
-        sys.stdout.buffer.write(data)
-        return 0
+        try:
+            if args.count == 1 and args.concurrency == 1 and args.pipeline == 1:
+                with ZitiHttpClient(ctx, timeout=args.timeout or None, codec=_codec(args), tracer=tracer) as client:
+                    resp = client.stream(args.service, args.path)
+                    return _write_streamed(resp, args.output, args.progress, "ziti-http-get")
+            return _ziti_http_get_many(ctx, args, tracer)
+        finally:
+            if tracer is not None:
+                tracer.close()
 
     if args.cmd == "ziti-http-proxy":
-        run_ziti_http_proxy(args.identity, args.service, ProxyBind(args.bind, args.port))
-        return 0
+        return _run_proxy(args)
     if args.cmd in ("http", "h"):
-        run_ziti_http_proxy(args.identity, args.service, ProxyBind(args.bind, args.port))
-        return 0
+        return _run_proxy(args)
     if args.cmd in ("proxy", "p"):
-        run_ziti_http_proxy(args.identity, args.service, ProxyBind(args.bind, args.port))
-        return 0
+        return _run_proxy(args)
+
+    if args.cmd == "bench":
+        return _bench(args)
+
+    if args.cmd == "soak":
+        return _soak(args)
+
+    if args.cmd == "controller":
+        return _controller(args)
 
     if args.cmd in ("up", "u"):
         return _demo_up(args.service)
 
     if args.cmd in ("connect", "c"):
-        return _demo_connect(args.service)
+        return _demo_connect(args)
 
     if args.cmd == "demo":
         if args.action == "up":
             return _demo_up(args.service)
         if args.action == "connect":
-            return _demo_connect(args.service)
+            return _demo_connect(args)
 
         print(f"Unknown demo action: {args.action}", file=sys.stderr)
         return 2
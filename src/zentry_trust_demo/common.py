@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import os
+import threading
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -11,7 +13,7 @@ class Identity:
     path: Path
 
 
-def load_context(identity_path: str) -> openziti.ZitiContext:
+def _load(identity_path: str) -> openziti.ZitiContext:
     ctx, err = openziti.load(identity_path)
     if err != 0:
         raise RuntimeError(
@@ -19,3 +21,65 @@ def load_context(identity_path: str) -> openziti.ZitiContext:
             "Ensure the identity JSON exists and is readable."
         )
     return ctx
+
+
+def _fingerprint(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class ContextRegistry:
+    """Process-wide cache of loaded Ziti contexts, one per identity file.
+
+    Loading an identity authenticates against the controller, so every
+    service a process hosts or dials with the same identity should share one
+    context. Entries are keyed by the resolved path and revalidated against
+    the file's mtime/size: a rotated identity is loaded again on next use.
+    Replaced contexts are not torn down, since connections opened from them
+    may still be in use.
+    """
+
+    def __init__(self) -> None:
+        self._contexts: dict[str, tuple[tuple[int, int], openziti.ZitiContext]] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, identity_path: str) -> openziti.ZitiContext:
+        key = os.path.realpath(identity_path)
+        with self._lock:
+            try:
+                stamp = _fingerprint(key)
+            except OSError:
+                stamp = None
+            cached = self._contexts.get(key)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+            ctx = _load(identity_path)
+            self.loads += 1
+            if stamp is not None:
+                self._contexts[key] = (stamp, ctx)
+            return ctx
+
+    def evict(self, identity_path: str) -> openziti.ZitiContext | None:
+        """Forget the context for ``identity_path``; the next ``get`` loads it again."""
+        with self._lock:
+            cached = self._contexts.pop(os.path.realpath(identity_path), None)
+        return cached[1] if cached else None
+
+    def reload(self, identity_path: str) -> openziti.ZitiContext:
+        self.evict(identity_path)
+        return self.get(identity_path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._contexts.clear()
+
+
+contexts = ContextRegistry()
+
+
+def load_context(identity_path: str, reuse: bool = True) -> openziti.ZitiContext:
+    """Return the Ziti context for ``identity_path``, shared process-wide unless ``reuse`` is False."""
+    if not reuse:
+        return _load(identity_path)
+    return contexts.get(identity_path)
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import io
+import socket
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import IO, Any
+
+from zentry_trust_demo.relay import recv_exact
+
+# The client's offer and the host's acceptance. Both start with a byte that
+# never begins an HTTP request or TLS record, so a host can tell a framed
+# client from a raw one by peeking at the first bytes.
+_MAGIC = b"\xffZTZ"
+_VERSION = 1
+_OFFER = _MAGIC + b"C" + bytes([_VERSION])
+_ACCEPT = _MAGIC + b"A" + bytes([_VERSION])
+
+# Frame header: payload length, top bit set when the payload is zlib data.
+_HEADER = struct.Struct(">I")
+_COMPRESSED = 0x80000000
+
+# Raw bytes per frame. The decoder refuses frames that would inflate past this.
+MAX_FRAME = 256 * 1024
+
+# After a frame that did not shrink, this many frames at most go out raw before compression is tried again.
+_MAX_BYPASS = 64
+# Bytes of a large frame test-compressed before deciding whether to compress it.
+_SAMPLE = 1024
+
+
+@dataclass(frozen=True)
+class CompressionConfig:
+    """Opt-in compressed framing between a zentry client (proxy, ``ziti-client``) and a zentry host.
+
+    Frames smaller than ``min_size`` bytes are sent as they are. When a frame
+    saves less than ``min_saving`` (a fraction) its successors are sent raw
+    for a while, so TLS, images and already-gzipped bodies cost almost
+    nothing. ``level`` is the zlib level: 1 is fast and gets most of the gain
+    on JSON and logs. A client waits up to ``handshake_timeout`` seconds for
+    the host to accept.
+    """
+
+    level: int = 1
+    min_size: int = 256
+    min_saving: float = 0.1
+    handshake_timeout: float = 5.0
+
+    def __post_init__(self) -> None:
+        if not 1 <= self.level <= 9:
+            raise ValueError(f"compression level must be 1-9, got {self.level}")
+        if self.min_size < 0 or not 0 <= self.min_saving < 1 or self.handshake_timeout < 0:
+            raise ValueError(f"invalid compression settings: {self}")
+
+
+class FramingError(ConnectionError):
+    """The peer did not accept compressed framing, or sent a broken frame stream."""
+
+
+class CompressionStats:
+    """Bytes before (raw) and after (wire) compression, per direction."""
+
+    def __init__(self) -> None:
+        self.raw_sent = 0
+        self.wire_sent = 0
+        self.raw_received = 0
+        self.wire_received = 0
+        self._lock = threading.Lock()
+
+    def sent(self, raw: int, wire: int) -> None:
+        with self._lock:
+            self.raw_sent += raw
+            self.wire_sent += wire
+
+    def received(self, raw: int, wire: int) -> None:
+        with self._lock:
+            self.raw_received += raw
+            self.wire_received += wire
+
+    def totals(self) -> tuple[int, int]:
+        """``(raw, wire)`` bytes in both directions together."""
+        with self._lock:
+            return self.raw_sent + self.raw_received, self.wire_sent + self.wire_received
+
+    def summary(self) -> str:
+        raw, wire = self.totals()
+        return f"compressed={raw / 1e6:.2f}MB->{wire / 1e6:.2f}MB ({100 * wire / raw if raw else 100:.0f}%)"
+
+    def render(self) -> list[str]:
+        """Prometheus lines for the proxy's ``/metrics`` endpoint."""
+        name = "zentry_proxy_compression_bytes_total"
+        out = [
+            f"# HELP {name} Bytes exchanged with compressing hosts, before (raw) and after (wire) compression.",
+            f"# TYPE {name} counter",
+        ]
+        with self._lock:
+            for direction, raw, wire in (
+                ("sent", self.raw_sent, self.wire_sent),
+                ("received", self.raw_received, self.wire_received),
+            ):
+                out.append(f'{name}{{direction="{direction}",side="raw"}} {raw}')
+                out.append(f'{name}{{direction="{direction}",side="wire"}} {wire}')
+        return out
+
+
+class Encoder:
+    """Turns one direction of a byte stream into frames.
+
+    All compressed frames come from one zlib stream, flushed at each frame
+    boundary, so later frames reuse the history of earlier ones (repeated
+    JSON keys, log prefixes) and the receiver can decode every frame as soon
+    as it arrives.
+    """
+
+    def __init__(self, config: CompressionConfig, stats: CompressionStats | None = None) -> None:
+        self.config = config
+        self.stats = stats
+        self._z = zlib.compressobj(config.level)
+        self._bypass = 0  # frames still to send raw
+        self._backoff = 0
+
+    def encode(self, data: bytes | memoryview) -> bytes:
+        view = memoryview(data)
+        frames = [self._frame(view[i : i + MAX_FRAME]) for i in range(0, len(view), MAX_FRAME)]
+        out = b"".join(frames)
+        if self.stats is not None:
+            self.stats.sent(len(view), len(out))
+        return out
+
+    def _frame(self, chunk: memoryview) -> bytes:
+        n = len(chunk)
+        if n < self.config.min_size:
+            return _HEADER.pack(n) + chunk
+        if self._bypass:
+            self._bypass -= 1
+            return _HEADER.pack(n) + chunk
+        limit = n * (1 - self.config.min_saving)
+        # Large frames are tried on a sample first (with a throwaway stream),
+        # so a connection that only carries noise never pays for deflating it.
+        if n >= 4 * _SAMPLE and len(zlib.compress(chunk[:_SAMPLE], 1)) > _SAMPLE * (1 - self.config.min_saving):
+            self._incompressible()
+            return _HEADER.pack(n) + chunk
+        packed = self._z.compress(chunk) + self._z.flush(zlib.Z_SYNC_FLUSH)
+        if len(packed) > limit:
+            # This frame still goes out compressed: the receiver's zlib stream must see it.
+            self._incompressible()
+        else:
+            self._backoff = 0
+        return _HEADER.pack(len(packed) | _COMPRESSED) + packed
+
+    def _incompressible(self) -> None:
+        """Send the next frames raw, for longer each time it happens in a row."""
+        self._backoff = min(self._backoff * 2 or 1, _MAX_BYPASS)
+        self._bypass = self._backoff
+
+
+class Decoder:
+    """Turns received frames back into the byte stream; feed it whatever arrives."""
+
+    def __init__(self, stats: CompressionStats | None = None) -> None:
+        self.stats = stats
+        self._z = zlib.decompressobj()
+        self._buf = bytearray()
+
+    def feed(self, data: bytes | memoryview, limit: int = MAX_FRAME) -> bytes:
+        """Return the bytes of the frames ``data`` completed, stopping once ``limit`` is reached.
+
+        Frames past the limit stay buffered (see :meth:`has_frame`), so a few
+        kilobytes of highly compressed input cannot inflate into megabytes at once.
+        """
+        self._buf += data
+        out = []
+        size = wire = 0
+        while size < limit and self.has_frame():
+            (word,) = _HEADER.unpack_from(self._buf)
+            end = _HEADER.size + (word & ~_COMPRESSED)
+            payload = bytes(self._buf[_HEADER.size : end])
+            del self._buf[:end]
+            wire += end
+            if word & _COMPRESSED:
+                try:
+                    payload = self._z.decompress(payload, MAX_FRAME)
+                except zlib.error as e:
+                    raise FramingError(f"corrupt compressed frame: {e}") from None
+                if self._z.unconsumed_tail:
+                    raise FramingError(f"compressed frame inflates past {MAX_FRAME} bytes")
+            out.append(payload)
+            size += len(payload)
+        if self.stats is not None and wire:
+            self.stats.received(size, wire)
+        return b"".join(out)
+
+    @property
+    def buffered(self) -> int:
+        """Received bytes not decoded yet."""
+        return len(self._buf)
+
+    def has_frame(self) -> bool:
+        """Whether a whole frame is buffered."""
+        if len(self._buf) < _HEADER.size:
+            return False
+        (word,) = _HEADER.unpack_from(self._buf)
+        size = word & ~_COMPRESSED
+        if size > 2 * MAX_FRAME:
+            raise FramingError(f"frame of {size} bytes exceeds the limit")
+        return len(self._buf) >= _HEADER.size + size
+
+    def close(self) -> None:
+        """The stream ended; raises :class:`FramingError` if it stopped inside a frame."""
+        if self._buf and not self.has_frame():
+            raise FramingError(f"stream ended {len(self._buf)} bytes into a frame")
+
+
+class Codec:
+    """Compression settings plus the counters every connection using them adds to."""
+
+    def __init__(self, config: CompressionConfig, stats: CompressionStats | None = None) -> None:
+        self.config = config
+        self.stats = stats if stats is not None else CompressionStats()
+
+    def encoder(self) -> Encoder:
+        return Encoder(self.config, self.stats)
+
+    def decoder(self) -> Decoder:
+        return Decoder(self.stats)
+
+    def describe(self) -> str:
+        c = self.config
+        return f"zlib level {c.level} for frames of {c.min_size}+ bytes"
+
+
+def offer_compression(sock: socket.socket, codec: Codec) -> socket.socket:
+    """Client side: ask the host on ``sock`` to switch to compressed framing and wait for its answer.
+
+    Costs one round trip. Returns ``sock``; if the host does not accept (it
+    is not running with compression, or is not a zentry host at all) the
+    socket is closed and :class:`FramingError` raised, since the offer has
+    already been delivered to it as data.
+    """
+    timeout = sock.gettimeout()
+    try:
+        sock.settimeout(codec.config.handshake_timeout or None)
+        sock.sendall(_OFFER)
+        answer = recv_exact(sock, len(_ACCEPT))
+        sock.settimeout(timeout)
+    except BaseException as e:
+        sock.close()
+        if isinstance(e, socket.timeout):
+            raise FramingError("no answer to the compression offer (is the host running with --compress?)") from None
+        raise
+    if answer != _ACCEPT:
+        sock.close()
+        raise FramingError("the host did not accept compressed framing (is it running with --compress?)")
+    return sock
+
+
+def accept_compression(sock: socket.socket, timeout: float | None = 5.0) -> bool:
+    """Host side: if the client on ``sock`` offered compressed framing, accept it and return True.
+
+    Raw clients are left untouched: their first bytes are only peeked at.
+    Gives up (and treats the client as raw) after ``timeout`` seconds.
+    """
+    deadline = time.monotonic() + (timeout or 0)
+    delay = 0.001
+    previous = sock.gettimeout()
+    sock.settimeout(timeout)
+    try:
+        while True:
+            data = sock.recv(len(_OFFER), socket.MSG_PEEK)
+            if not data or not _OFFER.startswith(data):
+                return False
+            if data == _OFFER:
+                break
+            if timeout and time.monotonic() >= deadline:
+                return False
+            # MSG_PEEK keeps the socket readable, so wait for the rest by polling (see routing.sniff).
+            time.sleep(delay)
+            delay = min(0.05, delay * 2)
+        recv_exact(sock, len(_OFFER))
+        sock.sendall(_ACCEPT)
+        return True
+    except (socket.timeout, OSError):
+        return False
+    finally:
+        try:
+            sock.settimeout(previous)
+        except OSError:
+            pass
+
+
+class CompressedSocket:
+    """A blocking socket whose bytes travel as compressed frames after a successful handshake.
+
+    Supports what the HTTP servers and clients here use (``sendall``,
+    ``recv_into``, ``makefile``, ``sendfile``, timeouts and shutdown); any
+    other attribute is looked up on the wrapped socket.
+    """
+
+    def __init__(self, sock: socket.socket, codec: Codec) -> None:
+        self.sock = sock
+        self._encoder = codec.encoder()
+        self._decoder = codec.decoder()
+        self._ready = bytearray()  # decoded bytes not yet handed out
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.sock, name)
+
+    def sendall(self, data: bytes | memoryview) -> None:
+        if len(data):
+            self.sock.sendall(self._encoder.encode(data))
+
+    def send(self, data: bytes | memoryview) -> int:
+        self.sendall(data)
+        return len(data)
+
+    def sendfile(self, file: IO[bytes], offset: int = 0, count: int | None = None) -> int:
+        """Send ``count`` bytes of ``file`` from ``offset``; the bytes pass through the encoder, not ``os.sendfile``."""
+        file.seek(offset)
+        sent = 0
+        while count is None or sent < count:
+            chunk = file.read(MAX_FRAME if count is None else min(MAX_FRAME, count - sent))
+            if not chunk:
+                break
+            self.sendall(chunk)
+            sent += len(chunk)
+        file.seek(offset + sent)
+        return sent
+
+    def recv_into(self, buffer: Any, nbytes: int = 0) -> int:
+        view = memoryview(buffer).cast("B")
+        want = min(nbytes or len(view), len(view))
+        while not self._ready:
+            data = b"" if self._decoder.has_frame() else self.sock.recv(MAX_FRAME)
+            if not data and not self._decoder.has_frame():
+                self._decoder.close()
+                return 0
+            self._ready += self._decoder.feed(data)
+        n = min(want, len(self._ready))
+        view[:n] = self._ready[:n]
+        del self._ready[:n]
+        return n
+
+    def recv(self, bufsize: int, flags: int = 0) -> bytes:
+        buf = bytearray(bufsize)
+        return bytes(buf[: self.recv_into(buf)])
+
+    def makefile(self, mode: str = "r", buffering: int | None = None, **_: Any) -> IO[bytes]:
+        if "b" not in mode:
+            raise ValueError("compressed sockets only offer binary files")
+        raw = socket.SocketIO(self, mode.replace("b", ""))  # type: ignore[arg-type]
+        if buffering == 0:
+            return raw  # type: ignore[return-value]
+        size = io.DEFAULT_BUFFER_SIZE if buffering is None or buffering < 0 else buffering
+        if "r" in mode and "w" in mode:
+            return io.BufferedRWPair(raw, raw, size)  # type: ignore[return-value]
+        if "w" in mode:
+            return io.BufferedWriter(raw, size)
+        return io.BufferedReader(raw, size)
+
+    def _decref_socketios(self) -> None:
+        pass  # files made by makefile() never own the socket
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "CompressedSocket":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
@@ -0,0 +1,466 @@
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import ssl
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Mapping
+from urllib.parse import quote, urlsplit
+
+API_PREFIX = "/edge/management/v1"
+
+# Entity kinds the client creates, as named in the API's paths.
+KINDS = ("identities", "services", "service-policies", "edge-router-policies", "service-edge-router-policies")
+
+_PAGE = 500
+
+
+@dataclass(frozen=True)
+class ControllerConfig:
+    """Where the controller's edge management API listens and how to log in to it.
+
+    The certificate is verified against the system CAs, or against
+    ``ca_file`` when given. ``insecure`` skips verification entirely (the
+    quickstart's certificate is self-signed) and warns that it does. Up to
+    ``max_connections`` keep-alive connections are opened and reused.
+    """
+
+    url: str = "https://localhost:1280"
+    username: str = "admin"
+    password: str = field(default="", repr=False)
+    insecure: bool = False
+    ca_file: str | None = None
+    timeout: float = 10.0
+    max_connections: int = 4
+
+    def __post_init__(self) -> None:
+        parts = urlsplit(self.url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"controller URL must be http(s)://host[:port], got {self.url!r}")
+        if self.timeout <= 0 or self.max_connections < 1:
+            raise ValueError(f"invalid controller client settings: {self}")
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> ControllerConfig:
+        """The settings the ``scripts/ziti_step*.sh`` helpers read (``ZITI_CTRL``, ``ZITI_PWD``, ...)."""
+        return cls(
+            url=env.get("ZITI_CTRL", "https://localhost:1280").rstrip("/"),
+            username=env.get("ZITI_USER", "admin"),
+            password=env.get("ZITI_PWD", ""),
+            insecure=env.get("ZITI_INSECURE", "0") == "1",
+            ca_file=env.get("ZITI_CA_FILE") or None,
+        )
+
+
+class ControllerError(RuntimeError):
+    """The controller refused a request or could not be reached (``status`` 0)."""
+
+    def __init__(self, message: str, status: int = 0, code: str = "") -> None:
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+@dataclass(frozen=True)
+class Entity:
+    """An entity of ``kind`` to create unless one with its name exists; ``body`` is the create request."""
+
+    kind: str
+    body: dict[str, Any] = field(hash=False)
+
+    @property
+    def name(self) -> str:
+        return self.body["name"]
+
+
+def identity(name: str, roles: list[str]) -> Entity:
+    """A device identity with a one-time enrollment token."""
+    body = {"name": name, "type": "Device", "isAdmin": False, "roleAttributes": roles, "enrollment": {"ott": True}}
+    return Entity("identities", body)
+
+
+def service(name: str) -> Entity:
+    return Entity("services", {"name": name, "encryptionRequired": True, "roleAttributes": []})
+
+
+def lab_policies(service_name: str, service_id: str, host_id: str, client_id: str) -> list[Entity]:
+    """What ``scripts/ziti_step3_service_policies.sh`` creates: ``host_id`` may bind the service,
+    ``client_id`` may dial it, and both (and the service) may use every edge router.
+
+    The API takes ``@`` roles as entity ids, not names.
+    """
+    return [
+        Entity(
+            "service-policies",
+            {
+                "name": f"{service_name}-bind",
+                "type": "Bind",
+                "semantic": "AnyOf",
+                "serviceRoles": [f"@{service_id}"],
+                "identityRoles": [f"@{host_id}"],
+            },
+        ),
+        Entity(
+            "service-policies",
+            {
+                "name": f"{service_name}-dial",
+                "type": "Dial",
+                "semantic": "AnyOf",
+                "serviceRoles": [f"@{service_id}"],
+                "identityRoles": [f"@{client_id}"],
+            },
+        ),
+        Entity(
+            "edge-router-policies",
+            {
+                "name": f"{service_name}-identities",
+                "semantic": "AnyOf",
+                "edgeRouterRoles": ["#all"],
+                "identityRoles": [f"@{host_id}", f"@{client_id}"],
+            },
+        ),
+        Entity(
+            "service-edge-router-policies",
+            {
+                "name": f"{service_name}-service",
+                "semantic": "AnyOf",
+                "edgeRouterRoles": ["#all"],
+                "serviceRoles": [f"@{service_id}"],
+            },
+        ),
+    ]
+
+
+def _quoted(name: str) -> str:
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def default_token_cache() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "zentry" / "controller-sessions.json"
+
+
+class ManagementClient:
+    """A client for the controller's edge management REST API.
+
+    Requests share a small pool of keep-alive connections, so provisioning a
+    lab costs one TLS handshake per connection rather than a ``docker compose
+    exec`` and a CLI start per operation. The session token is kept for the
+    client's lifetime and, with ``token_cache``, across processes; an expired
+    one is replaced transparently on the first 401.
+
+    Safe to use from several threads.
+    """
+
+    def __init__(self, config: ControllerConfig, token_cache: Path | None = None) -> None:
+        self.config = config
+        self.token_cache = token_cache
+        self.requests = 0
+        self.logins = 0
+        parts = urlsplit(config.url)
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname or ""
+        self._port = parts.port or (443 if self._https else 80)
+        self._base = parts.path.rstrip("/")
+        self._ssl = self._ssl_context() if self._https else None
+        self._idle: list[http.client.HTTPConnection] = []
+        self._slots = threading.BoundedSemaphore(config.max_connections)
+        self._lock = threading.Lock()
+        self._auth_lock = threading.Lock()
+        self._token: str | None = self._cached_token()
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        if self.config.ca_file:
+            return ssl.create_default_context(cafile=self.config.ca_file)
+        ctx = ssl.create_default_context()
+        if self.config.insecure:
+            print(f"[controller] WARNING: not verifying the TLS certificate of {self.config.url}", file=sys.stderr)
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        return ctx
+
+    def __enter__(self) -> ManagementClient:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _checkout(self) -> http.client.HTTPConnection:
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        if self._ssl is not None:
+            return http.client.HTTPSConnection(self._host, self._port, timeout=self.config.timeout, context=self._ssl)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.config.timeout)
+
+    def _checkin(self, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        if reusable:
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def _send(self, method: str, path: str, body: bytes | None, headers: dict[str, str]) -> tuple[int, bytes]:
+        """One exchange on a pooled connection, redone once on a fresh one if the reused one had gone stale."""
+        retry = True
+        while True:
+            conn = self._checkout()
+            reused = conn.sock is not None
+            try:
+                conn.request(method, self._base + path, body=body, headers=headers)
+                resp = conn.getresponse()
+                payload = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                self._checkin(conn, reusable=False)
+                if reused and retry:
+                    retry = False
+                    continue  # the controller closed an idle keep-alive connection
+                raise ControllerError(f"{method} {path}: {e}") from e
+            except (OSError, http.client.HTTPException) as e:
+                self._checkin(conn, reusable=False)
+                raise ControllerError(f"{method} {path}: cannot reach {self.config.url}: {e}") from e
+            self._checkin(conn, reusable=not resp.will_close)
+            with self._lock:
+                self.requests += 1
+            return resp.status, payload
+
+    def _cache_key(self) -> str:
+        return f"{self.config.url} {self.config.username}"
+
+    def _cached_token(self) -> str | None:
+        if self.token_cache is None:
+            return None
+        try:
+            return json.loads(self.token_cache.read_text()).get(self._cache_key())
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _store_token(self, token: str) -> None:
+        if self.token_cache is None:
+            return
+        try:
+            sessions = json.loads(self.token_cache.read_text())
+        except (OSError, ValueError):
+            sessions = {}
+        sessions[self._cache_key()] = token
+        try:
+            self.token_cache.parent.mkdir(parents=True, exist_ok=True)
+            # The token is a credential: keep the file private to this user.
+            fd = os.open(self.token_cache, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(fd, 0o600)  # the mode above only applies when the file is created
+            with os.fdopen(fd, "w") as f:
+                json.dump(sessions, f, indent=2)
+        except OSError:
+            pass  # caching is an optimization; the token still works for this process
+
+    def authenticate(self, stale: str | None = None) -> str:
+        """Log in with the configured password and return the session token.
+
+        A valid cached token is returned as is; pass the token that was just
+        rejected as ``stale`` to force a new login (once, however many
+        threads saw it rejected).
+        """
+        with self._auth_lock:
+            if self._token is not None and self._token != stale:
+                return self._token
+            if not self.config.password:
+                raise ControllerError(f"no password to log in to {self.config.url} as {self.config.username!r}")
+            body = json.dumps({"username": self.config.username, "password": self.config.password}).encode()
+            status, payload = self._send(
+                "POST",
+                f"{API_PREFIX}/authenticate?method=password",
+                body,
+                {"Content-Type": "application/json"},
+            )
+            data = self._decode("POST", "/authenticate", status, payload)
+            self._token = data["data"]["token"]
+            self.logins += 1
+            self._store_token(self._token)
+            return self._token
+
+    def login(self) -> str:
+        """Start a new session even if a cached token exists."""
+        return self.authenticate(stale=self._token)
+
+    @staticmethod
+    def _decode(method: str, path: str, status: int, payload: bytes) -> dict[str, Any]:
+        try:
+            data = json.loads(payload) if payload else {}
+        except ValueError:
+            data = {}
+        if status >= 400:
+            error = data.get("error") or {}
+            message = error.get("message") or payload[:200].decode("utf-8", "replace") or f"HTTP {status}"
+            raise ControllerError(f"{method} {path}: {status} {message}", status, error.get("code", ""))
+        return data
+
+    def request(self, method: str, path: str, body: dict[str, Any] | None = None) -> dict[str, Any]:
+        """``method`` ``API_PREFIX + path`` with the session token; returns the decoded JSON reply."""
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Accept": "application/json"}
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+        token = self._token or self.authenticate()
+        status, payload = self._send(method, API_PREFIX + path, data, dict(headers, **{"zt-session": token}))
+        if status == 401:
+            # The session expired (or the cached token belongs to an older controller): log in again once.
+            token = self.authenticate(stale=token)
+            status, payload = self._send(method, API_PREFIX + path, data, dict(headers, **{"zt-session": token}))
+        return self._decode(method, path, status, payload)
+
+    def version(self) -> dict[str, Any]:
+        """The controller's ``/version`` (no login needed); answers as soon as the edge API is up."""
+        status, payload = self._send("GET", "/version", None, {"Accept": "application/json"})
+        return self._decode("GET", "/version", status, payload).get("data", {})
+
+    def list(self, kind: str, filter: str | None = None) -> list[dict[str, Any]]:
+        """Every ``kind`` entity matching ``filter`` (the controller's filter language), all pages."""
+        out: list[dict[str, Any]] = []
+        while True:
+            query = f"?limit={_PAGE}&offset={len(out)}"
+            if filter:
+                query += "&filter=" + quote(filter)
+            reply = self.request("GET", f"/{kind}{query}")
+            page = reply.get("data") or []
+            out += page
+            total = (reply.get("meta") or {}).get("pagination", {}).get("totalCount", len(out))
+            if not page or len(out) >= total:
+                return out
+
+    def find(self, kind: str, name: str) -> dict[str, Any] | None:
+        found = self.list(kind, f"name={_quoted(name)}")
+        return found[0] if found else None
+
+    def ids(self, kind: str, names: list[str]) -> dict[str, str]:
+        """``name -> id`` for those of ``names`` that exist, in one request."""
+        if not names:
+            return {}
+        found = self.list(kind, f"name in [{', '.join(_quoted(n) for n in names)}]")
+        return {e["name"]: e["id"] for e in found if e.get("name") in names}
+
+    def create(self, kind: str, body: dict[str, Any]) -> str:
+        return self.request("POST", f"/{kind}", body)["data"]["id"]
+
+    def update(self, kind: str, entity_id: str, body: dict[str, Any]) -> None:
+        self.request("PATCH", f"/{kind}/{entity_id}", body)
+
+    def delete(self, kind: str, entity_id: str) -> None:
+        self.request("DELETE", f"/{kind}/{entity_id}")
+
+    def ensure(self, entities: list[Entity], update: bool = False) -> list[tuple[str, bool]]:
+        """Create whichever of ``entities`` do not exist yet; ``(id, created)`` for each, in order.
+
+        Existing ones are looked up with one request per kind, and the missing
+        ones created concurrently over the connection pool. With ``update``,
+        existing ones are patched to match their ``body`` as well (so a policy
+        follows an identity that was recreated under a new id).
+        """
+        existing: dict[str, dict[str, str]] = {}
+        for kind in dict.fromkeys(e.kind for e in entities):
+            existing[kind] = self.ids(kind, [e.name for e in entities if e.kind == kind])
+        missing = [e for e in entities if e.name not in existing[e.kind]]
+        found = [e for e in entities if e.name in existing[e.kind]] if update else []
+
+        def apply(e: Entity) -> str:
+            if e in found:
+                self.update(e.kind, existing[e.kind][e.name], e.body)
+                return existing[e.kind][e.name]
+            return self.create(e.kind, e.body)
+
+        with ThreadPoolExecutor(max_workers=self.config.max_connections, thread_name_prefix="ziti-mgmt") as pool:
+            created = dict(zip(missing, list(pool.map(apply, missing + found))))
+        return [(created[e], True) if e in created else (existing[e.kind][e.name], False) for e in entities]
+
+    def enrollment_jwt(self, identity_id: str) -> str:
+        """The one-time enrollment token of a not yet enrolled identity."""
+        data = self.request("GET", f"/identities/{identity_id}")["data"]
+        jwt = ((data.get("enrollment") or {}).get("ott") or {}).get("jwt")
+        if not jwt:
+            raise ControllerError(f"identity {data.get('name', identity_id)!r} has no pending enrollment")
+        return jwt
+
+    def policy_advice(self, identity_id: str, service_id: str) -> dict[str, Any]:
+        """Whether ``identity_id`` may dial/bind ``service_id`` and over which edge routers."""
+        return self.request("GET", f"/identities/{identity_id}/policy-advice/{service_id}")["data"]
+
+
+def enroll(jwt: str, out: Path) -> None:
+    """Enroll an identity from its token with the SDK and write the identity JSON to ``out``."""
+    # Imported here so the management client itself never loads the Ziti SDK.
+    import openziti
+
+    identity_json = openziti.enroll(jwt)
+    fd = os.open(out, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(identity_json if isinstance(identity_json, str) else json.dumps(identity_json))
+
+
+def format_advice(identity_name: str, service_name: str, advice: dict[str, Any]) -> str:
+    """One line in the spirit of ``ziti edge policy-advisor``."""
+    routers = advice.get("commonRouters") or []
+    online = sum(1 for r in routers if r.get("isOnline"))
+    names = ", ".join(r.get("name", r.get("id", "?")) for r in routers)
+    return (
+        f"{identity_name} -> {service_name}: dial={'yes' if advice.get('isDialAllowed') else 'no'} "
+        f"bind={'yes' if advice.get('isBindAllowed') else 'no'} "
+        f"common routers={len(routers)} ({online} online){': ' + names if names else ''}"
+    )
+
+
+def provision_lab(
+    api: ManagementClient,
+    service_name: str,
+    host: str,
+    client: str,
+    out_dir: Path,
+    enroll_identities: bool = True,
+    recreate: bool = False,
+) -> None:
+    """What ``scripts/ziti_step2_identities_quickstart.sh``, ``..._enroll_quickstart.sh`` and
+    ``ziti_step3_service_policies.sh`` do, in a handful of API requests.
+
+    Creates the ``host`` and ``client`` identities and the service unless they
+    exist, writes each new identity's ``<name>.jwt`` (and, with
+    ``enroll_identities``, its enrolled ``<name>.json``) to ``out_dir``, then
+    creates or updates the policies. ``recreate`` deletes existing identities
+    first, to issue them new enrollment tokens.
+    """
+    if recreate:
+        for name, identity_id in api.ids("identities", [host, client]).items():
+            api.delete("identities", identity_id)
+            print(f"[controller] deleted identity {name}")
+    entities = [identity(host, ["zentry.sentinel"]), identity(client, ["zentry.client"]), service(service_name)]
+    (host_id, _), (client_id, _), (service_id, _) = results = api.ensure(entities)
+    for entity, (entity_id, created) in zip(entities, results):
+        if not created:
+            hint = " (--recreate issues a new enrollment token)" if entity.kind == "identities" else ""
+            print(f"[controller] exists: {entity.kind} {entity.name}{hint}")
+            continue
+        print(f"[controller] created: {entity.kind} {entity.name} ({entity_id})")
+        if entity.kind != "identities":
+            continue
+        jwt = api.enrollment_jwt(entity_id)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        (out_dir / f"{entity.name}.jwt").write_text(jwt)
+        if enroll_identities:
+            enroll(jwt, out_dir / f"{entity.name}.json")
+            print(f"[controller] enrolled {entity.name} -> {out_dir / (entity.name + '.json')}")
+        else:
+            print(f"[controller] enrollment token written to {out_dir / (entity.name + '.jwt')}")
+    policies = lab_policies(service_name, service_id, host_id, client_id)
+    for entity, (_, created) in zip(policies, api.ensure(policies, update=True)):
+        print(f"[controller] {'created' if created else 'updated'}: {entity.kind} {entity.name}")
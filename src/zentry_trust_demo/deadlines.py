@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import socket
+import threading
+import time
+from dataclasses import dataclass
+
+from zentry_trust_demo.metrics import Connection, ProxyMetrics
+from zentry_trust_demo.relay import Relay
+
+
+@dataclass(frozen=True)
+class Timeouts:
+    """Deadlines for proxied connections, in seconds; 0 disables one.
+
+    ``connect`` runs from accept until the Ziti connection is ready (routing,
+    queueing for a dial slot and the dial itself). ``idle`` is how long no
+    byte may move in either direction, and ``lifetime`` caps a connection
+    regardless of traffic. Long-lived streams (SSE, WebSockets) that go quiet
+    for minutes want ``idle=0`` or a generous value.
+    """
+
+    connect: float = 10.0
+    idle: float = 30.0
+    lifetime: float = 0.0
+
+    def __post_init__(self) -> None:
+        if min(self.connect, self.idle, self.lifetime) < 0:
+            raise ValueError(f"timeouts must be >= 0: {self}")
+
+
+class Watch:
+    """One connection's entry in a :class:`Reaper`."""
+
+    __slots__ = ("started", "client", "conn", "relay", "due", "expired", "done")
+
+    def __init__(self, client: socket.socket, started: float, conn: Connection | None = None) -> None:
+        self.started = started
+        self.client: socket.socket | None = client
+        self.conn = conn  # its metrics entry, so an expiry shows up in the connection's trace
+        self.relay: Relay | None = None
+        self.due: float | None = None  # heap entries for any other time are stale
+        self.expired: str | None = None  # the reason, once a deadline passed
+        self.done = False
+
+
+def _shutdown(sock: socket.socket) -> None:
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class Reaper:
+    """Enforces :class:`Timeouts` for every connection of a proxy from one thread and one heap.
+
+    Heap entries are not touched when a connection moves bytes: when one comes
+    due, the connection's current state decides whether it really expired or
+    is pushed back to its new deadline. A busy connection therefore costs one
+    heap operation per idle period instead of one per read, and nothing is
+    scanned linearly, so tens of thousands of connections are cheap to watch.
+
+    An expired connection's sockets are shut down (not closed), which wakes
+    whatever thread or event loop is blocked on them; that owner then sees
+    :attr:`Watch.expired` and cleans up as usual.
+    """
+
+    def __init__(self, timeouts: Timeouts, metrics: ProxyMetrics) -> None:
+        self.timeouts = timeouts
+        self.metrics = metrics
+        self._heap: list[tuple[float, int, Watch]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ziti-proxy-reaper", daemon=True)
+        self._thread.start()
+
+    def watch(self, client: socket.socket, started: float | None = None, conn: Connection | None = None) -> Watch:
+        """Start enforcing deadlines for the connection accepted as ``client`` at ``started``.
+
+        ``started`` defaults to ``conn.started`` if ``conn`` is given, else to now.
+        """
+        if started is None:
+            started = conn.started if conn is not None else time.monotonic()
+        w = Watch(client, started, conn)
+        self._schedule(w)
+        return w
+
+    def connected(self, w: Watch, relay: Relay) -> None:
+        """The Ziti side is up: from now on ``relay``'s traffic keeps the connection alive."""
+        w.relay = relay
+        self._schedule(w)
+
+    @staticmethod
+    def release(w: Watch) -> None:
+        """The connection is finished; its heap entry is dropped when it comes due."""
+        w.done = True
+        # Until then, don't keep its socket, buffers and codec state alive.
+        w.client = w.relay = w.conn = None
+
+    def close(self) -> None:
+        """Stop the reaper thread; connections still watched are no longer expired."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _schedule(self, w: Watch) -> None:
+        due = self._next(w)
+        with self._cond:
+            w.due = due[0] if due is not None else None
+            if w.due is not None:
+                heapq.heappush(self._heap, (w.due, next(self._seq), w))
+                if self._heap[0][2] is w:
+                    self._cond.notify()
+
+    def _next(self, w: Watch) -> tuple[float, str] | None:
+        t = self.timeouts
+        options = []
+        if t.lifetime:
+            options.append((w.started + t.lifetime, "LifetimeExceeded"))
+        r = w.relay
+        if r is None:
+            # While dialing, a disabled connect timeout falls back to the idle one.
+            if t.connect:
+                options.append((w.started + t.connect, "ConnectTimeout"))
+            elif t.idle:
+                options.append((w.started + t.idle, "IdleTimeout"))
+        elif t.idle:
+            options.append((r.last_active + t.idle, "IdleTimeout"))
+        return min(options) if options else None
+
+    def _expire(self, w: Watch, reason: str) -> None:
+        if w.done:
+            return  # finished while we were deciding
+        w.expired = reason
+        self.metrics.error("relay" if w.relay is not None else "dial", reason, w.conn)
+        r = w.relay
+        for sock in (w.client, *(r.sockets if r is not None else ())):
+            if sock is not None:
+                _shutdown(sock)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._closed:
+                    return
+                when, _, w = heapq.heappop(self._heap)
+                if w.done or when != w.due:
+                    continue
+                due = self._next(w)
+                if due is not None and due[0] > time.monotonic():
+                    w.due = due[0]
+                    heapq.heappush(self._heap, (w.due, next(self._seq), w))
+                    continue
+                w.due = None
+            if due is not None:
+                self._expire(w, due[1])
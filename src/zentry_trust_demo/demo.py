@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from zentry_trust_demo.controller import (
+    ControllerConfig,
+    ControllerError,
+    ManagementClient,
+    default_token_cache,
+    enroll,
+    format_advice,
+    identity,
+    lab_policies,
+    service,
+)
+from zentry_trust_demo.orchestrator import RunReport, Step, poll_until, run_steps
+
+STATE_FILE = ".zentry-demo.json"
+
+
+@dataclass
+class Lab:
+    """Everything ``demo up`` needs to know about the local quickstart lab."""
+
+    root: Path
+    service: str
+    env: dict[str, str]
+    sentinel: str = "ZentrySentinel"
+    client: str = "ZentryClient"
+    sentinel_pid: int | None = None
+    reused: set[str] = field(default_factory=set)
+    identity_ids: dict[str, str] = field(default_factory=dict)
+    _state_lock: threading.Lock = field(default_factory=threading.Lock)
+    _api: ManagementClient | None = None
+
+    @property
+    def compose_file(self) -> str:
+        return self.env["ZITI_COMPOSE_FILE"]
+
+    @property
+    def controller(self) -> str:
+        # The quickstart publishes the controller port on the host.
+        return self.env.get("ZITI_CTRL", "https://localhost:1280").rstrip("/")
+
+    @property
+    def api(self) -> ManagementClient:
+        """The controller's management API, shared by every step (one pool, one login)."""
+        with self._state_lock:
+            if self._api is None:
+                self._api = ManagementClient(ControllerConfig.from_env(self.env), default_token_cache())
+            return self._api
+
+    def close(self) -> None:
+        """Close the management API's pooled connections, if any were opened."""
+        with self._state_lock:
+            api, self._api = self._api, None
+        if api is not None:
+            api.close()
+
+    @property
+    def state_path(self) -> Path:
+        return self.root / STATE_FILE
+
+    def compose(self, *args: str) -> list[str]:
+        return ["docker", "compose", "-f", self.compose_file, *args]
+
+    def load_state(self) -> dict[str, dict[str, str]]:
+        try:
+            return json.loads(self.state_path.read_text())["identities"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def remember(self, name: str, identity_id: str) -> None:
+        """Record which controller identity ``<name>.json`` was enrolled from."""
+        with self._state_lock:
+            identities = self.load_state()
+            identities[name] = {"id": identity_id, "sha256": _sha256(self.root / f"{name}.json")}
+            self.state_path.write_text(json.dumps({"identities": identities}, indent=2) + "\n")
+
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _run(label: str, cmd: list[str], lab: Lab, env: dict[str, str] | None = None) -> str:
+    """Run ``cmd`` to completion and print its output as one block, prefixed by ``label``.
+
+    Steps run concurrently, so output is captured rather than interleaved.
+    """
+    result = subprocess.run(
+        cmd,
+        cwd=str(lab.root),
+        env=env or lab.env,
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+    )
+    output = (result.stdout + result.stderr).strip()
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} exited with {result.returncode}:\n{output}")
+    for line in output.splitlines():
+        print(f"[demo:{label}] {line}")
+    return result.stdout
+
+
+def _controller_ready(lab: Lab) -> bool:
+    # The controller answers /version as soon as it serves the edge API, which
+    # is usually well before the compose healthcheck reports "healthy".
+    try:
+        lab.api.version()
+        return True
+    except ControllerError:
+        pass
+    container = subprocess.run(lab.compose("ps", "-q", "quickstart"), capture_output=True, text=True).stdout.strip()
+    if not container:
+        return False
+    status = subprocess.run(
+        ["docker", "inspect", "-f", "{{.State.Health.Status}}", container],
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    return status == "healthy"
+
+
+def _identity_id(lab: Lab, name: str) -> str | None:
+    found = lab.api.find("identities", name)
+    return found["id"] if found else None
+
+
+def _start_quickstart(lab: Lab) -> None:
+    if lab.env.get("ZITI_RESET") == "1":
+        _run("quickstart", lab.compose("down", "-v"), lab)
+        lab.state_path.unlink(missing_ok=True)
+    _run("quickstart", lab.compose("up", "-d"), lab)
+
+
+def _wait_ready(lab: Lab) -> None:
+    waited = poll_until(lambda: _controller_ready(lab), timeout=180, what="Ziti controller")
+    print(f"[demo:ready] controller is up after {waited:.1f}s")
+
+
+def _login(lab: Lab) -> None:
+    api = lab.api
+    try:
+        # Validate the session (cached from an earlier run, or a fresh login) with a cheap call.
+        api.list("services", 'name="-"')
+    except ControllerError as e:
+        if e.status != 401:
+            raise
+        raise RuntimeError(
+            f"login to {lab.controller} as {api.config.username!r} failed: {e}. The quickstart keeps its admin "
+            "password in its volume, so changing ZITI_PWD later has no effect; rerun with ZITI_RESET=1 to start over."
+        ) from e
+    how = "logged in" if api.logins else "reusing the cached session"
+    print(f"[demo:login] {how} to {lab.controller} as {api.config.username}")
+
+
+def _create_identity(lab: Lab, name: str, role: str) -> None:
+    existing = _identity_id(lab, name)
+    local = lab.root / f"{name}.json"
+    known = lab.load_state().get(name)
+    if existing and known and known["id"] == existing and local.is_file() and known["sha256"] == _sha256(local):
+        lab.reused.add(name)
+        print(f"[demo:{name}] reusing enrolled identity {local.name} (unchanged)")
+        return
+    if existing:
+        lab.api.delete("identities", existing)
+    identity_id = lab.api.create("identities", identity(name, [role]).body)
+    (lab.root / f"{name}.jwt").write_text(lab.api.enrollment_jwt(identity_id))
+    lab.identity_ids[name] = identity_id
+    print(f"[demo:{name}] {'recreated' if existing else 'created'} identity {identity_id} (role: {role})")
+
+
+def _enroll(lab: Lab, name: str) -> None:
+    if name in lab.reused:
+        return
+    enroll((lab.root / f"{name}.jwt").read_text().strip(), lab.root / f"{name}.json")
+    print(f"[demo:enroll {name}] enrolled identity written to {name}.json")
+    if name in lab.identity_ids:
+        lab.remember(name, lab.identity_ids[name])
+
+
+def _service_and_policies(lab: Lab) -> None:
+    ids = lab.api.ids("identities", [lab.sentinel, lab.client])
+    [(service_id, created)] = lab.api.ensure([service(lab.service)])
+    print(f"[demo:policies] {'created' if created else 'exists'}: service {lab.service}")
+    # Patch existing policies too: a recreated identity has a new id.
+    policies = lab_policies(lab.service, service_id, ids[lab.sentinel], ids[lab.client])
+    for entity, (_, created) in zip(policies, lab.api.ensure(policies, update=True)):
+        print(f"[demo:policies] {'created' if created else 'updated'}: {entity.kind} {entity.name}")
+
+
+def _start_sentinel(lab: Lab) -> None:
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "zentry_trust_demo.cli",
+            "zitify-http-server",
+            "--identity",
+            f"{lab.sentinel}.json",
+            "--service",
+            lab.service,
+        ],
+        cwd=str(lab.root),
+    )
+    lab.sentinel_pid = proc.pid
+
+
+def _policy_advisor(lab: Lab) -> None:
+    try:
+        ids = lab.api.ids("identities", [lab.sentinel, lab.client])
+        service_id = lab.api.ids("services", [lab.service])[lab.service]
+        for name in (lab.sentinel, lab.client):
+            advice = lab.api.policy_advice(ids[name], service_id)
+            print(f"[demo:advisor] {format_advice(name, lab.service, advice)}")
+    except (ControllerError, KeyError) as e:
+        # Informational only; the lab is usable without it.
+        print(f"[demo] WARNING: policy-advisor failed; check your controller logs.\n{e}", file=sys.stderr)
+
+
+def bring_up(lab: Lab) -> RunReport:
+    """Stand up the quickstart lab as a dependency graph of steps.
+
+    Controller operations go straight to its management API (see
+    :class:`~zentry_trust_demo.controller.ManagementClient`) and identities are
+    enrolled with the SDK, so only starting the quickstart itself uses Docker.
+
+    Both identities are created and enrolled in parallel, the service and its
+    policies are created while enrollment is still running, and identities
+    that are still enrolled on the controller with an unchanged local JSON
+    are reused instead of recreated.
+    """
+    # Advertise an address reachable by whatever enrolls and uses the identities.
+    lab.env.setdefault("ZITI_CTRL_ADVERTISED_ADDRESS", "localhost")
+    lab.env.setdefault("ZITI_ROUTER_ADVERTISED_ADDRESS", lab.env["ZITI_CTRL_ADVERTISED_ADDRESS"])
+    s, c = lab.sentinel, lab.client
+    steps = [
+        Step("quickstart", lambda: _start_quickstart(lab)),
+        Step("controller ready", lambda: _wait_ready(lab), needs=("quickstart",)),
+        Step("login", lambda: _login(lab), needs=("controller ready",)),
+        Step(f"identity {s}", lambda: _create_identity(lab, s, "zentry.sentinel"), needs=("login",)),
+        Step(f"identity {c}", lambda: _create_identity(lab, c, "zentry.client"), needs=("login",)),
+        Step(f"enroll {s}", lambda: _enroll(lab, s), needs=(f"identity {s}",)),
+        Step(f"enroll {c}", lambda: _enroll(lab, c), needs=(f"identity {c}",)),
+        # Policies name the identities, so they only need them to exist, not to be enrolled.
+        Step("service + policies", lambda: _service_and_policies(lab), needs=(f"identity {s}", f"identity {c}")),
+        Step("sentinel server", lambda: _start_sentinel(lab), needs=(f"enroll {s}", "service + policies")),
+        Step("policy advisor", lambda: _policy_advisor(lab), needs=("service + policies",)),
+    ]
+    try:
+        return run_steps(steps)
+    finally:
+        lab.close()
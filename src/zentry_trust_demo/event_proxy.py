@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import itertools
+import os
+import selectors
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import openziti
+
+from zentry_trust_demo.admission import DialGate, DialRejected, client_key, gated, reject_connection
+from zentry_trust_demo.balancer import BalancerConfig, Lease, Upstreams
+from zentry_trust_demo.compression import Codec, offer_compression
+from zentry_trust_demo.deadlines import Reaper, Timeouts, Watch
+from zentry_trust_demo.metrics import Connection, ProxyMetrics
+from zentry_trust_demo.relay import DEFAULT_BUFFER_SIZE, Relay, sync_interest
+from zentry_trust_demo.routing import RoutingTable, sniff
+from zentry_trust_demo.ziti_pool import ZitiConnectionPool
+
+
+class _Loop:
+    """A selector (epoll on Linux) multiplexing many relays on one thread.
+
+    Deadlines are not checked here: the proxy's :class:`Reaper` shuts down the
+    sockets of an expired relay, and the loop closes it on the resulting EOF.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        metrics: ProxyMetrics,
+        reaper: Reaper,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        forwarding: str = "buffered",
+        codec: Codec | None = None,
+    ) -> None:
+        self.selector = selectors.DefaultSelector()
+        self.metrics = metrics
+        self.reaper = reaper
+        self.forwarding = forwarding
+        self.codec = codec
+        self.connections: dict[Relay, tuple[Connection, Watch, Lease]] = {}
+        # One receive buffer per loop: handlers run one at a time on this thread.
+        self._view = memoryview(bytearray(buffer_size))
+        self._inbox: deque[tuple[socket.socket, Lease, Connection, Watch]] = deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._stopping = False
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def submit(self, client: socket.socket, upstream: Lease, conn: Connection, watch: Watch) -> None:
+        """Hand a connected pair to this loop (safe to call from any thread)."""
+        self._inbox.append((client, upstream, conn, watch))
+        self._wake()
+
+    def stop(self) -> None:
+        """Make the loop close every connection it carries and return (safe to call from any thread)."""
+        self._stopping = True
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # a wakeup is already pending
+
+    def run(self) -> None:
+        try:
+            while not self._stopping:
+                for key, mask in self.selector.select(timeout=1.0):
+                    if key.data is None:
+                        self._adopt()
+                    else:
+                        self._on_event(key.data, key.fileobj, mask)  # type: ignore[arg-type]
+        finally:
+            self._adopt()  # pairs submitted meanwhile are closed with the rest
+            for r in list(self.connections):
+                self._close(r)
+            self.selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _adopt(self) -> None:
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._inbox:
+            client, lease, conn, watch = self._inbox.popleft()
+            r = Relay(client, lease.sock, forwarding=self.forwarding, codec=self.codec)
+            self.metrics.dialed(conn, r, lease.service)
+            self.reaper.connected(watch, r)
+            self.connections[r] = conn, watch, lease
+            for sock in r.sockets:
+                sync_interest(self.selector, sock, r.interest(sock), r)
+
+    def _on_event(self, r: Relay, sock: socket.socket, mask: int) -> None:
+        entry = self.connections.get(r)
+        if entry is None:
+            return  # closed while handling an earlier event of the same select() batch
+        try:
+            r.on_event(sock, mask, self._view)
+        except OSError as e:
+            if not entry[1].expired:
+                self.metrics.error("relay", e, entry[0])
+            self._close(r)
+            return
+        if r.finished:
+            self._close(r)
+            return
+        for s in r.sockets:
+            sync_interest(self.selector, s, r.interest(s), r)
+
+    def _close(self, r: Relay) -> None:
+        entry = self.connections.pop(r, None)
+        if entry is not None:
+            conn, watch, lease = entry
+            self.reaper.release(watch)
+            lease.release(r.directions[1].first_byte_at)
+            self.metrics.closed(conn)
+        for sock in r.sockets:
+            sync_interest(self.selector, sock, 0)
+            sock.close()
+        r.close()
+
+
+def serve_event_loop_proxy(
+    ctx: openziti.ZitiContext,
+    service: str,
+    listener: socket.socket,
+    pools: dict[str, ZitiConnectionPool] | None = None,
+    loops: int = 1,
+    dial_workers: int = 32,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    forwarding: str = "buffered",
+    metrics: ProxyMetrics | None = None,
+    routes: RoutingTable | None = None,
+    gate: DialGate | None = None,
+    reaper: Reaper | None = None,
+    upstreams: Upstreams | None = None,
+    codec: Codec | None = None,
+    stop: threading.Event | None = None,
+) -> None:
+    """Forward every accepted connection over Ziti using ``loops`` event loops.
+
+    Instead of one thread per browser connection, all client/Ziti relays
+    are multiplexed on a small fixed set of selector threads (``loops <= 0``
+    means one per CPU). Only the dial itself (``ctx.connect`` is blocking) runs
+    on a bounded thread pool, as does peeking at the first bytes when
+    ``routes`` picks the service per connection.
+
+    With a ``gate``, connections waiting for a dial slot each hold a dial
+    thread, so the pool is sized to the gate's in-flight cap plus its queue.
+
+    Every connection's connect/idle/lifetime deadlines are tracked by
+    ``reaper`` (by default one with the standard :class:`Timeouts`). The
+    replica to dial is chosen by ``upstreams`` (by default one group per
+    routed service). With a ``codec``, the dial thread also negotiates
+    compressed framing, and the loops encode and decode it.
+
+    Once ``stop`` is set, the function returns when ``accept`` next fails:
+    the caller shuts ``listener`` down to make that happen right away. The
+    loops close the connections they still carry and exit before it returns,
+    as does the default reaper; a ``reaper`` passed in is left to the caller.
+    """
+    if loops <= 0:
+        loops = os.cpu_count() or 1
+    metrics = metrics or ProxyMetrics()
+    own_reaper = reaper is None
+    reaper = reaper or Reaper(Timeouts(), metrics)
+    upstreams = upstreams or Upstreams(routes.services if routes is not None else [service], BalancerConfig())
+    if gate is not None:
+        dial_workers = max(dial_workers, gate.config.max_dials + gate.config.queue_size)
+    workers = [_Loop(f"ziti-proxy-loop-{i}", metrics, reaper, buffer_size, forwarding, codec) for i in range(loops)]
+    for loop in workers:
+        loop.thread.start()
+    next_loop = itertools.cycle(workers)
+
+    def connect(name: str) -> socket.socket:
+        pool = (pools or {}).get(name)
+        sock = pool.acquire() if pool is not None else ctx.connect(name)
+        return offer_compression(sock, codec) if codec is not None else sock
+
+    def dial(client: socket.socket, conn: Connection, watch: Watch) -> None:
+        def drop(stage: str, error: BaseException | str) -> None:
+            # An expired watch was already counted by the reaper.
+            if not watch.expired:
+                metrics.error(stage, error, conn)
+            reaper.release(watch)
+            metrics.closed(conn)
+            client.close()
+
+        hello = None
+        target: str | None = service
+        if routes is not None:
+            hello = sniff(client)
+            target = routes.route(hello)
+        if target is None:
+            drop("route", "NoRoute")
+            return
+        http = hello is None or hello.protocol != "tls"
+        try:
+            with gated(gate, client_key(client)):
+                metrics.mark(conn, "dial_start")
+                lease = upstreams[target].connect(connect)
+                metrics.mark(conn, "dial_end")  # not when a loop adopts it, which can be later
+        except DialRejected as e:
+            reject_connection(client, http=http)
+            drop("admission", e.reason)
+            return
+        except Exception as e:
+            if not watch.expired:
+                reject_connection(client, http=http, status=502)
+            drop("dial", e)
+            return
+        if watch.expired:
+            lease.sock.close()  # the client was given up on while we dialed
+            lease.release()
+            drop("dial", watch.expired)
+            return
+        next(next_loop).submit(client, lease, conn, watch)
+
+    try:
+        with ThreadPoolExecutor(max_workers=dial_workers, thread_name_prefix="ziti-dial") as dialer:
+            while True:
+                try:
+                    client, _addr = listener.accept()
+                except OSError:
+                    if stop is not None and stop.is_set():
+                        return
+                    raise
+                conn = metrics.opened()
+                dialer.submit(dial, client, conn, reaper.watch(client, conn=conn))
+    finally:
+        # Leaving the executor waited for dials in flight, so every connection is now on a loop.
+        for loop in workers:
+            loop.stop()
+        for loop in workers:
+            loop.thread.join()
+        if own_reaper:
+            reaper.close()
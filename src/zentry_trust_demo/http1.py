@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass
+from typing import Iterator
+
+_MAX_LINE = 64 * 1024
+_MAX_HEADERS = 100
+
+
+class HttpProtocolError(ValueError):
+    """The peer sent something that is not valid HTTP/1.x."""
+
+
+# Headers that describe one connection rather than the message (RFC 9110 7.6.1);
+# a proxy must not forward them.
+HOP_BY_HOP = frozenset(
+    {
+        "connection",
+        "keep-alive",
+        "proxy-connection",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailer",
+        "transfer-encoding",
+        "upgrade",
+    }
+)
+
+
+class _Head:
+    """Header lookups and body framing shared by request and response heads."""
+
+    headers: list[tuple[str, str]]
+
+    def header(self, name: str, default: str | None = None) -> str | None:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    @property
+    def chunked(self) -> bool:
+        te = self.header("transfer-encoding", "") or ""
+        return "chunked" in te.lower()
+
+    @property
+    def content_length(self) -> int | None:
+        value = self.header("content-length")
+        if value is None or self.chunked:
+            return None
+        try:
+            n = int(value)
+        except ValueError:
+            raise HttpProtocolError(f"bad Content-Length: {value!r}") from None
+        if n < 0:
+            raise HttpProtocolError(f"bad Content-Length: {value!r}")
+        return n
+
+    def end_to_end_headers(self) -> list[tuple[str, str]]:
+        """Headers minus hop-by-hop ones (including any named in ``Connection``)."""
+        listed = {t.strip().lower() for t in (self.header("connection", "") or "").split(",")}
+        drop = HOP_BY_HOP | listed
+        return [(k, v) for k, v in self.headers if k.lower() not in drop]
+
+
+@dataclass
+class ResponseHead(_Head):
+    version: str
+    status: int
+    reason: str
+    headers: list[tuple[str, str]]
+    raw: bytes
+    request_method: str = "GET"
+
+    @property
+    def has_body(self) -> bool:
+        return not (self.request_method == "HEAD" or 100 <= self.status < 200 or self.status in (204, 304))
+
+    @property
+    def delimited(self) -> bool:
+        """True if the body length is known without waiting for EOF."""
+        return not self.has_body or self.chunked or self.content_length is not None
+
+    @property
+    def keep_alive(self) -> bool:
+        """Whether the connection can carry another request after this response."""
+        conn = (self.header("connection", "") or "").lower()
+        if "close" in conn or not self.delimited:
+            return False
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in conn
+        return True
+
+
+@dataclass
+class RequestHead(_Head):
+    method: str
+    target: str
+    version: str
+    headers: list[tuple[str, str]]
+    raw: bytes
+
+    @property
+    def has_body(self) -> bool:
+        # Unlike responses, a request without framing headers has no body.
+        return self.chunked or bool(self.content_length)
+
+    @property
+    def keep_alive(self) -> bool:
+        conn = (self.header("connection", "") or "").lower()
+        if "close" in conn:
+            return False
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in conn
+        return True
+
+
+@dataclass
+class HttpResponse:
+    head: ResponseHead
+    body: bytes
+
+    @property
+    def status(self) -> int:
+        return self.head.status
+
+    def header(self, name: str, default: str | None = None) -> str | None:
+        return self.head.header(name, default)
+
+
+def _readline(rfile: io.BufferedReader) -> bytes:
+    line = rfile.readline(_MAX_LINE + 1)
+    if len(line) > _MAX_LINE:
+        raise HttpProtocolError("header line too long")
+    return line
+
+
+def read_headers(rfile: io.BufferedReader) -> tuple[list[tuple[str, str]], bytes]:
+    """Read header lines up to the blank line; return them and their raw bytes."""
+    headers: list[tuple[str, str]] = []
+    raw = bytearray()
+    while True:
+        line = _readline(rfile)
+        raw += line
+        if line in (b"\r\n", b"\n"):
+            return headers, bytes(raw)
+        if not line:
+            raise ConnectionError("connection closed inside HTTP headers")
+        if len(headers) >= _MAX_HEADERS:
+            raise HttpProtocolError("too many headers")
+        name, sep, value = line.decode("latin-1").partition(":")
+        if not sep:
+            raise HttpProtocolError(f"malformed header line: {line!r}")
+        headers.append((name.strip(), value.strip()))
+
+
+def read_response_head(rfile: io.BufferedReader, method: str = "GET") -> ResponseHead:
+    """Read a status line and headers, skipping interim 1xx responses."""
+    while True:
+        line = _readline(rfile)
+        if not line:
+            raise ConnectionError("connection closed before HTTP response")
+        version, _, rest = line.decode("latin-1").rstrip("\r\n").partition(" ")
+        code, _, reason = rest.partition(" ")
+        if not version.startswith("HTTP/1.") or not code.isdigit():
+            raise HttpProtocolError(f"malformed status line: {line!r}")
+        headers, raw_headers = read_headers(rfile)
+        head = ResponseHead(version, int(code), reason, headers, line + raw_headers, method.upper())
+        if 100 <= head.status < 200 and head.status != 101:
+            continue
+        return head
+
+
+def read_request_head(rfile: io.BufferedReader) -> RequestHead | None:
+    """Read a request line and headers; None if the client closed between requests."""
+    while True:
+        line = _readline(rfile)
+        if not line:
+            return None
+        if line not in (b"\r\n", b"\n"):  # tolerate stray CRLF between requests
+            break
+    parts = line.decode("latin-1").rstrip("\r\n").split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        raise HttpProtocolError(f"malformed request line: {line!r}")
+    method, target, version = parts
+    headers, raw_headers = read_headers(rfile)
+    return RequestHead(method.upper(), target, version, headers, line + raw_headers)
+
+
+def iter_body(
+    rfile: io.BufferedReader,
+    head: RequestHead | ResponseHead,
+    chunk_size: int = 64 * 1024,
+) -> Iterator[bytes]:
+    """Yield the decoded body of ``head`` without buffering all of it.
+
+    Honours chunked transfer coding and Content-Length; otherwise a response
+    body runs until the server closes the connection.
+    """
+    if not head.has_body:
+        return
+    if head.chunked:
+        while True:
+            size_line = _readline(rfile)
+            if not size_line:
+                raise ConnectionError("connection closed inside chunked body")
+            try:
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise HttpProtocolError(f"bad chunk size line: {size_line!r}") from None
+            if size == 0:
+                read_headers(rfile)  # trailers
+                return
+            while size:
+                data = rfile.read(min(size, chunk_size))
+                if not data:
+                    raise ConnectionError("connection closed inside chunk")
+                size -= len(data)
+                yield data
+            _readline(rfile)  # CRLF after chunk data
+        return
+    remaining = head.content_length
+    if remaining is None:
+        while True:
+            data = rfile.read1(chunk_size)
+            if not data:
+                return
+            yield data
+    while remaining:
+        data = rfile.read1(min(remaining, chunk_size))
+        if not data:
+            raise ConnectionError(f"connection closed with {remaining} body bytes outstanding")
+        remaining -= len(data)
+        yield data
+
+
+def read_response(rfile: io.BufferedReader, method: str = "GET") -> HttpResponse:
+    head = read_response_head(rfile, method)
+    return HttpResponse(head, b"".join(iter_body(rfile, head)))
+
+
+def format_head(start_line: str, headers: list[tuple[str, str]]) -> bytes:
+    lines = [start_line] + [f"{name}: {value}" for name, value in headers]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def encode_chunk(data: bytes) -> bytes:
+    """Frame ``data`` as one chunk; an empty ``data`` yields the last-chunk marker."""
+    if not data:
+        return b"0\r\n\r\n"
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+def format_request(
+    method: str,
+    path: str,
+    host: str,
+    headers: dict[str, str] | None = None,
+    body: bytes = b"",
+) -> bytes:
+    if not path.startswith("/"):
+        path = "/" + path
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}"]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    if body or method in ("POST", "PUT", "PATCH"):
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
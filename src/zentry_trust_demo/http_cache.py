@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import email.utils
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable
+
+from zentry_trust_demo.http1 import RequestHead, ResponseHead
+
+# Statuses a cache may store when the response carries explicit freshness.
+CACHEABLE_STATUSES = frozenset({200, 203, 301, 404, 410})
+
+# (Host, request target, Accept-Encoding): one proxy may front several sites.
+CacheKey = tuple[str, str, str]
+
+# Headers refreshed from a 304 onto the stored response (RFC 9111 4.3.4).
+_REFRESHED = ("cache-control", "date", "etag", "expires", "last-modified", "vary")
+
+
+def parse_cache_control(value: str | None) -> dict[str, str | None]:
+    """``"max-age=60, no-cache"`` -> ``{"max-age": "60", "no-cache": None}``."""
+    directives: dict[str, str | None] = {}
+    for part in (value or "").split(","):
+        name, sep, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def _seconds(value: str | None) -> float | None:
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _http_date(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class CacheEntry:
+    status: int
+    reason: str
+    headers: list[tuple[str, str]]  # end-to-end headers, without Content-Length
+    body: bytes
+    stored_at: float  # monotonic
+    fresh_for: float
+    initial_age: float = 0.0
+
+    @classmethod
+    def from_response(cls, head: ResponseHead, body: bytes) -> "CacheEntry":
+        return cls(
+            status=head.status,
+            reason=head.reason,
+            headers=[(k, v) for k, v in head.end_to_end_headers() if k.lower() != "content-length"],
+            body=body,
+            stored_at=time.monotonic(),
+            fresh_for=freshness(head) or 0.0,
+            initial_age=_seconds(head.header("age")) or 0.0,
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+    def header(self, name: str) -> str | None:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def age(self) -> float:
+        return self.initial_age + time.monotonic() - self.stored_at
+
+    def is_fresh(self) -> bool:
+        return self.age() < self.fresh_for
+
+    def refresh(self, head: ResponseHead) -> None:
+        """Apply a 304 from upstream: new validators and freshness, same body."""
+        updates = {k.lower(): (k, v) for k, v in head.headers if k.lower() in _REFRESHED}
+        self.headers = [kv for kv in self.headers if kv[0].lower() not in updates] + list(updates.values())
+        self.stored_at = time.monotonic()
+        self.initial_age = _seconds(head.header("age")) or 0.0
+        self.fresh_for = freshness(head) or 0.0
+
+    def conditional_headers(self) -> list[tuple[str, str]]:
+        out = []
+        etag = self.header("etag")
+        if etag:
+            out.append(("If-None-Match", etag))
+        modified = self.header("last-modified")
+        if modified:
+            out.append(("If-Modified-Since", modified))
+        return out
+
+    def not_modified_for(self, request: RequestHead) -> bool:
+        """True if the client's own conditional request matches this entry."""
+        etag = self.header("etag")
+        inm = request.header("if-none-match")
+        if inm is not None:
+            if not etag:
+                return False
+            weak = etag.removeprefix("W/")
+            return any(t.strip() in ("*", etag, weak, "W/" + weak) for t in inm.split(","))
+        since = _http_date(request.header("if-modified-since"))
+        modified = _http_date(self.header("last-modified"))
+        return since is not None and modified is not None and modified <= since
+
+
+def freshness(head: ResponseHead) -> float | None:
+    """Seconds the response may be served without revalidation, if it says so."""
+    cc = parse_cache_control(head.header("cache-control"))
+    if "no-cache" in cc:
+        return 0.0
+    for directive in ("s-maxage", "max-age"):
+        if directive in cc:
+            return _seconds(cc[directive])
+    expires = _http_date(head.header("expires"))
+    if expires is not None:
+        date = _http_date(head.header("date")) or time.time()
+        return max(0.0, expires - date)
+    return None
+
+
+def request_cacheable(request: RequestHead) -> bool:
+    if request.method not in ("GET", "HEAD") or request.has_body:
+        return False
+    if request.header("authorization") is not None or request.header("range") is not None:
+        return False
+    return "no-store" not in parse_cache_control(request.header("cache-control"))
+
+
+def response_storable(head: ResponseHead) -> bool:
+    """May a shared cache store this response (RFC 9111 3, conservatively)?"""
+    if head.status not in CACHEABLE_STATUSES:
+        return False
+    cc = parse_cache_control(head.header("cache-control"))
+    if "no-store" in cc or "private" in cc:
+        return False
+    if head.header("set-cookie") is not None:
+        return False
+    vary = {v.strip().lower() for v in (head.header("vary") or "").split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return False
+    has_validator = head.header("etag") is not None or head.header("last-modified") is not None
+    return freshness(head) is not None or (head.status == 200 and has_validator)
+
+
+def request_wants_revalidation(request: RequestHead) -> bool:
+    cc = parse_cache_control(request.header("cache-control"))
+    return "no-cache" in cc or cc.get("max-age", "") == "0" or (request.header("pragma") or "") == "no-cache"
+
+
+@dataclass
+class _Flight:
+    done: threading.Event = field(default_factory=threading.Event)
+    entry: CacheEntry | None = None
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    revalidated: int = 0
+    stored: int = 0
+    evicted: int = 0
+    collapsed: int = 0
+
+
+class ResponseCache:
+    """Size-bounded LRU of complete GET responses, keyed by request target.
+
+    ``fetch`` collapses concurrent misses for the same key: one caller (the
+    leader) goes upstream while the others wait for its result.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int) -> None:
+        if max_entry_bytes > max_bytes:
+            max_entry_bytes = max_bytes
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.stats = CacheStats()
+        self._entries: OrderedDict[CacheKey, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._flights: dict[CacheKey, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def note(self, result: str) -> None:
+        """Count a ``hits``/``misses``/``revalidated`` outcome."""
+        with self._lock:
+            setattr(self.stats, result, getattr(self.stats, result) + 1)
+
+    @staticmethod
+    def key(request: RequestHead) -> CacheKey:
+        # Representations may differ by encoding, so that is part of the key.
+        host = (request.header("host", "") or "").lower()
+        return host, request.target, request.header("accept-encoding", "") or ""
+
+    def get(self, key: CacheKey) -> CacheEntry | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: CacheKey, entry: CacheEntry) -> None:
+        if entry.size > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self.stats.stored += 1
+            self._evict()
+
+    def resize(self, key: CacheKey, entry: CacheEntry, old_size: int) -> None:
+        """Account for ``entry`` having grown or shrunk in place (e.g. new headers from a 304)."""
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._bytes += entry.size - old_size
+                self._evict()
+
+    def _evict(self) -> None:
+        # Least recently used first; the caller holds the lock.
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.stats.evicted += 1
+
+    def invalidate(self, request: RequestHead) -> None:
+        """Drop every variant of the request's target (after an unsafe request to it)."""
+        host, target, _ = self.key(request)
+        with self._lock:
+            for key in [k for k in self._entries if k[:2] == (host, target)]:
+                self._bytes -= self._entries.pop(key).size
+
+    def fetch(
+        self,
+        key: CacheKey,
+        load: Callable[[CacheEntry | None], CacheEntry | None],
+        stale: CacheEntry | None,
+    ) -> tuple[CacheEntry | None, bool]:
+        """Run ``load(stale)`` once per key at a time and share its result.
+
+        Returns ``(entry, leader)``. ``load`` returns the entry to serve (and
+        stores it itself if storable) or None when the response could not be
+        shared, in which case followers must fetch on their own.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.stats.collapsed += 1
+        assert flight is not None
+        if not leader:
+            flight.done.wait()
+            return flight.entry, False
+        try:
+            flight.entry = load(stale)
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.entry, True
+
+    def render(self) -> list[str]:
+        """Prometheus lines for the proxy's ``/metrics`` endpoint."""
+        with self._lock:
+            size, count = self._bytes, len(self._entries)
+        s = self.stats
+        return [
+            "# HELP zentry_proxy_cache_requests_total Cacheable requests, by outcome.",
+            "# TYPE zentry_proxy_cache_requests_total counter",
+            f'zentry_proxy_cache_requests_total{{result="hit"}} {s.hits}',
+            f'zentry_proxy_cache_requests_total{{result="miss"}} {s.misses}',
+            f'zentry_proxy_cache_requests_total{{result="revalidated"}} {s.revalidated}',
+            f'zentry_proxy_cache_requests_total{{result="collapsed"}} {s.collapsed}',
+            "# HELP zentry_proxy_cache_evictions_total Entries dropped to stay under the size limit.",
+            "# TYPE zentry_proxy_cache_evictions_total counter",
+            f"zentry_proxy_cache_evictions_total {s.evicted}",
+            "# HELP zentry_proxy_cache_bytes Bytes held by the response cache.",
+            "# TYPE zentry_proxy_cache_bytes gauge",
+            f"zentry_proxy_cache_bytes {size}",
+            "# HELP zentry_proxy_cache_entries Responses held by the response cache.",
+            "# TYPE zentry_proxy_cache_entries gauge",
+            f"zentry_proxy_cache_entries {count}",
+        ]
@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import socketserver
+import time
+from typing import Iterable, Iterator
+
+from zentry_trust_demo.admission import DialRejected, gated
+from zentry_trust_demo.deadlines import Watch
+from zentry_trust_demo.http1 import (
+    HttpProtocolError,
+    RequestHead,
+    encode_chunk,
+    format_head,
+    iter_body,
+    read_request_head,
+)
+from zentry_trust_demo.http_cache import (
+    CacheEntry,
+    ResponseCache,
+    request_cacheable,
+    request_wants_revalidation,
+    response_storable,
+)
+from zentry_trust_demo.relay import Relay, run_relay
+from zentry_trust_demo.ziti_http_client import StreamingResponse
+
+_SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "TRACE"})
+
+# The client's own validators are answered from the cache; the fill request
+# must not carry them, since it needs the full body to store.
+_CLIENT_CONDITIONALS = frozenset({"if-none-match", "if-modified-since"})
+
+# Stored headers repeated on a 304 to the client (RFC 9110 15.4.5).
+_NOT_MODIFIED_HEADERS = frozenset({"cache-control", "content-location", "date", "etag", "expires", "vary"})
+
+
+def _chunked(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    for chunk in chunks:
+        if chunk:
+            yield encode_chunk(chunk)
+    yield encode_chunk(b"")
+
+
+def _without(headers: list[tuple[str, str]], name: str) -> list[tuple[str, str]]:
+    return [(k, v) for k, v in headers if k.lower() != name]
+
+
+class L7ProxyHandler(socketserver.StreamRequestHandler):
+    """HTTP-aware proxy: parses each request and forwards it over pooled Ziti connections.
+
+    Unlike the TCP mode, a browser connection is not pinned to one Ziti
+    connection: each request borrows a kept-alive one from the server's
+    ``ZitiHttpClient``. With a cache configured, GET/HEAD responses that allow
+    it are served locally while fresh and revalidated with a conditional
+    request once stale. Upgrades and CONNECT become a raw tunnel, whose
+    deadlines the server's reaper enforces like TCP mode's.
+    """
+
+    disable_nagle_algorithm = True
+
+    def setup(self) -> None:
+        # Idle keep-alive clients (and upstreams, in the client) time out on the socket.
+        self.timeout = self.server.reaper.timeouts.idle or None  # type: ignore[attr-defined]
+        super().setup()
+
+    def handle(self) -> None:  # type: ignore[override]
+        server = self.server
+        self.client = server.client  # type: ignore[attr-defined]
+        self.service = server.service  # type: ignore[attr-defined]
+        routes = server.routes  # type: ignore[attr-defined]
+        self.cache: ResponseCache | None = server.cache  # type: ignore[attr-defined]
+        metrics = server.metrics  # type: ignore[attr-defined]
+
+        self.conn = metrics.opened()
+        self._responded = False
+        try:
+            while True:
+                try:
+                    req = read_request_head(self.rfile)
+                except HttpProtocolError as e:
+                    metrics.error("request", e, self.conn)
+                    self._send_error(400, "Bad Request")
+                    return
+                if req is None:
+                    return
+                metrics.mark(self.conn, "first_request")
+                self._responded = False
+                if routes is not None:
+                    # Unlike TCP mode, every request on the connection is routed on its own.
+                    service = routes.for_http(req.header("host"), req.target)
+                    if service is None:
+                        metrics.error("route", "NoRoute", self.conn)
+                        self._send_error(404, "Not Found")
+                        return
+                    self.service = service
+                if req.method == "CONNECT" or req.header("upgrade") is not None:
+                    self._tunnel(req)
+                    return
+                try:
+                    keep = self._serve(req)
+                except DialRejected as e:
+                    metrics.error("admission", e.reason, self.conn)
+                    if not self._responded:
+                        self._send_error(503, "Service Unavailable")
+                    return
+                except (OSError, HttpProtocolError) as e:
+                    metrics.error("upstream", e, self.conn)
+                    if not self._responded:
+                        self._send_error(502, "Bad Gateway")
+                    return
+                if not keep:
+                    return
+        except OSError as e:
+            metrics.error("client", e, self.conn)
+        finally:
+            metrics.closed(self.conn)
+
+    def _write(self, data: bytes) -> None:
+        if not self._responded:
+            self._responded = True
+            if not self.conn.first_byte_at:
+                self.conn.first_byte_at = time.monotonic()
+        self.conn.moved[1] += len(data)
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, reason: str) -> None:
+        body = f"{status} {reason}\n".encode()
+        headers = [("Content-Type", "text/plain"), ("Content-Length", str(len(body))), ("Connection", "close")]
+        try:
+            self._write(format_head(f"HTTP/1.1 {status} {reason}", headers) + body)
+        except OSError:
+            pass
+
+    def _exchange(
+        self,
+        req: RequestHead,
+        method: str,
+        drop: frozenset[str] = frozenset(),
+        extra: list[tuple[str, str]] | None = None,
+    ) -> StreamingResponse:
+        headers = [(k, v) for k, v in req.end_to_end_headers() if k.lower() not in drop]
+        body: bytes | Iterable[bytes] = b""
+        if req.has_body:
+            body = iter_body(self.rfile, req)
+            if req.chunked:
+                headers = _without(headers, "content-length") + [("Transfer-Encoding", "chunked")]
+                body = _chunked(body)
+        head = format_head(f"{method} {req.target} HTTP/1.1", headers + (extra or []))
+        self.conn.moved[0] += len(head) + (req.content_length or 0)
+        return self.client.exchange(
+            self.service,
+            head,
+            body,
+            method=method,
+            origin=self.client_address[0],
+            trace=self.conn.trace,
+        )
+
+    def _serve(self, req: RequestHead) -> bool:
+        """Answer one request; return whether the client connection stays open."""
+        if self.cache is not None and request_cacheable(req):
+            return self._serve_cacheable(req)
+        resp = self._exchange(req, req.method)
+        keep = self._relay(req, resp)
+        if self.cache is not None and req.method not in _SAFE_METHODS and resp.status < 400:
+            self.cache.invalidate(req)
+        return keep
+
+    def _relay(
+        self,
+        req: RequestHead,
+        resp: StreamingResponse,
+        prefix: bytes = b"",
+        rest: Iterator[bytes] | None = None,
+    ) -> bool:
+        """Stream ``resp`` to the client, resuming at ``rest`` after ``prefix`` if it was partly read.
+
+        Content-Length bodies pass through as-is; chunked or EOF-delimited ones
+        are re-chunked for HTTP/1.1 clients, and end the connection for 1.0 ones.
+        """
+        with resp:
+            headers = resp.head.end_to_end_headers()
+            keep = req.keep_alive
+            chunked = False
+            if resp.head.has_body and resp.head.content_length is None:
+                headers = _without(headers, "content-length")
+                chunked = req.version != "HTTP/1.0"
+                keep = keep and chunked
+                if chunked:
+                    headers.append(("Transfer-Encoding", "chunked"))
+            headers.append(("Connection", "keep-alive" if keep else "close"))
+            self._write(format_head(f"HTTP/1.1 {resp.status} {resp.head.reason}", headers))
+            if not resp.head.has_body:
+                return keep
+
+            def body() -> Iterator[bytes]:
+                if prefix:
+                    yield prefix
+                yield from rest if rest is not None else resp
+
+            for data in _chunked(body()) if chunked else body():
+                self._write(data)
+            return keep
+
+    def _serve_cacheable(self, req: RequestHead) -> bool:
+        cache = self.cache
+        assert cache is not None
+        key = cache.key(req)
+        stale = cache.get(key)
+        if stale is not None and stale.is_fresh() and not request_wants_revalidation(req):
+            cache.note("hits")
+            return self._send_entry(req, stale, "HIT")
+        if req.method == "HEAD":
+            # Filling the cache would mean fetching a body nobody asked for.
+            return self._relay(req, self._exchange(req, "HEAD"))
+
+        # What the leader read but could not store, to finish for its own client.
+        unshared: tuple[StreamingResponse, bytes, Iterator[bytes] | None] | None = None
+
+        def load(stale: CacheEntry | None) -> CacheEntry | None:
+            nonlocal unshared
+            extra = stale.conditional_headers() if stale is not None else []
+            resp = self._exchange(req, "GET", _CLIENT_CONDITIONALS, extra)
+            if resp.status == 304 and stale is not None:
+                resp.close()
+                old_size = stale.size
+                stale.refresh(resp.head)
+                cache.resize(key, stale, old_size)
+                cache.note("revalidated")
+                return stale
+            cache.note("misses")
+            if not response_storable(resp.head) or (resp.head.content_length or 0) > cache.max_entry_bytes:
+                unshared = (resp, b"", None)
+                return None
+            body = bytearray()
+            chunks = iter(resp)
+            for data in chunks:
+                body += data
+                if len(body) > cache.max_entry_bytes:
+                    unshared = (resp, bytes(body), chunks)
+                    return None
+            entry = CacheEntry.from_response(resp.head, bytes(body))
+            cache.put(key, entry)
+            return entry
+
+        entry, leader = cache.fetch(key, load, stale)
+        if entry is not None:
+            return self._send_entry(req, entry, "REVALIDATED" if entry is stale else "MISS")
+        if unshared is not None:
+            return self._relay(req, *unshared)
+        # The leader's response could not be shared; go upstream ourselves.
+        return self._relay(req, self._exchange(req, req.method))
+
+    def _send_entry(self, req: RequestHead, entry: CacheEntry, outcome: str) -> bool:
+        if entry.not_modified_for(req):
+            headers = [(k, v) for k, v in entry.headers if k.lower() in _NOT_MODIFIED_HEADERS]
+            status, reason, body = 304, "Not Modified", b""
+        else:
+            headers = _without(entry.headers, "age") + [("Content-Length", str(len(entry.body)))]
+            status, reason, body = entry.status, entry.reason, entry.body
+        keep = req.keep_alive
+        headers += [
+            ("Age", str(int(entry.age()))),
+            ("X-Cache", outcome),
+            ("Connection", "keep-alive" if keep else "close"),
+        ]
+        self._write(format_head(f"HTTP/1.1 {status} {reason}", headers))
+        if body and req.method != "HEAD":
+            self._write(body)
+        return keep
+
+    def _tunnel(self, req: RequestHead) -> None:
+        """Hand the rest of the connection to a dedicated Ziti connection, byte for byte."""
+        reaper = self.server.reaper  # type: ignore[attr-defined]
+        watch = reaper.watch(self.connection, time.monotonic(), self.conn)  # deadlines run from the upgrade
+        try:
+            self._tunnel_watched(req, watch)
+        finally:
+            reaper.release(watch)
+
+    def _tunnel_watched(self, req: RequestHead, watch: Watch) -> None:
+        server = self.server
+        metrics = server.metrics  # type: ignore[attr-defined]
+        try:
+            with gated(self.client.gate, self.client_address[0]):
+                metrics.mark(self.conn, "dial_start")
+                lease = server.upstreams[self.service].connect(server.dial)  # type: ignore[attr-defined]
+            if self.conn.trace is not None:
+                self.conn.trace.mark("dial_end")
+                self.conn.trace.note(service=lease.service)
+        except DialRejected as e:
+            metrics.error("admission", e.reason, self.conn)
+            self._send_error(503, "Service Unavailable")
+            return
+        except Exception as e:
+            if not watch.expired:
+                metrics.error("dial", e, self.conn)
+                self._send_error(502, "Bad Gateway")
+            return
+        first_byte_at = 0.0
+        try:
+            with lease.sock as zsock:
+                if watch.expired:
+                    return
+                # Whatever the client sent after the head may already sit in rfile's
+                # buffer; the relay only sees the socket, so queue it upstream first.
+                self.connection.setblocking(False)
+                try:
+                    early = self.rfile.read1(1 << 16) or b""
+                except OSError:
+                    early = b""
+                r = Relay(
+                    self.connection,
+                    zsock,
+                    forwarding=server.forwarding,  # type: ignore[attr-defined]
+                    codec=server.codec,  # type: ignore[attr-defined]
+                )
+                r.directions[0].push(req.raw + early)
+                server.reaper.connected(watch, r)  # type: ignore[attr-defined]
+                try:
+                    run_relay(r, idle_timeout=None, buffer_size=server.buffer_size)  # type: ignore[attr-defined]
+                except Exception as e:
+                    if not watch.expired:
+                        metrics.error("relay", e, self.conn)
+                metrics.trace_relay(self.conn, r)
+                up, down = r.directions
+                first_byte_at = down.first_byte_at
+                self.conn.moved[0] += up.moved
+                self.conn.moved[1] += down.moved
+                if down.first_byte_at and not self.conn.first_byte_at:
+                    self.conn.first_byte_at = down.first_byte_at
+        finally:
+            lease.release(first_byte_at)
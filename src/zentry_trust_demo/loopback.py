@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import socket
+
+
+class LoopbackContext:
+    """Offline stand-in for ``openziti.ZitiContext``.
+
+    ``connect(service)`` dials a local TCP address registered for ``service``,
+    so code written against a Ziti context (clients, the HTTP proxy) can be
+    exercised on loopback without a controller, edge router or identity.
+    """
+
+    def __init__(self, services: dict[str, tuple[str, int]] | None = None) -> None:
+        self.services: dict[str, tuple[str, int]] = dict(services or {})
+
+    def register(self, service: str, address: tuple[str, int]) -> None:
+        self.services[service] = address
+
+    def connect(self, addr: str, terminator: str | None = None) -> socket.socket:
+        try:
+            target = self.services[addr]
+        except KeyError:
+            raise ConnectionRefusedError(f"no loopback target registered for service {addr!r}") from None
+        return socket.create_connection(target)
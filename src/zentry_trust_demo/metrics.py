@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import bisect
+import http.server
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
+
+from zentry_trust_demo.relay import Relay
+
+if TYPE_CHECKING:
+    from zentry_trust_demo.tracing import Timeline, Tracer
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+# Relay(client, upstream) forwards directions[0] client->Ziti and directions[1] Ziti->client.
+DIRECTIONS = ("client_to_ziti", "ziti_to_client")
+
+
+@dataclass(frozen=True)
+class StatsConfig:
+    """Where proxy metrics are published.
+
+    ``port`` serves ``/metrics`` in Prometheus text format on ``host`` (None
+    disables it); ``interval`` > 0 prints a one-line summary that often.
+    """
+
+    port: int | None = None
+    host: str = "127.0.0.1"
+    interval: float = 0.0
+
+
+@dataclass
+class Snapshot:
+    active: int
+    total: int
+    bytes: dict[str, int]
+    errors: dict[tuple[str, str], int]
+    dial_mean: float
+    ttfb_mean: float
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense (not thread-safe)."""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def render(self, name: str) -> list[str]:
+        lines = []
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            running += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{le="{le}"}} {running}')
+        lines.append(f"{name}_sum {self.sum:.6f}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class Connection:
+    """One proxied connection, tracked from accept to close.
+
+    Byte counts and the first response byte come from ``relay`` when the
+    connection is relayed; otherwise the handler fills in ``moved`` and
+    ``first_byte_at`` itself. ``trace`` is its timeline when the proxy traces
+    connections and this one was sampled.
+    """
+
+    __slots__ = ("started", "relay", "moved", "first_byte_at", "trace")
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.relay: Relay | None = None
+        self.moved = [0, 0]
+        self.first_byte_at = 0.0
+        self.trace: Timeline | None = None
+
+    def counts(self) -> tuple[list[int], float]:
+        r = self.relay
+        if r is None:
+            return self.moved, self.first_byte_at
+        return [d.moved for d in r.directions], r.directions[1].first_byte_at
+
+
+class ProxyMetrics:
+    """Counters and histograms for the Ziti HTTP proxy.
+
+    Nothing here runs per chunk: byte counts live in each relay's directions
+    and are read when a connection closes (or, for live ones, when stats are
+    rendered). The lock is only taken a few times per connection.
+
+    With a ``tracer``, sampled connections also get a timeline (accept, dial,
+    first byte each way, half-closes, close) written when they close.
+    """
+
+    def __init__(self, tracer: Tracer | None = None) -> None:
+        self.tracer = tracer
+        self._lock = threading.Lock()
+        self._live: set[Connection] = set()
+        self.total = 0
+        self.bytes = dict.fromkeys(DIRECTIONS, 0)
+        self.errors: dict[tuple[str, str], int] = {}
+        self.dial = Histogram(LATENCY_BUCKETS)
+        self.ttfb = Histogram(LATENCY_BUCKETS)
+        self.duration = Histogram(DURATION_BUCKETS)
+        # Extra Prometheus lines appended by ``render`` (e.g. the response cache's).
+        self.collectors: list[Callable[[], list[str]]] = []
+        # Extra fields appended to the ``summary`` log line (e.g. the dial queue's).
+        self.summaries: list[Callable[[], str]] = []
+
+    def opened(self) -> Connection:
+        conn = Connection()
+        if self.tracer is not None:
+            conn.trace = self.tracer.start("accept", conn.started)
+        with self._lock:
+            self._live.add(conn)
+            self.total += 1
+        return conn
+
+    @staticmethod
+    def mark(conn: Connection, event: str) -> None:
+        """Add ``event`` to ``conn``'s timeline if it is traced (e.g. ``dial_start``)."""
+        if conn.trace is not None:
+            conn.trace.mark(event)
+
+    @staticmethod
+    def trace_relay(conn: Connection, relay: Relay) -> None:
+        """Add when ``relay`` first moved a byte and passed on EOF, each way, to ``conn``'s timeline."""
+        if conn.trace is None:
+            return
+        up, down = relay.directions
+        for event, at in (
+            ("first_upstream_byte", up.first_byte_at),
+            ("first_downstream_byte", down.first_byte_at),
+            ("client_half_close", up.done_at),
+            ("upstream_half_close", down.done_at),
+        ):
+            if at:
+                conn.trace.mark(event, at)
+
+    def dialed(self, conn: Connection, relay: Relay, service: str = "") -> None:
+        """The Ziti side is connected and ``relay`` now carries ``conn``."""
+        now = time.monotonic()
+        conn.relay = relay
+        if conn.trace is not None:
+            conn.trace.mark("dial_end", now)
+            conn.trace.note(service=service)
+        with self._lock:
+            self.dial.observe(now - conn.started)
+
+    def error(self, stage: str, exc: BaseException | str, conn: Connection | None = None) -> None:
+        kind = exc if isinstance(exc, str) else type(exc).__name__
+        if conn is not None and conn.trace is not None:
+            conn.trace.fields.setdefault("error", f"{stage}:{kind}")
+        with self._lock:
+            self.errors[stage, kind] = self.errors.get((stage, kind), 0) + 1
+
+    def closed(self, conn: Connection) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if conn not in self._live:
+                return
+            self._live.discard(conn)
+            self.duration.observe(now - conn.started)
+            moved, first = conn.counts()
+            for name, n in zip(DIRECTIONS, moved):
+                self.bytes[name] += n
+            if first:
+                self.ttfb.observe(first - conn.started)
+        if conn.trace is not None:
+            _finish_trace(conn, conn.trace, moved, now)
+
+    def snapshot(self) -> Snapshot:
+        with self._lock:
+            moved = dict(self.bytes)
+            for conn in self._live:
+                for name, n in zip(DIRECTIONS, conn.counts()[0]):
+                    moved[name] += n
+            return Snapshot(
+                active=len(self._live),
+                total=self.total,
+                bytes=moved,
+                errors=dict(self.errors),
+                dial_mean=self.dial.mean(),
+                ttfb_mean=self.ttfb.mean(),
+            )
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        out = [
+            "# HELP zentry_proxy_connections_active Client connections currently open.",
+            "# TYPE zentry_proxy_connections_active gauge",
+            f"zentry_proxy_connections_active {snap.active}",
+            "# HELP zentry_proxy_connections_total Client connections accepted.",
+            "# TYPE zentry_proxy_connections_total counter",
+            f"zentry_proxy_connections_total {snap.total}",
+            "# HELP zentry_proxy_bytes_total Bytes forwarded, by direction.",
+            "# TYPE zentry_proxy_bytes_total counter",
+        ]
+        for name, n in snap.bytes.items():
+            out.append(f'zentry_proxy_bytes_total{{direction="{name}"}} {n}')
+        out += [
+            "# HELP zentry_proxy_errors_total Failed connections, by stage and error class.",
+            "# TYPE zentry_proxy_errors_total counter",
+        ]
+        for (stage, kind), n in sorted(snap.errors.items()):
+            out.append(f'zentry_proxy_errors_total{{stage="{stage}",error="{kind}"}} {n}')
+        with self._lock:
+            for name, hist, help_text in (
+                ("zentry_proxy_dial_seconds", self.dial, "Time from accept until the Ziti connection is ready."),
+                ("zentry_proxy_ttfb_seconds", self.ttfb, "Time from accept until the first response byte."),
+                ("zentry_proxy_connection_seconds", self.duration, "Client connection lifetime."),
+            ):
+                out += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                out += hist.render(name)
+        for collect in self.collectors:
+            out += collect()
+        return "\n".join(out) + "\n"
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        line = (
+            f"active={snap.active} total={snap.total} "
+            f"in={snap.bytes['client_to_ziti'] / 1e6:.2f}MB out={snap.bytes['ziti_to_client'] / 1e6:.2f}MB "
+            f"dial={snap.dial_mean * 1e3:.1f}ms ttfb={snap.ttfb_mean * 1e3:.1f}ms errors={sum(snap.errors.values())}"
+        )
+        return " ".join([line] + [part() for part in self.summaries])
+
+
+def _finish_trace(conn: Connection, trace: Timeline, moved: list[int], now: float) -> None:
+    if conn.relay is not None:
+        ProxyMetrics.trace_relay(conn, conn.relay)
+    elif conn.first_byte_at:
+        trace.mark("first_downstream_byte", conn.first_byte_at)
+    trace.note(bytes=dict(zip(DIRECTIONS, moved)))
+    trace.finish(now)
+
+
+def start_stats(metrics: ProxyMetrics, config: StatsConfig, label: str = "proxy") -> http.server.HTTPServer | None:
+    """Start the optional ``/metrics`` endpoint and log summary on daemon threads."""
+    if config.interval > 0:
+
+        def log_loop() -> None:
+            while True:
+                time.sleep(config.interval)
+                print(f"[{label}] {metrics.summary()}", flush=True)
+
+        threading.Thread(target=log_loop, name=f"{label}-stats-log", daemon=True).start()
+
+    if config.port is None:
+        return None
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt: str, *args) -> None:  # noqa: D401
+            return
+
+    server = http.server.ThreadingHTTPServer((config.host, config.port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"{label}-stats", daemon=True).start()
+    print(f"[{label}] metrics at http://{config.host}:{server.server_address[1]}/metrics")
+    return server
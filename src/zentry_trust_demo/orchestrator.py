@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+class StepFailed(RuntimeError):
+    """A step raised; ``step`` names it and the original error is chained."""
+
+    def __init__(self, step: str, error: BaseException) -> None:
+        super().__init__(f"step {step!r} failed: {error}")
+        self.step = step
+        self.report: RunReport | None = None
+
+
+@dataclass(frozen=True)
+class Step:
+    """A unit of work that may start once every step in ``needs`` has finished."""
+
+    name: str
+    run: Callable[[], None]
+    needs: tuple[str, ...] = ()
+
+
+@dataclass
+class StepTiming:
+    name: str
+    started: float
+    finished: float
+    status: str = "ok"
+
+    @property
+    def seconds(self) -> float:
+        return self.finished - self.started
+
+
+@dataclass
+class RunReport:
+    started: float
+    timings: list[StepTiming] = field(default_factory=list)
+
+    @property
+    def wall(self) -> float:
+        return max((t.finished for t in self.timings), default=self.started) - self.started
+
+    def format(self) -> str:
+        width = max((len(t.name) for t in self.timings), default=4)
+        lines = [f"{'step':<{width}}  {'start':>7}  {'end':>7}  {'took':>7}"]
+        for t in sorted(self.timings, key=lambda t: (t.started, t.name)):
+            lines.append(
+                f"{t.name:<{width}}  {t.started - self.started:>6.1f}s  {t.finished - self.started:>6.1f}s  "
+                f"{t.seconds:>6.1f}s" + ("" if t.status == "ok" else f"  ({t.status})")
+            )
+        busy = sum(t.seconds for t in self.timings)
+        lines.append(f"wall {self.wall:.1f}s for {busy:.1f}s of step time")
+        return "\n".join(lines)
+
+
+def run_steps(steps: list[Step], max_workers: int = 4) -> RunReport:
+    """Run ``steps`` as a dependency graph, starting each as soon as it is unblocked.
+
+    Independent steps run concurrently on up to ``max_workers`` threads. After
+    the first failure no new step is started; running ones are allowed to
+    finish and :class:`StepFailed` is raised with the report attached as
+    ``report``.
+    """
+    by_name = {s.name: s for s in steps}
+    if len(by_name) != len(steps):
+        raise ValueError("duplicate step names")
+    for s in steps:
+        missing = [n for n in s.needs if n not in by_name]
+        if missing:
+            raise ValueError(f"step {s.name!r} needs unknown step(s): {', '.join(missing)}")
+
+    report = RunReport(started=time.monotonic())
+    lock = threading.Lock()
+    done: set[str] = set()
+    pending = list(steps)
+    running: dict[Future[None], Step] = {}
+    failure: StepFailed | None = None
+
+    def timed(step: Step) -> None:
+        started = time.monotonic()
+        status = "ok"
+        try:
+            step.run()
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            with lock:
+                report.timings.append(StepTiming(step.name, started, time.monotonic(), status))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="step") as pool:
+        while pending or running:
+            if failure is None:
+                ready = [s for s in pending if all(n in done for n in s.needs)]
+                for s in ready:
+                    pending.remove(s)
+                    running[pool.submit(timed, s)] = s
+            if not running:
+                if failure is None:
+                    names = ", ".join(s.name for s in pending)
+                    raise ValueError(f"dependency cycle between steps: {names}")
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                step = running.pop(fut)
+                err = fut.exception()
+                if err is None:
+                    done.add(step.name)
+                elif failure is None:
+                    failure = StepFailed(step.name, err)
+                    failure.__cause__ = err
+
+    if failure is not None:
+        failure.report = report
+        raise failure
+    return report
+
+
+def poll_until(
+    check: Callable[[], bool],
+    timeout: float,
+    what: str,
+    initial: float = 0.1,
+    max_delay: float = 2.0,
+) -> float:
+    """Call ``check`` with exponential backoff until it returns True.
+
+    Returns the seconds waited; raises ``TimeoutError`` after ``timeout``.
+    Exceptions from ``check`` count as "not ready yet".
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = initial
+    while True:
+        try:
+            if check():
+                return time.monotonic() - started
+        except Exception:
+            pass
+        now = time.monotonic()
+        if now >= deadline:
+            raise TimeoutError(f"{what} not ready after {timeout:.0f}s")
+        time.sleep(min(delay, deadline - now))
+        delay = min(max_delay, delay * 2)
@@ -0,0 +1,380 @@
+from __future__ import annotations
+
+import errno
+import os
+import selectors
+import socket
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from zentry_trust_demo.compression import Codec, Decoder, Encoder
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_MAX_PENDING = 256 * 1024
+FORWARDING_MODES = ("buffered", "splice")
+
+SPLICE_SUPPORTED = hasattr(os, "splice")
+
+# errnos meaning "splice does not work for this pair of fds", not a broken connection.
+_SPLICE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP}
+
+_RETRY = (BlockingIOError, InterruptedError)
+
+
+class _Direction:
+    """Bytes flowing from ``src`` to ``dst`` (non-blocking sockets).
+
+    Whatever ``dst`` cannot take right away is kept in ``pending``; once that
+    holds ``max_pending`` bytes we stop reading ``src`` until ``dst`` drains.
+    EOF on ``src`` is passed on as ``shutdown(SHUT_WR)`` on ``dst`` after the
+    pending bytes are flushed, so the opposite direction keeps flowing.
+    """
+
+    def __init__(self, src: socket.socket, dst: socket.socket, max_pending: int) -> None:
+        self.src = src
+        self.dst = dst
+        self.max_pending = max_pending
+        self.pending = bytearray()
+        self.moved = 0
+        self.first_byte_at = 0.0  # monotonic time the first byte reached ``dst``
+        self.done_at = 0.0  # monotonic time EOF was passed on to ``dst``
+        self.eof = False
+        self.done = False
+
+    def backlog(self) -> int:
+        return len(self.pending)
+
+    def wants_read(self) -> bool:
+        return not self.eof and self.backlog() < self.max_pending
+
+    def wants_write(self) -> bool:
+        return self.backlog() > 0
+
+    def read(self, buf: memoryview) -> None:
+        try:
+            n = self.src.recv_into(buf)
+        except _RETRY:
+            return
+        if not n:
+            self.eof = True
+            self._finish_if_drained()
+            return
+        data = self._transform(buf[:n])
+        if data and not self.pending:
+            # Fast path: hand the chunk straight on and only keep the remainder.
+            try:
+                sent = self.dst.send(data)
+            except _RETRY:
+                sent = 0
+            self._sent(sent)
+            data = data[sent:]
+        self.pending += data
+
+    def _transform(self, data: memoryview) -> bytes | memoryview:
+        return data
+
+    def push(self, data: bytes) -> None:
+        """Queue ``data`` for ``dst`` as if it had been read from ``src``."""
+        self.pending += self._transform(memoryview(data))
+
+    def write(self) -> None:
+        try:
+            sent = self.dst.send(self.pending)
+        except _RETRY:
+            return
+        del self.pending[:sent]
+        self._sent(sent)
+        self._finish_if_drained()
+
+    def close(self) -> None:
+        pass
+
+    def _sent(self, n: int) -> None:
+        if n and not self.moved:
+            self.first_byte_at = time.monotonic()
+        self.moved += n
+
+    def _finish_if_drained(self) -> None:
+        if self.eof and not self.wants_write() and not self.done:
+            self.done = True
+            self.done_at = time.monotonic()
+            try:
+                self.dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass  # peer is already gone; the other direction will notice
+
+
+class _CodecDirection(_Direction):
+    """A buffered direction that decodes frames read from ``src`` and/or encodes frames for ``dst``.
+
+    ``moved`` counts bytes as written to ``dst``, so compressed on the framed side.
+    """
+
+    def __init__(
+        self,
+        src: socket.socket,
+        dst: socket.socket,
+        max_pending: int,
+        decoder: Decoder | None = None,
+        encoder: Encoder | None = None,
+    ) -> None:
+        super().__init__(src, dst, max_pending)
+        self.decoder = decoder
+        self.encoder = encoder
+
+    def backlog(self) -> int:
+        # Only whole frames count: a partial one (up to 2 * MAX_FRAME) can only be completed by reading on.
+        held = self.decoder.buffered if self.decoder is not None and self.decoder.has_frame() else 0
+        return len(self.pending) + held
+
+    def wants_write(self) -> bool:
+        # Decoded output is produced at most max_pending at a time; the rest waits as frames.
+        return bool(self.pending) or (self.decoder is not None and self.decoder.has_frame())
+
+    def read(self, buf: memoryview) -> None:
+        super().read(buf)
+        if self.eof and self.decoder is not None:
+            self.decoder.close()  # a stream cut off mid-frame is an error, not a clean EOF
+
+    def write(self) -> None:
+        if not self.pending and self.decoder is not None and self.decoder.has_frame():
+            self.pending += self._transform(memoryview(b""))
+            if self.eof:
+                self.decoder.close()
+        super().write()
+
+    def _transform(self, data: memoryview) -> bytes | memoryview:
+        if self.decoder is not None:
+            data = self.decoder.feed(data, self.max_pending)  # type: ignore[assignment]
+        if self.encoder is not None and data:
+            data = self.encoder.encode(data)  # type: ignore[assignment]
+        return data
+
+
+class _SpliceDirection(_Direction):
+    """A direction whose pending bytes live in a kernel pipe (``os.splice``).
+
+    Payload never enters user space. If the kernel refuses to splice these
+    descriptors, the direction falls back to the buffered path for good.
+    """
+
+    def __init__(self, src: socket.socket, dst: socket.socket, max_pending: int) -> None:
+        super().__init__(src, dst, max_pending)
+        self._rfd, self._wfd = os.pipe()
+        self._capacity = _grow_pipe(self._wfd, max_pending)
+        self._queued = 0
+        self._spliced = True
+
+    def backlog(self) -> int:
+        return self._queued + len(self.pending)
+
+    def wants_read(self) -> bool:
+        if not self._spliced:
+            return super().wants_read()
+        return not self.eof and self._queued < self._capacity
+
+    def read(self, buf: memoryview) -> None:
+        if not self._spliced:
+            return super().read(buf)
+        flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+        try:
+            n = os.splice(self.src.fileno(), self._wfd, self._capacity - self._queued, flags=flags)
+        except _RETRY:
+            return
+        except OSError as e:
+            if e.errno not in _SPLICE_UNSUPPORTED or self._queued:
+                raise
+            self._spliced = False
+            return super().read(buf)
+        if not n:
+            self.eof = True
+            self._finish_if_drained()
+            return
+        self._queued += n
+        self.write()
+
+    def write(self) -> None:
+        if not self._spliced or self.pending:
+            return super().write()  # bytes pushed before the pipe was used go first
+        flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+        try:
+            sent = os.splice(self._rfd, self.dst.fileno(), self._queued, flags=flags)
+        except _RETRY:
+            return
+        self._queued -= sent
+        self._sent(sent)
+        self._finish_if_drained()
+
+    def close(self) -> None:
+        os.close(self._rfd)
+        os.close(self._wfd)
+
+
+def _grow_pipe(fd: int, size: int) -> int:
+    """Try to size the pipe to ``size``; return the capacity actually granted."""
+    import fcntl
+
+    try:
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, size)
+    except OSError:
+        pass  # above /proc/sys/fs/pipe-max-size for unprivileged users
+    return fcntl.fcntl(fd, fcntl.F_GETPIPE_SZ)
+
+
+def check_forwarding(mode: str, buffer_size: int) -> None:
+    if mode not in FORWARDING_MODES:
+        raise ValueError(f"unknown forwarding mode {mode!r} (expected 'buffered' or 'splice')")
+    if buffer_size <= 0:
+        raise ValueError(f"buffer size must be positive, got {buffer_size}")
+
+
+class Relay:
+    """Non-blocking, half-close aware forwarding between two sockets.
+
+    ``Relay(a, b)`` forwards a->b and b->a; ``Relay(a)`` echoes ``a`` back to
+    itself. The relay only tracks readiness: callers drive it from a selector,
+    either a private one (:func:`relay`, :func:`echo`) or an event loop shared
+    by many relays. It is finished once both directions saw EOF and flushed.
+
+    With a ``codec``, ``b`` (or ``a`` when echoing) carries compressed frames
+    (see :mod:`zentry_trust_demo.compression`) and the bytes are buffered
+    whatever ``forwarding`` says.
+    """
+
+    def __init__(
+        self,
+        a: socket.socket,
+        b: socket.socket | None = None,
+        *,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        forwarding: str = "buffered",
+        codec: Codec | None = None,
+    ) -> None:
+        direction = _SpliceDirection if forwarding == "splice" and SPLICE_SUPPORTED else _Direction
+        self.sockets: tuple[socket.socket, ...] = (a,) if b is None else (a, b)
+        self.directions: tuple[_Direction, ...]
+        if codec is not None and b is None:
+            self.directions = (_CodecDirection(a, a, max_pending, codec.decoder(), codec.encoder()),)
+        elif codec is not None and b is not None:
+            self.directions = (
+                _CodecDirection(a, b, max_pending, encoder=codec.encoder()),
+                _CodecDirection(b, a, max_pending, decoder=codec.decoder()),
+            )
+        elif b is None:
+            self.directions = (direction(a, a, max_pending),)
+        else:
+            self.directions = (direction(a, b, max_pending), direction(b, a, max_pending))
+        for sock in self.sockets:
+            sock.setblocking(False)
+        self.last_active = time.monotonic()
+
+    @property
+    def finished(self) -> bool:
+        return all(d.done for d in self.directions)
+
+    def interest(self, sock: socket.socket) -> int:
+        events = 0
+        for d in self.directions:
+            if d.src is sock and d.wants_read():
+                events |= selectors.EVENT_READ
+            if d.dst is sock and d.wants_write():
+                events |= selectors.EVENT_WRITE
+        return events
+
+    def on_event(self, sock: socket.socket, mask: int, buf: memoryview) -> None:
+        """Make progress on ``sock``; raises ``OSError`` if the connection broke."""
+        self.last_active = time.monotonic()
+        for d in self.directions:
+            if mask & selectors.EVENT_WRITE and d.dst is sock and d.wants_write():
+                d.write()
+            if mask & selectors.EVENT_READ and d.src is sock and d.wants_read():
+                d.read(buf)
+
+    def close(self) -> None:
+        for d in self.directions:
+            d.close()
+
+
+def sync_interest(sel: selectors.BaseSelector, sock: socket.socket, events: int, data: object = None) -> None:
+    """Register, modify or unregister ``sock`` so the selector watches ``events``."""
+    try:
+        current = sel.get_key(sock).events
+    except KeyError:
+        current = 0
+    if events == current:
+        return
+    if not events:
+        sel.unregister(sock)
+    elif not current:
+        sel.register(sock, events, data)
+    else:
+        sel.modify(sock, events, data)
+
+
+def _private_selector() -> selectors.BaseSelector:
+    # poll() has no FD_SETSIZE limit and, unlike epoll, needs no extra fd per connection.
+    if hasattr(selectors, "PollSelector"):
+        return selectors.PollSelector()
+    return selectors.SelectSelector()
+
+
+def run_relay(r: Relay, idle_timeout: float | None = 30.0, buffer_size: int = DEFAULT_BUFFER_SIZE) -> None:
+    """Drive ``r`` on the calling thread until finished, idle, or broken."""
+    buf = memoryview(bytearray(buffer_size))
+    sel = _private_selector()
+    try:
+        for sock in r.sockets:
+            sync_interest(sel, sock, r.interest(sock))
+        while not r.finished:
+            events = sel.select(idle_timeout)
+            if not events:
+                return  # idle timeout
+            for key, mask in events:
+                r.on_event(key.fileobj, mask, buf)  # type: ignore[arg-type]
+            for sock in r.sockets:
+                sync_interest(sel, sock, r.interest(sock))
+    finally:
+        sel.close()
+        r.close()
+
+
+def relay(
+    a: socket.socket,
+    b: socket.socket,
+    *,
+    idle_timeout: float | None = 30.0,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    max_pending: int = DEFAULT_MAX_PENDING,
+    forwarding: str = "buffered",
+) -> None:
+    """Forward ``a`` <-> ``b`` until both sides are done; sockets are not closed."""
+    run_relay(Relay(a, b, max_pending=max_pending, forwarding=forwarding), idle_timeout, buffer_size)
+
+
+def echo(
+    sock: socket.socket,
+    *,
+    idle_timeout: float | None = None,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    max_pending: int = DEFAULT_MAX_PENDING,
+    codec: Codec | None = None,
+) -> None:
+    """Echo ``sock`` back to itself, answering a half-close with one of our own.
+
+    With a ``codec`` the client's frames are decoded and the echo re-encoded.
+    """
+    run_relay(Relay(sock, max_pending=max_pending, codec=codec), idle_timeout, buffer_size)
+
+
+def recv_exact(sock: socket.socket, n: int) -> bytes:
+    """Read ``n`` bytes from a blocking socket, or fewer if the peer closes first."""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
+            break
+        got += k
+    return bytes(buf[:got])
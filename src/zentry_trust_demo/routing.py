@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+ROUTE_KINDS = ("host", "path", "sni")
+
+# Enough for any TLS ClientHello record and any reasonable HTTP request head.
+_SNIFF_LIMIT = 16 * 1024 + 5
+
+
+@dataclass(frozen=True)
+class Route:
+    """Send connections whose ``kind`` (Host header, path prefix or TLS SNI) matches to ``service``."""
+
+    kind: str
+    match: str
+    service: str
+
+
+def parse_route(spec: str) -> Route:
+    """``host:app.example=App``, ``path:/api=Api`` or ``sni:db.example=Db`` -> :class:`Route`.
+
+    Host and SNI names may start with ``*.`` to match any subdomain.
+    """
+    kind, sep, rest = spec.partition(":")
+    match, eq, service = rest.rpartition("=")
+    kind = kind.strip().lower()
+    if not sep or not eq or not match or not service or kind not in ROUTE_KINDS:
+        raise ValueError(f"bad route {spec!r} (expected host:NAME=SERVICE, path:/PREFIX=SERVICE or sni:NAME=SERVICE)")
+    if kind == "path" and not match.startswith("/"):
+        raise ValueError(f"bad route {spec!r}: path prefixes start with '/'")
+    if kind != "path":
+        match = match.lower().rstrip(".")
+    return Route(kind, match, service)
+
+
+@dataclass(frozen=True)
+class Hello:
+    """What a client's first bytes said about where it wants to go."""
+
+    protocol: str  # "http", "tls" or "unknown"
+    host: str | None = None
+    path: str = "/"
+
+
+def _match_name(names: dict[str, str], name: str | None) -> str | None:
+    if not name:
+        return None
+    name = name.lower().rstrip(".")
+    if name in names:
+        return names[name]
+    # Wildcards: the longest "*.suffix" that matches wins.
+    labels = name.split(".")
+    for i in range(1, len(labels)):
+        service = names.get("*." + ".".join(labels[i:]))
+        if service is not None:
+            return service
+    return None
+
+
+def _path_matches(prefix: str, path: str) -> bool:
+    if path == prefix or prefix == "/":
+        return True
+    return path.startswith(prefix if prefix.endswith("/") else prefix + "/")
+
+
+class RoutingTable:
+    """Maps requests to Ziti services for a proxy that fronts several of them.
+
+    HTTP requests are routed by Host first, then by the longest matching path
+    prefix; TLS connections by SNI, then by the Host routes for the same
+    name. Anything unmatched goes to ``default`` (None refuses it).
+    """
+
+    def __init__(self, routes: Iterable[Route], default: str | None = None) -> None:
+        self.routes = list(routes)
+        self.default = default
+        self._hosts = {r.match: r.service for r in self.routes if r.kind == "host"}
+        self._snis = {r.match: r.service for r in self.routes if r.kind == "sni"}
+        self._paths = sorted(
+            ((r.match, r.service) for r in self.routes if r.kind == "path"),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    @property
+    def services(self) -> list[str]:
+        """Every service a connection may be routed to, in first-mention order."""
+        names = [r.service for r in self.routes] + ([self.default] if self.default else [])
+        return list(dict.fromkeys(names))
+
+    @property
+    def uses_sni(self) -> bool:
+        return bool(self._snis)
+
+    def for_http(self, host: str | None, path: str) -> str | None:
+        if host and not host.startswith("["):
+            host = host.rsplit(":", 1)[0]
+        service = _match_name(self._hosts, host)
+        if service is not None:
+            return service
+        path = path.split("?", 1)[0]
+        for prefix, service in self._paths:
+            if _path_matches(prefix, path):
+                return service
+        return self.default
+
+    def for_sni(self, name: str | None) -> str | None:
+        return _match_name(self._snis, name) or _match_name(self._hosts, name) or self.default
+
+    def route(self, hello: Hello) -> str | None:
+        if hello.protocol == "tls":
+            return self.for_sni(hello.host)
+        if hello.protocol == "http":
+            return self.for_http(hello.host, hello.path)
+        return self.default
+
+    def describe(self) -> list[str]:
+        lines = [f"{r.kind} {r.match} -> {r.service}" for r in self.routes]
+        if self.default:
+            lines.append(f"(default) -> {self.default}")
+        return lines
+
+
+def parse_sni(data: bytes) -> str | None | bool:
+    """Server name from a TLS ClientHello record.
+
+    Returns the name, None if the hello has no SNI (or is not a hello), or
+    False if ``data`` is a truncated hello and more bytes are needed.
+    """
+    if len(data) < 5:
+        return False
+    if data[0] != 0x16:
+        return None
+    (record_len,) = struct.unpack_from("!H", data, 3)
+    if len(data) < 5 + record_len:
+        return False
+    hello = data[5 : 5 + record_len]
+    try:
+        if hello[0] != 0x01:
+            return None
+        pos = 4 + 2 + 32  # handshake header, client_version, random
+        pos += 1 + hello[pos]  # session_id
+        (n,) = struct.unpack_from("!H", hello, pos)
+        pos += 2 + n  # cipher_suites
+        pos += 1 + hello[pos]  # compression_methods
+        (ext_total,) = struct.unpack_from("!H", hello, pos)
+        pos += 2
+        end = min(len(hello), pos + ext_total)
+        while pos + 4 <= end:
+            ext_type, ext_len = struct.unpack_from("!HH", hello, pos)
+            pos += 4
+            if ext_type == 0:  # server_name
+                (list_len,) = struct.unpack_from("!H", hello, pos)
+                p, list_end = pos + 2, pos + 2 + list_len
+                while p + 3 <= list_end:
+                    name_type, name_len = hello[p], struct.unpack_from("!H", hello, p + 1)[0]
+                    if name_type == 0:
+                        return hello[p + 3 : p + 3 + name_len].decode("ascii", "replace")
+                    p += 3 + name_len
+                return None
+            pos += ext_len
+    except (IndexError, struct.error):
+        pass
+    return None
+
+
+def _parse_http(data: bytes) -> Hello | None:
+    """Host and path from a complete request head in ``data``; None if it is not complete yet."""
+    end = data.find(b"\r\n\r\n")
+    if end < 0:
+        return None
+    lines = data[:end].decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    path = parts[1] if len(parts) == 3 else "/"
+    host = None
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep and name.strip().lower() == "host":
+            host = value.strip()
+            break
+    return Hello("http", host, path)
+
+
+def sniff(sock: socket.socket, timeout: float = 5.0) -> Hello:
+    """Peek at the client's first bytes (without consuming them) to learn where it is headed.
+
+    The bytes stay in the socket's receive queue, so whatever relays the
+    connection afterwards still forwards them. Gives up with a partial answer
+    after ``timeout`` seconds or once ``_SNIFF_LIMIT`` bytes are queued.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    seen = 0
+    sock.settimeout(timeout)
+    try:
+        while True:
+            data = sock.recv(_SNIFF_LIMIT, socket.MSG_PEEK)
+            if not data:
+                return Hello("unknown")
+            if data[0] == 0x16:
+                sni = parse_sni(data)
+                if sni is not False:
+                    return Hello("tls", sni or None)
+            elif data[:1].isalpha():
+                hello = _parse_http(data)
+                if hello is not None:
+                    return hello
+            else:
+                return Hello("unknown")
+            if len(data) >= _SNIFF_LIMIT or time.monotonic() >= deadline:
+                return Hello("tls" if data[0] == 0x16 else "unknown")
+            # MSG_PEEK keeps the socket readable, so wait for more bytes by
+            # polling, not select(); the first segment nearly always suffices.
+            if len(data) == seen:
+                time.sleep(delay)
+                delay = min(0.05, delay * 2)
+            seen = len(data)
+    except (socket.timeout, OSError):
+        return Hello("unknown")
+    finally:
+        try:
+            sock.settimeout(None)
+        except OSError:
+            pass
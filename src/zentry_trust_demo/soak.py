@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import gc
+import http.client
+import itertools
+import os
+import resource
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from zentry_trust_demo.accept_loop import WorkerLimits
+from zentry_trust_demo.bench import make_payload
+from zentry_trust_demo.compression import Codec, CompressedSocket, CompressionConfig, offer_compression
+from zentry_trust_demo.loopback import LoopbackContext
+from zentry_trust_demo.metrics import ProxyMetrics
+from zentry_trust_demo.static_site import StaticConfig
+from zentry_trust_demo.traditional import serve_echo
+from zentry_trust_demo.ziti_echo import run_ziti_echo_client
+from zentry_trust_demo.ziti_proxy import PROXY_MODES, ProxyBind, serve_ziti_http_proxy
+from zentry_trust_demo.zitify_http import HttpBind, KeepAlive, make_ghost_http_server
+
+ECHO_SERVICE = "soak-echo"
+HTTP_SERVICE = "soak-http"
+
+# (name, unit) of each tracked resource, in report order.
+RESOURCES = (("fds", ""), ("threads", ""), ("rss", "MiB"), ("heap", "MiB"))
+
+# Files the soak's ghost server serves: one small enough for its memory cache, one streamed with sendfile.
+_SITE = {"index.html": 4 * 1024, "big.json": 1024 * 1024}
+_ECHO_SIZE = 16 * 1024
+_RST = struct.pack("ii", 1, 0)  # SO_LINGER on with a zero timeout: close() resets the connection
+
+
+@dataclass(frozen=True)
+class SoakLimits:
+    """How much each resource may grow per hour after warm-up before the soak fails."""
+
+    fds: float = 5.0
+    threads: float = 2.0
+    rss: float = 64.0  # MiB
+    heap: float = 16.0  # MiB traced by tracemalloc
+
+    def __post_init__(self) -> None:
+        if min(self.fds, self.threads, self.rss, self.heap) < 0:
+            raise ValueError(f"growth limits must be >= 0: {self}")
+
+
+@dataclass(frozen=True)
+class SoakConfig:
+    """A soak run: ``concurrency`` clients churn connections for ``duration`` seconds.
+
+    Resources are sampled every ``interval`` seconds, after the load pauses
+    and up to ``settle`` seconds are given for connections to drain. Samples
+    taken during the first ``warmup`` seconds (pools, caches and worker
+    threads filling up) are reported but not judged.
+    """
+
+    duration: float = 3600.0
+    interval: float = 60.0
+    warmup: float = 300.0
+    concurrency: int = 8
+    engine: str = "threads"
+    mode: str = "tcp"
+    compression: CompressionConfig | None = None
+    settle: float = 10.0
+    top: int = 10
+    limits: SoakLimits = SoakLimits()
+
+    def __post_init__(self) -> None:
+        if self.engine not in ("threads", "async"):
+            raise ValueError(f"unknown proxy engine {self.engine!r} (expected 'threads' or 'async')")
+        if self.mode not in PROXY_MODES:
+            raise ValueError(f"unknown proxy mode {self.mode!r} (expected 'tcp' or 'l7')")
+        if self.duration <= 0 or self.interval <= 0 or self.warmup < 0 or self.settle < 0:
+            raise ValueError("duration and interval must be > 0, warmup and settle >= 0")
+        if self.warmup >= self.duration:
+            raise ValueError("warmup must be shorter than duration, or nothing is judged")
+        if self.concurrency < 1 or self.top < 0:
+            raise ValueError("concurrency must be >= 1 and top >= 0")
+
+
+@dataclass
+class Sample:
+    elapsed: float  # seconds since the soak started
+    ops: int  # client operations completed so far
+    fds: int
+    threads: int
+    rss: float  # MiB
+    heap: float  # MiB
+
+
+@dataclass
+class SoakReport:
+    config: SoakConfig
+    samples: list[Sample]
+    ops: int = 0
+    errors: int = 0
+    proxy_errors: dict[tuple[str, str], int] = field(default_factory=dict)
+    growth: list[str] = field(default_factory=list)  # tracemalloc diff since warm-up, biggest first
+
+    def judged(self) -> list[Sample]:
+        return [s for s in self.samples if s.elapsed >= self.config.warmup]
+
+    def slopes(self) -> dict[str, float] | None:
+        """Least-squares growth per hour of each resource over the judged samples (None if too few)."""
+        judged = self.judged()
+        if len(judged) < 3:
+            return None
+        xs = [s.elapsed / 3600 for s in judged]
+        mx = sum(xs) / len(xs)
+        var = sum((x - mx) ** 2 for x in xs)
+        out = {}
+        for name, _ in RESOURCES:
+            ys = [float(getattr(s, name)) for s in judged]
+            my = sum(ys) / len(ys)
+            out[name] = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 0.0
+        return out
+
+    def failures(self) -> list[str]:
+        slopes = self.slopes()
+        if slopes is None:
+            return []
+        return [
+            f"{name} grows {slopes[name]:+.2f}{unit}/h (limit {getattr(self.config.limits, name):g}{unit}/h)"
+            for name, unit in RESOURCES
+            if slopes[name] > getattr(self.config.limits, name)
+        ]
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.failures())
+
+
+def open_fds() -> int:
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path)) - 1  # minus the descriptor listdir itself holds
+        except OSError:
+            continue
+    return -1
+
+
+def rss_mib() -> float:
+    """Current resident set size; the peak where ``/proc`` is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _write_site(root: str) -> None:
+    for name, size in _SITE.items():
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(make_payload(size, "text"))
+
+
+def _start_thread(target: Callable[..., Any], *args: Any) -> None:
+    threading.Thread(target=target, args=args, daemon=True).start()
+
+
+def _ignore_resets(server: socketserver.BaseServer) -> None:
+    """Don't print a traceback for every connection the churn resets on purpose."""
+    report = server.handle_error
+
+    def handle_error(request: Any, client_address: Any) -> None:
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            report(request, client_address)
+
+    server.handle_error = handle_error  # type: ignore[method-assign]
+
+
+def _reset(sock: socket.socket) -> None:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _RST)
+    sock.close()
+
+
+class _Churn:
+    """The client side of the soak: each worker cycles through a mix of complete and abandoned connections."""
+
+    def __init__(self, ctx: LoopbackContext, proxy: tuple[str, int], codec: Codec | None) -> None:
+        self.ctx = ctx
+        self.proxy = proxy
+        self.codec = codec
+        self.ops = 0
+        self.errors = 0
+        self.last_error = ""
+        self._lock = threading.Lock()
+        self._echo = make_payload(_ECHO_SIZE, "text")
+        self._steps: tuple[Callable[[], None], ...] = (
+            self._proxy_session,
+            self._proxy_abort,
+            self._echo_round_trip,
+            self._echo_abort,
+        )
+
+    def _proxy_session(self) -> None:
+        """Several keep-alive requests for cached and streamed files over one proxied connection."""
+        conn = http.client.HTTPConnection(*self.proxy, timeout=10)
+        try:
+            for path in ("/", "/big.json", "/index.html", "/missing"):
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status not in (200, 404):
+                    raise RuntimeError(f"GET {path}: HTTP {resp.status}")
+        finally:
+            conn.close()
+
+    def _proxy_abort(self) -> None:
+        """Reset the connection halfway through a large response."""
+        s = socket.create_connection(self.proxy, timeout=10)
+        try:
+            s.sendall(b"GET /big.json HTTP/1.1\r\nHost: soak\r\n\r\n")
+            s.recv(65536)
+        finally:
+            _reset(s)
+
+    def _echo_round_trip(self) -> None:
+        data = run_ziti_echo_client(self.ctx, ECHO_SERVICE, self._echo, self.codec)
+        if len(data) != len(self._echo):
+            raise RuntimeError(f"short echo: {len(data)}/{len(self._echo)} bytes")
+
+    def _echo_abort(self) -> None:
+        """Send half a message to the echo host and reset the connection."""
+        s = self.ctx.connect(ECHO_SERVICE)
+        try:
+            conn = CompressedSocket(offer_compression(s, self.codec), self.codec) if self.codec is not None else s
+            conn.sendall(self._echo[: len(self._echo) // 2])
+        finally:
+            _reset(s)
+
+    def run(self, seconds: float, concurrency: int) -> None:
+        """Churn from ``concurrency`` threads for ``seconds``, then wait for them to finish."""
+        deadline = time.monotonic() + seconds
+
+        def worker(i: int) -> None:
+            for step in itertools.islice(itertools.cycle(self._steps), i, None):
+                if time.monotonic() >= deadline:
+                    return
+                try:
+                    step()
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                        self.last_error = f"{step.__name__.strip('_')}: {e}"
+                with self._lock:
+                    self.ops += 1
+
+        threads = [threading.Thread(target=worker, args=(i,), name=f"soak-client-{i}") for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+def _settle(metrics: ProxyMetrics, timeout: float) -> None:
+    """Wait until the proxy has no open connections and the thread count holds still."""
+    deadline = time.monotonic() + timeout
+    last = -1
+    while time.monotonic() < deadline:
+        now = threading.active_count()
+        if metrics.snapshot().active == 0 and now == last:
+            return
+        last = now
+        time.sleep(0.2)
+
+
+def _sample(started: float, ops: int) -> Sample:
+    gc.collect()
+    return Sample(
+        elapsed=time.monotonic() - started,
+        ops=ops,
+        fds=open_fds(),
+        threads=threading.active_count(),
+        rss=rss_mib(),
+        heap=tracemalloc.get_traced_memory()[0] / 2**20,
+    )
+
+
+def _start_proxy(
+    ctx: LoopbackContext,
+    config: SoakConfig,
+    metrics: ProxyMetrics,
+    codec: Codec | None,
+) -> tuple[str, int]:
+    addr: list[tuple[str, int]] = []
+    ready = threading.Event()
+    _start_thread(
+        lambda: serve_ziti_http_proxy(
+            ctx,
+            HTTP_SERVICE,
+            ProxyBind("127.0.0.1", 0),
+            engine=config.engine,
+            on_ready=lambda a: (addr.append(a), ready.set()),
+            metrics=metrics,
+            mode=config.mode,
+            codec=codec,
+        )
+    )
+    if not ready.wait(10):
+        raise RuntimeError("soak proxy did not start")
+    return addr[0]
+
+
+def run_soak(config: SoakConfig) -> SoakReport:
+    """Run the proxy, echo host and ghost server in this process under churn and track their resources.
+
+    A :class:`LoopbackContext` stands in for Ziti, as in :func:`run_bench`, so
+    the soak runs offline. Every sample is printed as it is taken; the report
+    holds the slopes the verdict is based on.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    server_codec = Codec(config.compression or CompressionConfig())
+    client_codec = Codec(config.compression) if config.compression is not None else None
+    report = SoakReport(config, [])
+
+    with tempfile.TemporaryDirectory(prefix="zentry-soak-") as root:
+        _write_site(root)
+
+        echo_listener = socket.create_server(("127.0.0.1", 0), backlog=1024)
+        limits = WorkerLimits(max_workers=max(32, 2 * config.concurrency))
+        _start_thread(serve_echo, echo_listener, limits, server_codec)
+
+        ghost = make_ghost_http_server(HttpBind("127.0.0.1", 0), KeepAlive(), StaticConfig(root), server_codec)
+        ghost.daemon_threads = True
+        _ignore_resets(ghost)
+        _start_thread(ghost.serve_forever)
+
+        ctx = LoopbackContext(
+            {ECHO_SERVICE: echo_listener.getsockname()[:2], HTTP_SERVICE: ghost.server_address[:2]}
+        )
+        metrics = ProxyMetrics()
+        churn = _Churn(ctx, _start_proxy(ctx, config, metrics, client_codec), client_codec)
+
+        print(
+            f"[soak] {config.concurrency} clients for {config.duration:g}s via the {config.engine}/{config.mode} proxy"
+            f"{' with compression' if client_codec is not None else ''}; sampling every {config.interval:g}s, "
+            f"judging after {config.warmup:g}s",
+            flush=True,
+        )
+        started = time.monotonic()
+        baseline = None
+        try:
+            report.samples.append(_sample(started, 0))
+            while (remaining := config.duration - (time.monotonic() - started)) > 0:
+                churn.run(min(config.interval, remaining), config.concurrency)
+                _settle(metrics, config.settle)
+                s = _sample(started, churn.ops)
+                report.samples.append(s)
+                if baseline is None and s.elapsed >= config.warmup:
+                    baseline = tracemalloc.take_snapshot()
+                print(
+                    f"[soak] {s.elapsed / 60:7.1f}min ops={s.ops} errors={churn.errors} fds={s.fds} "
+                    f"threads={s.threads} rss={s.rss:.1f}MiB heap={s.heap:.1f}MiB"
+                    f"{'' if baseline is not None else ' (warming up)'}",
+                    flush=True,
+                )
+            if baseline is not None and config.top:
+                stats = tracemalloc.take_snapshot().compare_to(baseline, "lineno")
+                report.growth = [str(stat) for stat in stats[: config.top] if stat.size_diff > 0]
+        finally:
+            ghost.shutdown()
+            ghost.server_close()
+            echo_listener.close()
+
+    report.ops, report.errors = churn.ops, churn.errors
+    report.proxy_errors = metrics.snapshot().errors
+    if churn.last_error:
+        print(f"[soak] last client error: {churn.last_error}", flush=True)
+    return report
+
+
+def format_report(report: SoakReport) -> str:
+    judged = report.judged()
+    slopes = report.slopes()
+    header = f"{'resource':<10} {'start':>10} {'end':>10} {'growth/h':>10} {'limit/h':>10}"
+    lines = [header, "-" * len(header)]
+    for name, unit in RESOURCES:
+        if slopes is None:
+            lines.append(f"{name:<10} {'-':>10} {'-':>10} {'-':>10} {getattr(report.config.limits, name):>10g}")
+            continue
+        first, last = getattr(judged[0], name), getattr(judged[-1], name)
+        flag = "  FAIL" if slopes[name] > getattr(report.config.limits, name) else ""
+        lines.append(
+            f"{name + (f' ({unit})' if unit else ''):<10} {first:>10.4g} {last:>10.4g} {slopes[name]:>+10.2f} "
+            f"{getattr(report.config.limits, name):>10g}{flag}"
+        )
+    lines.append("")
+    lines.append(f"client operations: {report.ops} ({report.errors} failed)")
+    if report.proxy_errors:
+        errors = ", ".join(f"{stage}/{reason}={n}" for (stage, reason), n in sorted(report.proxy_errors.items()))
+        lines.append(f"proxy errors: {errors}")
+    if report.growth:
+        lines.append("")
+        lines.append("top allocation growth since warm-up:")
+        lines += [f"  {line}" for line in report.growth]
+    lines.append("")
+    if slopes is None:
+        lines.append(f"NOT JUDGED: fewer than 3 samples after warm-up ({len(judged)})")
+    else:
+        failures = report.failures()
+        lines.append("FAIL: " + "; ".join(failures) if failures else "PASS: no resource grows beyond its limit")
+    return "\n".join(lines)
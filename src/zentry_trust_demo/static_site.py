@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import email.utils
+import mimetypes
+import os
+import posixpath
+import stat
+import threading
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from zentry_trust_demo.zitify_http import PersistentHandler
+
+
+@dataclass(frozen=True)
+class StaticConfig:
+    """What ``zitify-http-server --root`` serves and how much of it stays in memory.
+
+    Files up to ``cache_max_file`` bytes are kept in an LRU of ``cache_bytes``;
+    larger ones are streamed from disk with ``sendfile``. ``max_age`` > 0 adds
+    ``Cache-Control: public, max-age=...``; otherwise clients revalidate.
+    Derived headers are kept for the ``cache_entries`` most recently served files.
+    """
+
+    root: str
+    max_age: int = 0
+    cache_bytes: int = 32 * 1024 * 1024
+    cache_max_file: int = 256 * 1024
+    cache_entries: int = 4096
+
+
+@dataclass
+class StaticFile:
+    """One representation of a file (plain or its ``.gz`` sibling), with headers built once."""
+
+    path: str
+    size: int
+    mtime_ns: int
+    etag: str
+    last_modified: str
+    headers: list[tuple[str, str]]
+
+
+class Unsatisfiable(ValueError):
+    """The Range header names no byte inside the file."""
+
+
+def parse_range(value: str, size: int) -> tuple[int, int] | None:
+    """``bytes=a-b`` -> inclusive ``(start, end)``; None to ignore the header.
+
+    Multiple ranges are ignored (the whole file is sent instead), which RFC
+    9110 permits and keeps every response a single part.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        a = int(first) if first else None
+        b = int(last) if last else None
+    except ValueError:
+        return None
+    if a is None:  # suffix: the last N bytes
+        if b is None or b <= 0 or size == 0:
+            raise Unsatisfiable(value)
+        return max(0, size - b), size - 1
+    start, end = a, size - 1 if b is None else b
+    if start >= size:
+        raise Unsatisfiable(value)
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def accepts_gzip(value: str) -> bool:
+    """Whether an ``Accept-Encoding`` value allows a gzip-coded response.
+
+    gzip (or x-gzip) listed with q > 0 is accepted and with q=0 refused;
+    when it is not listed, ``*`` decides the same way. Codings without a
+    q-value have q=1, and an unparseable q-value counts as 0.
+    """
+    weights: dict[str, float] = {}
+    for item in value.split(","):
+        coding, *params = (p.strip() for p in item.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, raw = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            weights[coding.lower()] = q
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+
+class StaticSite:
+    """Resolves URL paths under ``root`` and caches file metadata and small bodies.
+
+    Every request still stats the file, so edits on disk are picked up at
+    once; only the derived headers and (for small files) the bytes are reused
+    while size and mtime are unchanged.
+    """
+
+    def __init__(self, config: StaticConfig) -> None:
+        self.config = config
+        self.root = os.path.realpath(config.root)
+        if not os.path.isdir(self.root):
+            raise ValueError(f"static root {config.root!r} is not a directory")
+        self._files: OrderedDict[str, StaticFile] = OrderedDict()
+        self._bodies: OrderedDict[str, tuple[int, bytes]] = OrderedDict()
+        self._body_bytes = 0
+        self._lock = threading.Lock()
+
+    def translate(self, url_path: str) -> str | None:
+        """Filesystem path for ``url_path``, or None if it would leave the root."""
+        path = posixpath.normpath(urllib.parse.unquote(url_path))
+        parts = [p for p in path.split("/") if p and p != "."]
+        if any(p == ".." or "\0" in p or os.sep in p or (os.altsep and os.altsep in p) for p in parts):
+            return None
+        path = os.path.join(self.root, *parts)
+        return path if self._inside(path) else None
+
+    def _inside(self, path: str) -> bool:
+        """Whether ``path`` still lies under the root once symlinks are resolved."""
+        return os.path.commonpath([self.root, os.path.realpath(path)]) == self.root
+
+    def lookup(self, url_path: str, gzip_ok: bool) -> StaticFile | str | None:
+        """The representation to send, a redirect target (``str``) for a directory, or None."""
+        path = self.translate(url_path)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+            if stat.S_ISDIR(st.st_mode):
+                if not url_path.endswith("/"):
+                    return url_path + "/"
+                path = os.path.join(path, "index.html")
+                if not self._inside(path):
+                    return None
+                st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        try:
+            gz = os.stat(path + ".gz") if self._inside(path + ".gz") else None
+        except OSError:
+            gz = None
+        # A stale .gz (older than the file it compresses) is never served.
+        has_gz = gz is not None and gz.st_mtime_ns >= st.st_mtime_ns
+        if gzip_ok and has_gz and gz is not None:
+            return self._info(path + ".gz", gz, path, gzipped=True)
+        return self._info(path, st, path, gzipped=False, varies=has_gz)
+
+    def _info(
+        self,
+        path: str,
+        st: os.stat_result,
+        original: str,
+        gzipped: bool,
+        varies: bool = True,
+    ) -> StaticFile:
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached.mtime_ns == st.st_mtime_ns and cached.size == st.st_size:
+                if varies == any(k == "Vary" for k, _ in cached.headers):
+                    self._files.move_to_end(path)
+                    return cached
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-gz" if gzipped else ""}"'
+        last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        headers = [
+            ("Content-Type", mimetypes.guess_type(original)[0] or "application/octet-stream"),
+            ("Last-Modified", last_modified),
+            ("ETag", etag),
+            ("Accept-Ranges", "bytes"),
+        ]
+        if gzipped:
+            headers.append(("Content-Encoding", "gzip"))
+        if varies:
+            headers.append(("Vary", "Accept-Encoding"))
+        if self.config.max_age > 0:
+            headers.append(("Cache-Control", f"public, max-age={self.config.max_age}"))
+        info = StaticFile(path, st.st_size, st.st_mtime_ns, etag, last_modified, headers)
+        with self._lock:
+            self._files[path] = info
+            self._files.move_to_end(path)
+            while len(self._files) > self.config.cache_entries:
+                self._files.popitem(last=False)
+        return info
+
+    def body(self, f: StaticFile) -> bytes | None:
+        """The file's bytes if it is small enough to keep in memory, else None."""
+        if f.size > self.config.cache_max_file:
+            return None
+        with self._lock:
+            hit = self._bodies.get(f.path)
+            if hit is not None and hit[0] == f.mtime_ns:
+                self._bodies.move_to_end(f.path)
+                return hit[1]
+        with open(f.path, "rb") as fh:
+            data = fh.read()
+        if len(data) != f.size:
+            return data  # changed while reading; serve it, but do not keep it
+        with self._lock:
+            old = self._bodies.pop(f.path, None)
+            if old is not None:
+                self._body_bytes -= len(old[1])
+            self._bodies[f.path] = (f.mtime_ns, data)
+            self._body_bytes += len(data)
+            while self._body_bytes > self.config.cache_bytes:
+                _, (_, evicted) = self._bodies.popitem(last=False)
+                self._body_bytes -= len(evicted)
+        return data
+
+
+class StaticHandler(PersistentHandler):
+    """Serves ``site`` with conditional requests, single byte ranges and ``.gz`` variants."""
+
+    site: StaticSite
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._serve(send_body=True)
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        self._serve(send_body=False)
+
+    def _serve(self, send_body: bool) -> None:
+        url_path = urllib.parse.urlsplit(self.path).path
+        found = self.site.lookup(url_path, gzip_ok=accepts_gzip(self.headers.get("Accept-Encoding") or ""))
+        if found is None:
+            self.send_error(404)
+            return
+        if isinstance(found, str):
+            self.send_response(301)
+            self.send_header("Location", found)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        f = found
+        if self._not_modified(f):
+            self.send_response(304)
+            for name, value in f.headers:
+                if name in ("ETag", "Last-Modified", "Vary", "Cache-Control"):
+                    self.send_header(name, value)
+            self.end_headers()
+            return
+
+        start, end, status = 0, f.size - 1, 200
+        header = self.headers.get("Range")
+        if header and self._if_range_matches(f):
+            try:
+                wanted = parse_range(header, f.size)
+            except Unsatisfiable:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{f.size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if wanted is not None:
+                (start, end), status = wanted, 206
+        length = end - start + 1
+
+        self.send_response(status)
+        for name, value in f.headers:
+            self.send_header(name, value)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{f.size}")
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+        if not send_body or length <= 0:
+            return
+
+        body = self.site.body(f)
+        if body is not None:
+            self.wfile.write(memoryview(body)[start : end + 1])
+            return
+        with open(f.path, "rb") as fh:
+            # Uses os.sendfile where the socket allows it (no copy through
+            # Python); socket.sendfile falls back to buffered send() otherwise.
+            sent = self.connection.sendfile(fh, start, length)
+        if sent != length:
+            self.close_connection = True  # file shrank underneath us
+
+    def _not_modified(self, f: StaticFile) -> bool:
+        inm = self.headers.get("If-None-Match")
+        if inm is not None:
+            return any(t.strip().removeprefix("W/") in ("*", f.etag) for t in inm.split(","))
+        since = self.headers.get("If-Modified-Since")
+        if since is None:
+            return False
+        try:
+            return f.mtime_ns // 1_000_000_000 <= int(email.utils.parsedate_to_datetime(since).timestamp())
+        except (TypeError, ValueError):
+            return False
+
+    def _if_range_matches(self, f: StaticFile) -> bool:
+        value = self.headers.get("If-Range")
+        return value is None or value.strip() in (f.etag, f.last_modified)
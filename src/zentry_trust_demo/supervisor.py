@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import threading
+import time
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable
+
+# A worker that lived at least this long is considered healthy again, so its
+# next crash restarts it without the accumulated backoff.
+_STABLE_AFTER = 10.0
+_MAX_BACKOFF = 30.0
+
+
+def install_graceful_stop(stop: Callable[[], None]) -> None:
+    """In a worker: run ``stop`` on SIGTERM and leave SIGINT to the parent.
+
+    ``stop`` runs on a helper thread so it may block (e.g.
+    ``HTTPServer.shutdown`` waits for ``serve_forever`` to return).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda _sig, _frame: threading.Thread(target=stop, daemon=True).start())
+
+
+class _Slot:
+    __slots__ = ("index", "proc", "started", "failures", "restart_at")
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.proc: BaseProcess | None = None
+        self.started = 0.0
+        self.failures = 0
+        self.restart_at = 0.0
+
+
+class Supervisor:
+    """Run ``workers`` copies of ``target(*args)`` in child processes.
+
+    Crashed workers are restarted with exponential backoff. SIGHUP performs a
+    rolling restart (a replacement is started before each old worker is asked
+    to stop, so capacity never drops to zero); SIGTERM/SIGINT stop everything,
+    giving workers ``stop_timeout`` seconds to finish in-flight requests.
+    SIGUSR2 is passed on to every worker, so each writes its own profile.
+    Workers are started with the "spawn" method so no native Ziti state is
+    inherited across ``fork``.
+    """
+
+    def __init__(
+        self,
+        target: Callable[..., Any],
+        args: tuple[Any, ...],
+        workers: int,
+        name: str = "worker",
+        stop_timeout: float = 10.0,
+        warmup: float = 2.0,
+    ) -> None:
+        if workers < 1:
+            raise ValueError(f"workers must be >= 1, got {workers}")
+        self.target = target
+        self.args = args
+        self.name = name
+        self.stop_timeout = stop_timeout
+        self.warmup = warmup
+        self._mp = multiprocessing.get_context("spawn")
+        self._slots = [_Slot(i) for i in range(workers)]
+        self._stopping = False
+        self._reload = False
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_reload)
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, self._on_profile)
+
+        for slot in self._slots:
+            self._start(slot)
+        try:
+            while not self._stopping:
+                if self._reload:
+                    self._reload = False
+                    self._rolling_restart()
+                self._wait_and_restart(timeout=0.5)
+        finally:
+            self._stop_all()
+
+    def _on_stop(self, _sig: int, _frame: object) -> None:
+        self._stopping = True
+
+    def _on_reload(self, _sig: int, _frame: object) -> None:
+        self._reload = True
+
+    def _on_profile(self, sig: int, _frame: object) -> None:
+        for slot in self._slots:
+            if slot.proc is not None and slot.proc.pid is not None:
+                try:
+                    os.kill(slot.proc.pid, sig)
+                except ProcessLookupError:
+                    pass  # exited; it is restarted without a profile
+
+    def _spawn(self, slot: _Slot) -> BaseProcess:
+        proc = self._mp.Process(target=self.target, args=self.args, name=f"{self.name}-{slot.index}", daemon=False)
+        if not hasattr(signal, "SIGUSR2"):
+            proc.start()
+            return proc
+        # The child inherits a blocked SIGUSR2, so a profile request forwarded before it
+        # has a handler stays pending (install_profiler unblocks it) instead of killing it.
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR2})
+        try:
+            proc.start()
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+        return proc
+
+    def _start(self, slot: _Slot) -> None:
+        slot.proc = self._spawn(slot)
+        slot.started = time.monotonic()
+        print(f"[supervisor] started {slot.proc.name} (PID {slot.proc.pid})")
+
+    def _wait_and_restart(self, timeout: float) -> None:
+        live = [s.proc.sentinel for s in self._slots if s.proc is not None and s.proc.is_alive()]
+        if live:
+            multiprocessing.connection.wait(live, timeout=timeout)
+        else:
+            time.sleep(timeout)
+
+        now = time.monotonic()
+        for slot in self._slots:
+            proc = slot.proc
+            if proc is not None and not proc.is_alive():
+                proc.join()
+                slot.proc = None
+                if self._stopping:
+                    continue
+                if now - slot.started >= _STABLE_AFTER:
+                    slot.failures = 0
+                delay = min(_MAX_BACKOFF, 2.0**slot.failures - 1)
+                slot.failures += 1
+                slot.restart_at = now + delay
+                print(f"[supervisor] {proc.name} exited with code {proc.exitcode}; restarting in {delay:.0f}s")
+            if slot.proc is None and not self._stopping and now >= slot.restart_at:
+                self._start(slot)
+
+    def _rolling_restart(self) -> None:
+        print("[supervisor] rolling restart")
+        for slot in self._slots:
+            if self._stopping:
+                return
+            old = slot.proc
+            self._start(slot)
+            # Let the replacement load its identity and bind before retiring the old one.
+            time.sleep(self.warmup)
+            if old is not None:
+                self._stop(old)
+
+    def _stop(self, proc: BaseProcess) -> None:
+        if proc.is_alive():
+            proc.terminate()
+        proc.join(self.stop_timeout)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+
+    def _stop_all(self) -> None:
+        procs = [s.proc for s in self._slots if s.proc is not None]
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for proc in procs:
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+        print("[supervisor] all workers stopped")
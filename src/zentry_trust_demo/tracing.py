@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import itertools
+import json
+import math
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Mapping
+
+# SIGUSR2 profiles the process for this many seconds unless ZENTRY_PROFILE_SECONDS says otherwise.
+DEFAULT_PROFILE_SECONDS = 10.0
+
+
+@dataclass(frozen=True)
+class TraceConfig:
+    """Per-connection timelines, appended to ``path`` as JSON lines (``-`` for stderr).
+
+    Each connection is traced with probability ``sample``; untraced ones cost
+    a ``None`` check at each point a traced one records an event.
+    """
+
+    path: str
+    sample: float = 1.0
+
+    def __post_init__(self) -> None:
+        if not 0 < self.sample <= 1:
+            raise ValueError(f"trace sample rate must be in (0, 1], got {self.sample}")
+
+
+class Timeline:
+    """One traced connection: events in milliseconds since it started, plus free-form fields."""
+
+    __slots__ = ("tracer", "id", "started", "wall", "events", "fields")
+
+    def __init__(self, tracer: Tracer, trace_id: int, started: float) -> None:
+        self.tracer = tracer
+        self.id = trace_id
+        self.started = started
+        self.wall = time.time() - (time.monotonic() - started)
+        self.events: dict[str, float] = {}
+        self.fields: dict[str, Any] = {}
+
+    def mark(self, event: str, at: float | None = None) -> None:
+        """Record ``event`` at monotonic time ``at`` (default: now); only its first occurrence counts."""
+        if event not in self.events:
+            self.events[event] = round(((time.monotonic() if at is None else at) - self.started) * 1e3, 3)
+
+    def note(self, **fields: Any) -> None:
+        self.fields.update(fields)
+
+    def finish(self, at: float | None = None) -> None:
+        self.mark("close", at)
+        self.tracer.write(self)
+
+
+class Tracer:
+    """Writes a :class:`Timeline` per sampled connection as one JSON line.
+
+    A line looks like ``{"ts": ..., "label": "proxy", "id": 7, "service": ...,
+    "bytes": {...}, "events": {"accept": 0.0, "dial_start": 0.2, ...}}`` with
+    events sorted by time.
+    """
+
+    def __init__(self, config: TraceConfig, label: str) -> None:
+        self.config = config
+        self.label = label
+        self.written = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closed = False
+        try:
+            self._out = sys.stderr if config.path == "-" else open(config.path, "a", buffering=1, encoding="utf-8")
+        except OSError as e:
+            raise ValueError(f"cannot write trace file {config.path!r}: {e.strerror or e}") from e
+
+    def start(self, event: str, at: float | None = None) -> Timeline | None:
+        """A timeline opened with ``event``, or None when this connection is not sampled."""
+        if self.config.sample < 1.0 and random.random() >= self.config.sample:
+            return None
+        started = time.monotonic() if at is None else at
+        timeline = Timeline(self, next(self._ids), started)
+        timeline.mark(event, started)
+        return timeline
+
+    def write(self, timeline: Timeline) -> None:
+        record = {
+            "ts": datetime.fromtimestamp(timeline.wall, timezone.utc).isoformat(timespec="milliseconds"),
+            "label": self.label,
+            "id": timeline.id,
+            **timeline.fields,
+            "events": dict(sorted(timeline.events.items(), key=lambda e: e[1])),
+        }
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._closed:
+                return  # a connection that outlived its proxy
+            self._out.write(line)
+            self.written += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            if self._out is not sys.stderr:
+                self._out.close()
+
+    def __enter__(self) -> Tracer:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def _frame_name(code: Any) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack ``interval`` seconds apart and counts identical stacks.
+
+    Pure Python (``sys._current_frames``), so it needs nothing installed and
+    works in any process; while it runs it takes a few percent of one core.
+    It samples wall-clock time, so threads blocked in ``select`` or a lock
+    wait show up too: look past them for the frames that burn CPU.
+    Stacks are kept in the collapsed format (``outer;...;inner count``) that
+    flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples = 0
+
+    def run(self, seconds: float) -> Counter[str]:
+        stacks: Counter[str] = Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                f: Any = frame
+                while f is not None:
+                    names.append(_frame_name(f.f_code))
+                    f = f.f_back
+                stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        return stacks
+
+
+_profiling = threading.Lock()
+
+
+def profile(label: str, seconds: float, directory: str = ".") -> str | None:
+    """Profile this process for ``seconds`` and write the collapsed stacks to a file in ``directory``.
+
+    Returns the file's path, or None if another profile is already running.
+    """
+    if not _profiling.acquire(blocking=False):
+        return None
+    try:
+        print(f"[{label}] profiling PID {os.getpid()} for {seconds:g}s", flush=True)
+        profiler = SamplingProfiler()
+        stacks = profiler.run(seconds)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(directory, f"zentry-profile-{label}-{os.getpid()}-{stamp}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        leaves: Counter[str] = Counter()
+        for stack, n in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        total = sum(leaves.values()) or 1
+        top = ", ".join(f"{name} {n / total:.0%}" for name, n in leaves.most_common(3))
+        print(f"[{label}] profile of {profiler.samples} samples written to {path}; busiest: {top}", flush=True)
+        return path
+    finally:
+        _profiling.release()
+
+
+def _env_seconds(env: Mapping[str, str], name: str) -> float | None:
+    raw = env.get(name)
+    if not raw:
+        return None
+    try:
+        seconds = float(raw)
+    except ValueError:
+        seconds = math.nan
+    if not 0 < seconds < math.inf:
+        raise ValueError(f"{name} must be a number of seconds > 0, got {raw!r}")
+    return seconds
+
+
+def profile_settings(env: Mapping[str, str] = os.environ) -> tuple[float | None, float]:
+    """How long to profile from the start (None: not at all) and per SIGUSR2; ValueError if unparsable."""
+    return _env_seconds(env, "ZENTRY_PROFILE"), _env_seconds(env, "ZENTRY_PROFILE_SECONDS") or DEFAULT_PROFILE_SECONDS
+
+
+def install_profiler(label: str, env: Mapping[str, str] = os.environ) -> None:
+    """Let the process be profiled on demand.
+
+    SIGUSR2 profiles it for ``ZENTRY_PROFILE_SECONDS`` (default 10) seconds;
+    ``ZENTRY_PROFILE=<seconds>`` profiles it right from the start. Profiles
+    are written to ``ZENTRY_PROFILE_DIR`` (default: the working directory).
+    Nothing runs until one is requested. Call it before anything slow at
+    startup: until then SIGUSR2 still has its default action, which kills
+    the process. Raises ValueError if a duration is not a positive number.
+    """
+    directory = env.get("ZENTRY_PROFILE_DIR", ".")
+    at_start, seconds = profile_settings(env)
+
+    def start(duration: float) -> None:
+        threading.Thread(target=profile, args=(label, duration, directory), name="zentry-profiler", daemon=True).start()
+
+    if at_start is not None:
+        start(at_start)
+    # Handlers can only be installed from the main thread (not, e.g., a bench's proxy thread).
+    if hasattr(signal, "SIGUSR2") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2, lambda _sig, _frame: start(seconds))
+        # A supervisor's workers start with it blocked; one sent meanwhile is delivered now.
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGUSR2})
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import socket
-import threading
 from dataclasses import dataclass
 
+from zentry_trust_demo.accept_loop import WorkerLimits, serve_connections
+from zentry_trust_demo.compression import Codec, accept_compression
+from zentry_trust_demo.relay import echo, recv_exact
+
 
 @dataclass(frozen=True)
 class TcpTarget:
@@ -11,28 +14,37 @@ class TcpTarget:
     port: int
 
 
-def run_echo_server(bind: TcpTarget) -> None:
+def run_echo_server(bind: TcpTarget, limits: WorkerLimits = WorkerLimits()) -> None:
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server.bind((bind.host, bind.port))
     server.listen(128)
 
     print(f"[traditional] listening on tcp://{bind.host}:{bind.port} (publicly reachable if port is exposed)")
+    serve_echo(server, limits)
+
+
+def serve_echo(server: socket.socket, limits: WorkerLimits = WorkerLimits(), codec: Codec | None = None) -> None:
+    """Echo every connection accepted on the listening socket ``server``.
+
+    With a ``codec``, clients that offer compressed framing get it.
+    """
 
-    def handle_client(conn: socket.socket, addr: tuple[str, int]) -> None:
+    def handle_client(conn: socket.socket) -> None:
         with conn:
-            while True:
-                data = conn.recv(4096)
-                if not data:
-                    return
-                conn.sendall(data)
+            try:
+                echo(
+                    conn,
+                    idle_timeout=limits.idle_timeout or None,
+                    codec=codec if codec is not None and accept_compression(conn) else None,
+                )
+            except OSError:
+                return
 
-    while True:
-        conn, addr = server.accept()
-        threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+    serve_connections(lambda: server.accept()[0], handle_client, limits, name="traditional")
 
 
 def run_echo_client(target: TcpTarget, message: bytes) -> bytes:
     with socket.create_connection((target.host, target.port), timeout=5) as s:
         s.sendall(message)
-        return s.recv(4096)
+        return recv_exact(s, len(message))
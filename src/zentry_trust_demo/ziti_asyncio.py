@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import asyncio
+import errno
+import inspect
+import os
+import socket
+from typing import Awaitable, Callable
+
+import openziti
+from openziti import zitilib
+
+# Same default buffer limit as asyncio.open_connection / start_server.
+_DEFAULT_LIMIT = 2**16
+
+ClientConnected = Callable[[asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None] | None]
+
+
+def _would_block(e: Exception) -> bool:
+    """Whether a failed ``zitilib.accept`` just means no client is waiting.
+
+    The SDK's ``check_error`` raises a plain ``Exception(errno, message)``
+    rather than an ``OSError``, so the code is read from ``args``.
+    """
+    code = e.errno if isinstance(e, OSError) else (e.args[0] if e.args else None)
+    return code in (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+def _close_dialed(fut: asyncio.Future[socket.socket]) -> None:
+    if not fut.cancelled() and fut.exception() is None:
+        fut.result().close()
+
+
+async def open_ziti_connection(
+    ctx: openziti.ZitiContext,
+    service: str,
+    *,
+    limit: int = _DEFAULT_LIMIT,
+    timeout: float | None = None,
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Dial ``service`` and return an asyncio stream pair, like ``asyncio.open_connection``.
+
+    The SDK's dial blocks until the circuit is up, so that one call runs on
+    the loop's default executor; from then on the connection is an ordinary
+    non-blocking socket driven by the loop's readiness notifications. If
+    ``timeout`` expires first, the dial is abandoned and its socket closed
+    once the SDK returns it.
+    """
+    loop = asyncio.get_running_loop()
+    dial = loop.run_in_executor(None, ctx.connect, service)
+    try:
+        sock = await asyncio.wait_for(asyncio.shield(dial), timeout)
+    except BaseException:
+        dial.add_done_callback(_close_dialed)
+        raise
+    sock.setblocking(False)
+    try:
+        return await asyncio.open_connection(sock=sock, limit=limit)
+    except BaseException:
+        sock.close()
+        raise
+
+
+class ZitiServer:
+    """A Ziti service bound by :func:`start_ziti_server`, in the shape of ``asyncio.Server``.
+
+    The listening descriptor becomes readable when the SDK has a client
+    waiting, so accepting is a reader callback on the loop, not a thread
+    blocked in ``zitilib.accept``.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        fd: int,
+        service: str,
+        handler: ClientConnected,
+        limit: int,
+    ) -> None:
+        self.service = service
+        self._loop = loop
+        self._fd: int | None = fd
+        self._handler = handler
+        self._limit = limit
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._closed = loop.create_future()
+        os.set_blocking(fd, False)
+        loop.add_reader(fd, self._accept_ready)
+
+    def is_serving(self) -> bool:
+        return self._fd is not None
+
+    def _accept_ready(self) -> None:
+        fd = self._fd
+        # Drain what is pending now; the reader fires again when more arrives.
+        while fd is not None:
+            try:
+                client_fd, _peer = zitilib.accept(fd)
+            except Exception as e:
+                if not _would_block(e):
+                    print(f"[ziti] accept on service {self.service!r} failed: {e!r}")
+                return
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0, client_fd)
+            sock.setblocking(False)
+            task = self._loop.create_task(self._serve(sock))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _serve(self, sock: socket.socket) -> None:
+        try:
+            reader, writer = await asyncio.open_connection(sock=sock, limit=self._limit)
+        except BaseException:
+            sock.close()
+            raise
+        try:
+            result = self._handler(reader, writer)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"[ziti] handler for service {self.service!r} failed: {e!r}")
+            writer.close()
+
+    def close(self) -> None:
+        """Stop accepting; connections already handed to the handler are left running."""
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        self._loop.remove_reader(fd)
+        zitilib.ziti_close(fd)
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    async def wait_closed(self) -> None:
+        await asyncio.shield(self._closed)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def serve_forever(self) -> None:
+        try:
+            await asyncio.shield(self._closed)
+        finally:
+            self.close()
+
+    async def __aenter__(self) -> "ZitiServer":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        self.close()
+        await self.wait_closed()
+
+
+async def start_ziti_server(
+    ctx: openziti.ZitiContext,
+    service: str,
+    handler: ClientConnected,
+    *,
+    backlog: int = 128,
+    limit: int = _DEFAULT_LIMIT,
+) -> ZitiServer:
+    """Bind ``service`` and call ``handler(reader, writer)`` for each client, like ``asyncio.start_server``.
+
+    ``handler`` may be a coroutine function (run as a task per client) or a
+    plain function. As with dialing, only the SDK's blocking bind runs on the
+    default executor.
+    """
+    loop = asyncio.get_running_loop()
+    fd = zitilib.ziti_socket(socket.SOCK_STREAM)
+    try:
+        await loop.run_in_executor(None, lambda: zitilib.bind(fd, ctx._ctx, service=service))
+        zitilib.listen(fd, backlog)
+    except BaseException:
+        zitilib.ziti_close(fd)
+        raise
+    return ZitiServer(loop, fd, service, handler, limit)
@@ -1,39 +1,72 @@
 from __future__ import annotations
 
 import socket
-import threading
 
 import openziti
 from openziti import zitilib
 
+from zentry_trust_demo.accept_loop import WorkerLimits, serve_connections
+from zentry_trust_demo.compression import (
+    Codec,
+    CompressedSocket,
+    CompressionConfig,
+    accept_compression,
+    offer_compression,
+)
+from zentry_trust_demo.relay import echo, recv_exact
+from zentry_trust_demo.tracing import install_profiler
 
-def run_ziti_echo_host(ctx: openziti.ZitiContext, service: str, backlog: int = 128) -> None:
+
+def run_ziti_echo_host(
+    ctx: openziti.ZitiContext,
+    service: str,
+    backlog: int = 128,
+    limits: WorkerLimits = WorkerLimits(),
+    compression: CompressionConfig | None = None,
+) -> None:
     """Host an echo service over OpenZiti.
 
     This binds to a *Ziti service name* (not an IP:port) so there is no public listener.
+    Connections are served by a bounded worker pool (see :class:`WorkerLimits`).
+    With ``compression``, clients that offer compressed framing get it; others are served raw.
+    SIGUSR2 or ``ZENTRY_PROFILE`` profiles the host (see :func:`~zentry_trust_demo.tracing.install_profiler`).
     """
+    install_profiler("ziti")
+    codec = Codec(compression) if compression is not None else None
     srv_fd = zitilib.ziti_socket(socket.SOCK_STREAM)
     zitilib.bind(srv_fd, ctx._ctx, service=service)
     zitilib.listen(srv_fd, backlog)
 
     print(f"[ziti] hosting service {service!r} (no public TCP listener)")
+    if codec is not None:
+        print(f"[ziti] accepting compressed framing ({codec.describe()})")
 
     def handle_client(client: socket.socket) -> None:
         with client:
-            while True:
-                data = client.recv(4096)
-                if not data:
-                    return
-                client.sendall(data)
+            try:
+                echo(
+                    client,
+                    idle_timeout=limits.idle_timeout or None,
+                    codec=codec if codec is not None and accept_compression(client) else None,
+                )
+            except OSError:
+                return
 
-    while True:
+    def accept() -> socket.socket:
         client_fd, _peer = zitilib.accept(srv_fd)
-        client_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0, client_fd)
-        threading.Thread(target=handle_client, args=(client_sock,), daemon=True).start()
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM, 0, client_fd)
+
+    serve_connections(accept, handle_client, limits, name="ziti")
 
 
-def run_ziti_echo_client(ctx: openziti.ZitiContext, service: str, message: bytes) -> bytes:
-    """Connect to a Ziti service and echo a message."""
+def run_ziti_echo_client(
+    ctx: openziti.ZitiContext,
+    service: str,
+    message: bytes,
+    codec: Codec | None = None,
+) -> bytes:
+    """Connect to a Ziti service and echo a message (as compressed frames with a ``codec``)."""
     with ctx.connect(service) as s:
-        s.sendall(message)
-        return s.recv(4096)
+        conn = CompressedSocket(offer_compression(s, codec), codec) if codec is not None else s
+        conn.sendall(message)
+        return recv_exact(conn, len(message))  # type: ignore[arg-type]
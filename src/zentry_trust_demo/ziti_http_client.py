@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+import openziti
+
+from zentry_trust_demo.admission import DialGate, gated
+from zentry_trust_demo.balancer import Lease, Upstreams
+from zentry_trust_demo.compression import Codec, CompressedSocket, offer_compression
+from zentry_trust_demo.http1 import (
+    HttpResponse,
+    ResponseHead,
+    format_request,
+    iter_body,
+    read_response,
+    read_response_head,
+)
+
+if TYPE_CHECKING:
+    from zentry_trust_demo.tracing import Timeline, Tracer
+
+# Safe to send again if a reused connection turns out to be dead.
+_IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class _Connection:
+    __slots__ = ("sock", "rfile", "lease", "trace", "requests", "sent", "received")
+
+    def __init__(
+        self,
+        sock: socket.socket | CompressedSocket,
+        lease: Lease | None = None,
+        trace: Timeline | None = None,
+    ) -> None:
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        self.lease = lease
+        # Only kept up to date when traced: bytes of requests sent, response heads and (decoded) bodies received.
+        self.trace = trace
+        self.requests = self.sent = self.received = 0
+
+    def request_sent(self, n: int) -> None:
+        if self.trace is not None:
+            self.trace.mark("first_request_sent")
+            self.requests += 1
+            self.sent += n
+
+    def head_received(self, head: ResponseHead, body: int = 0) -> None:
+        if self.trace is not None:
+            self.trace.mark("first_response_head")
+            self.received += len(head.raw) + body
+
+    def close(self, error: BaseException | None = None) -> None:
+        self.rfile.close()
+        self.sock.close()
+        if self.lease is not None:
+            self.lease.release()
+        t, self.trace = self.trace, None
+        if t is not None:
+            if error is not None:
+                t.note(error=type(error).__name__)
+            t.note(requests=self.requests, bytes={"sent": self.sent, "received": self.received})
+            t.finish()
+
+
+class StreamingResponse:
+    """A response whose body is read from the connection as it is iterated.
+
+    Iterating yields body chunks (de-chunked) without holding the whole body.
+    Close the response (or use it as a context manager) when done; the
+    connection goes back to the client only if the body was read to the end.
+    """
+
+    def __init__(self, client: "ZitiHttpClient", service: str, conn: _Connection, head: ResponseHead) -> None:
+        self.head = head
+        self._client = client
+        self._service = service
+        self._conn: _Connection | None = conn
+        self._complete = False
+
+    @property
+    def status(self) -> int:
+        return self.head.status
+
+    @property
+    def content_length(self) -> int | None:
+        return self.head.content_length if self.head.has_body else 0
+
+    def header(self, name: str, default: str | None = None) -> str | None:
+        return self.head.header(name, default)
+
+    def __iter__(self) -> Iterator[bytes]:
+        conn = self._conn
+        if conn is None:
+            raise RuntimeError("response body already consumed or closed")
+        try:
+            if conn.trace is None:
+                yield from iter_body(conn.rfile, self.head)
+            else:
+                for chunk in iter_body(conn.rfile, self.head):
+                    conn.received += len(chunk)
+                    yield chunk
+        except BaseException:
+            self.close()
+            raise
+        self._complete = True
+        self.close()
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._client._release(self._service, conn, self._complete and self.head.keep_alive)
+
+    def __enter__(self) -> "StreamingResponse":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+class ZitiHttpClient:
+    """HTTP/1.1 client that keeps Ziti connections alive between requests.
+
+    Responses are framed by Content-Length or chunked encoding, so a request
+    finishes as soon as its body is complete and the connection is parked for
+    the next request to the same service instead of being closed. The client
+    is thread-safe; each in-flight request uses its own connection.
+
+    With a ``gate``, new dials wait for admission (and may raise
+    ``DialRejected``); reusing an idle connection never does. Services that
+    ``upstreams`` knows as replica groups are dialed through the group, and
+    their kept-alive connections count as that replica's load until closed.
+    With a ``codec``, every connection negotiates compressed framing after
+    the dial (the host must have compression enabled). With a ``tracer``,
+    sampled connections get a timeline from dial to close.
+    """
+
+    def __init__(
+        self,
+        ctx: openziti.ZitiContext,
+        max_idle_per_service: int = 8,
+        timeout: float | None = 10.0,
+        gate: DialGate | None = None,
+        upstreams: Upstreams | None = None,
+        codec: Codec | None = None,
+        tracer: Tracer | None = None,
+    ) -> None:
+        self.ctx = ctx
+        self.max_idle_per_service = max_idle_per_service
+        self.timeout = timeout
+        self.gate = gate
+        self.upstreams = upstreams
+        self.codec = codec
+        self.tracer = tracer
+        self.dials = 0
+        self._idle: dict[str, list[_Connection]] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, service: str, origin: str = "", timeline: Timeline | None = None) -> tuple[_Connection, bool]:
+        """An idle connection to ``service`` or a new one; ``timeline`` is the caller's, to mark the dial on."""
+        with self._lock:
+            idle = self._idle.get(service)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            if timeline is not None:
+                timeline.note(service=conn.lease.service if conn.lease is not None else service)
+            return conn, True
+        trace = self.tracer.start("acquire") if self.tracer is not None else None
+        traces = [t for t in (trace, timeline) if t is not None]
+        group = self.upstreams.get(service) if self.upstreams is not None else None
+        try:
+            with gated(self.gate, origin):
+                for t in traces:
+                    t.mark("dial_start")
+                if group is None:
+                    sock, lease = self._dial(service), None
+                else:
+                    lease = group.connect(self._dial)
+                    sock = lease.sock
+        except BaseException as e:
+            if trace is not None:
+                trace.note(service=service, error=type(e).__name__)
+                trace.finish()
+            raise
+        with self._lock:
+            self.dials += 1  # only connections actually made, not failed attempts
+        for t in traces:
+            t.mark("dial_end")
+            t.note(service=lease.service if lease is not None else service)
+        sock.settimeout(self.timeout)
+        conn = _Connection(CompressedSocket(sock, self.codec) if self.codec is not None else sock, lease, trace)
+        return conn, False
+
+    def _dial(self, service: str) -> socket.socket:
+        sock = self.ctx.connect(service)
+        return offer_compression(sock, self.codec) if self.codec is not None else sock
+
+    def _release(self, service: str, conn: _Connection, reusable: bool) -> None:
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(service, [])
+                if len(idle) < self.max_idle_per_service:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def request(
+        self,
+        service: str,
+        path: str = "/",
+        method: str = "GET",
+        headers: dict[str, str] | None = None,
+        body: bytes = b"",
+    ) -> HttpResponse:
+        method = method.upper()
+        req = format_request(method, path, service, headers, body)
+        while True:
+            conn, reused = self._acquire(service)
+            try:
+                conn.sock.sendall(req)
+                conn.request_sent(len(req))
+                resp = read_response(conn.rfile, method)
+            except OSError as e:
+                conn.close(e)
+                # An idle connection may have been closed by the server meanwhile.
+                if reused and method in _IDEMPOTENT:
+                    continue
+                raise
+            except Exception as e:
+                conn.close(e)
+                raise
+            conn.head_received(resp.head, len(resp.body))
+            self._release(service, conn, resp.head.keep_alive)
+            return resp
+
+    def get(self, service: str, path: str = "/", headers: dict[str, str] | None = None) -> HttpResponse:
+        return self.request(service, path, "GET", headers)
+
+    def stream(self, service: str, path: str = "/", headers: dict[str, str] | None = None) -> StreamingResponse:
+        """GET ``path`` and return once the headers are in; the body is read lazily."""
+        return self.exchange(service, format_request("GET", path, service, headers))
+
+    def exchange(
+        self,
+        service: str,
+        head: bytes,
+        body: bytes | Iterable[bytes] = b"",
+        method: str = "GET",
+        origin: str = "",
+        trace: Timeline | None = None,
+    ) -> StreamingResponse:
+        """Send an already formatted request and stream the response back.
+
+        ``body`` may be an iterable of chunks (already framed to match
+        ``head``), which lets a proxy pass a request body through without
+        buffering it. Only requests with a ``bytes`` body are retried when a
+        reused connection turns out to be dead. ``origin`` is who a new dial
+        is counted against by the client's gate. ``trace`` (the caller's own
+        timeline, e.g. a proxied connection's) gets the dial, the service and
+        the first response head marked on it.
+        """
+        method = method.upper()
+        replayable = isinstance(body, bytes) and method in _IDEMPOTENT
+        while True:
+            conn, reused = self._acquire(service, origin, trace)
+            try:
+                conn.sock.sendall(head)
+                if isinstance(body, bytes):
+                    if body:
+                        conn.sock.sendall(body)
+                else:
+                    for chunk in body:
+                        conn.sock.sendall(chunk)
+                conn.request_sent(len(head) + len(body) if isinstance(body, bytes) else len(head))
+                resp = read_response_head(conn.rfile, method)
+            except OSError as e:
+                conn.close(e)
+                if reused and replayable:
+                    continue
+                raise
+            except BaseException as e:
+                conn.close(e)
+                raise
+            conn.head_received(resp)
+            if trace is not None:
+                trace.mark("first_response_head")
+            return StreamingResponse(self, service, conn, resp)
+
+    def pipeline(self, service: str, paths: list[str], method: str = "GET") -> list[HttpResponse]:
+        """Send several requests back-to-back on one connection, then read the answers.
+
+        If the server closes the connection part-way (e.g. an HTTP/1.0 server),
+        the unanswered requests are sent again on a fresh connection.
+        """
+        method = method.upper()
+        if method not in _IDEMPOTENT:
+            raise ValueError(f"refusing to pipeline non-idempotent {method} requests")
+        results: list[HttpResponse] = []
+        pending = list(paths)
+        while pending:
+            conn, reused = self._acquire(service)
+            answered = 0
+            keep = False
+            try:
+                conn.sock.sendall(b"".join(format_request(method, p, service) for p in pending))
+                for _ in pending:
+                    resp = read_response(conn.rfile, method)
+                    results.append(resp)
+                    answered += 1
+                    keep = resp.head.keep_alive
+                    if not keep:
+                        break
+            except OSError:
+                conn.close()
+                if answered == 0 and not reused:
+                    raise
+                pending = pending[answered:]
+                continue
+            except Exception:
+                conn.close()
+                raise
+            pending = pending[answered:]
+            self._release(service, conn, keep and not pending)
+        return results
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def __enter__(self) -> "ZitiHttpClient":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def fetch_many(
+    client: ZitiHttpClient,
+    service: str,
+    path: str,
+    count: int,
+    concurrency: int = 1,
+    pipeline: int = 1,
+) -> list[HttpResponse | Exception]:
+    """Issue ``count`` GETs for ``path`` from ``concurrency`` workers.
+
+    Each worker sends batches of ``pipeline`` requests per round trip. Failed
+    requests are returned as the exception instead of aborting the run.
+    """
+    shares = [count // concurrency + (1 if i < count % concurrency else 0) for i in range(concurrency)]
+
+    def worker(n: int) -> list[HttpResponse | Exception]:
+        out: list[HttpResponse | Exception] = []
+        while n > 0:
+            batch = min(n, pipeline)
+            try:
+                if batch == 1:
+                    out.append(client.get(service, path))
+                else:
+                    out.extend(client.pipeline(service, [path] * batch))
+            except Exception as e:
+                out.extend([e] * batch)
+            n -= batch
+        return out
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ziti-http") as pool:
+        return [r for part in pool.map(worker, [s for s in shares if s]) for r in part]
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import openziti
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    """Sizing for a pool of pre-dialed Ziti connections.
+
+    ``min_size`` spares are kept warm at all times. After a client finds the
+    pool empty, the refill target grows towards ``max_size`` and decays back to
+    ``min_size`` once no spare has been taken for ``idle_ttl`` seconds. A spare
+    idle that long is closed and re-dialed; spares are also health-checked
+    every ``health_interval`` seconds.
+    """
+
+    min_size: int = 2
+    max_size: int = 8
+    idle_ttl: float = 60.0
+    health_interval: float = 5.0
+
+    def __post_init__(self) -> None:
+        if self.min_size < 0 or self.max_size < max(self.min_size, 1):
+            raise ValueError(f"invalid pool size: min={self.min_size} max={self.max_size}")
+        if self.idle_ttl <= 0 or self.health_interval <= 0:
+            raise ValueError(f"pool idle TTL and health interval must be > 0: {self}")
+
+
+def _is_alive(sock: socket.socket) -> bool:
+    """Return False if the peer already closed (or reset) an idle connection."""
+    try:
+        # Protocols that greet first leave data waiting; only EOF counts as dead.
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) != b""
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+
+
+class ZitiConnectionPool:
+    """Keep spare, already-dialed Ziti connections for one service.
+
+    Connections are handed out once: the proxy forwards a single browser socket
+    over each one, so ``acquire`` removes it from the pool and a background
+    thread dials a replacement. When the pool is empty ``acquire`` falls back to
+    dialing inline, exactly like the unpooled path.
+    """
+
+    def __init__(self, ctx: openziti.ZitiContext, service: str, config: PoolConfig) -> None:
+        self.ctx = ctx
+        self.service = service
+        self.config = config
+        # Spares with the time each went idle; ``_last_acquired`` tells a finished burst from a busy pool.
+        self._idle: deque[tuple[socket.socket, float]] = deque()
+        self._last_acquired = time.monotonic()
+        self._cond = threading.Condition()
+        self._target = config.min_size
+        self._dialing = 0
+        self._closed = False
+        self._refiller = threading.Thread(target=self._refill_loop, name=f"ziti-pool-{service}", daemon=True)
+
+    def start(self) -> "ZitiConnectionPool":
+        self._refiller.start()
+        return self
+
+    def acquire(self) -> socket.socket:
+        with self._cond:
+            self._last_acquired = time.monotonic()
+            while self._idle:
+                sock, _idle_since = self._idle.popleft()
+                if _is_alive(sock):
+                    self._cond.notify()
+                    return sock
+                sock.close()
+            # Miss: dial inline for this client and grow the warm set for the next burst.
+            self._target = min(self.config.max_size, max(self._target * 2, 1))
+            self._cond.notify()
+        return self.ctx.connect(self.service)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._cond.notify_all()
+        for sock, _idle_since in idle:
+            sock.close()
+
+    def __enter__(self) -> "ZitiConnectionPool":
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def _reap(self, now: float) -> None:
+        """Drop dead or expired spares; called with the lock held."""
+        keep: deque[tuple[socket.socket, float]] = deque()
+        for sock, idle_since in self._idle:
+            if now - idle_since > self.config.idle_ttl or not _is_alive(sock):
+                sock.close()
+            else:
+                keep.append((sock, idle_since))
+        self._idle = keep
+        if now - self._last_acquired > self.config.idle_ttl:
+            # Nobody took a spare for a full TTL: the burst is over.
+            self._target = self.config.min_size
+
+    def _refill_loop(self) -> None:
+        backoff = 0.0
+        last_check = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._closed and (len(self._idle) + self._dialing >= self._target or backoff):
+                    timeout = backoff or max(0.0, self.config.health_interval - (time.monotonic() - last_check))
+                    self._cond.wait(timeout)
+                    backoff = 0.0
+                    now = time.monotonic()
+                    if now - last_check >= self.config.health_interval:
+                        self._reap(now)
+                        last_check = now
+                if self._closed:
+                    return
+                self._dialing += 1
+
+            try:
+                sock = self.ctx.connect(self.service)
+            except Exception:
+                # Service not reachable yet (or policy missing); retry later.
+                sock = None
+
+            with self._cond:
+                self._dialing -= 1
+                if sock is None:
+                    backoff = min(self.config.health_interval, 1.0)
+                elif self._closed:
+                    sock.close()
+                else:
+                    self._idle.append((sock, time.monotonic()))
@@ -1,10 +1,31 @@
 from __future__ import annotations
 
-import select
+import contextlib
+import socket
 import socketserver
+import threading
 from dataclasses import dataclass
+from typing import Callable
 
+import openziti
+
+from zentry_trust_demo.admission import AdmissionConfig, DialGate, DialRejected, client_key, gated, reject_connection
+from zentry_trust_demo.balancer import BalancerConfig, Upstreams
 from zentry_trust_demo.common import load_context
+from zentry_trust_demo.compression import Codec, CompressionConfig, offer_compression
+from zentry_trust_demo.deadlines import Reaper, Timeouts
+from zentry_trust_demo.event_proxy import serve_event_loop_proxy
+from zentry_trust_demo.http_cache import ResponseCache
+from zentry_trust_demo.l7_proxy import L7ProxyHandler
+from zentry_trust_demo.metrics import ProxyMetrics, StatsConfig, start_stats
+from zentry_trust_demo.relay import DEFAULT_BUFFER_SIZE, Relay, check_forwarding, run_relay
+from zentry_trust_demo.routing import Route, RoutingTable, sniff
+from zentry_trust_demo.tracing import TraceConfig, Tracer, install_profiler
+from zentry_trust_demo.ziti_http_client import ZitiHttpClient
+from zentry_trust_demo.ziti_pool import PoolConfig, ZitiConnectionPool
+
+PROXY_MODES = ("tcp", "l7")
+DEFAULT_CACHE_MAX_ENTRY = 8 * 1024 * 1024
 
 
 @dataclass(frozen=True)
@@ -18,64 +39,349 @@ class _ZitiHttpProxyHandler(socketserver.BaseRequestHandler):
 
     For each incoming TCP connection, we open a Ziti connection to the
     configured service and simply shuttle bytes in both directions. This keeps
-    HTTP semantics transparent to both sides.
+    HTTP semantics transparent to both sides. With a pool configured, the Ziti
+    connection is taken pre-dialed instead of being dialed here. A service
+    with replicas gets the connection on one of them, and a failed dial is
+    retried on another before the browser sees a 502.
+
+    With a routing table, the service is picked from the connection's first
+    request (or TLS ClientHello), peeked at without consuming it. With a dial
+    gate, the dial waits its turn and the browser gets a 503 if it cannot.
+    Connect, idle and lifetime deadlines are enforced by the server's reaper,
+    not by this thread.
     """
 
     def handle(self) -> None:  # type: ignore[override]
         server = self.server  # type: ignore[assignment]
-        ctx = server.ctx  # type: ignore[attr-defined]
-        service = server.service  # type: ignore[attr-defined]
+        routes = server.routes  # type: ignore[attr-defined]
+        metrics = server.metrics  # type: ignore[attr-defined]
+        reaper = server.reaper  # type: ignore[attr-defined]
 
+        conn = metrics.opened()
+        watch = reaper.watch(self.request, conn=conn)
         try:
-            with ctx.connect(service) as zsock:
-                # Bidirectional forwarding using select for proper HTTP support
-                sockets = [self.request, zsock]
-                while True:
-                    readable, _, exceptional = select.select(sockets, [], sockets, 30.0)
-                    
-                    if exceptional:
-                        break
-                    
-                    if not readable:
-                        # Timeout - close idle connection
-                        break
-                    
-                    for sock in readable:
-                        try:
-                            data = sock.recv(4096)
-                            if not data:
-                                return
-                            
-                            # Forward data to the other side
-                            if sock is self.request:
-                                zsock.sendall(data)
-                            else:
-                                self.request.sendall(data)
-                        except Exception:
-                            return
-        except Exception:
-            # This is a demo proxy; ignore per-connection errors.
-            return
+            service = server.service  # type: ignore[attr-defined]
+            protocol = "http"
+            if routes is not None:
+                hello = sniff(self.request)
+                service, protocol = routes.route(hello), hello.protocol
+                if service is None:
+                    metrics.error("route", "NoRoute", conn)
+                    return
+            try:
+                with gated(server.gate, client_key(self.request)):  # type: ignore[attr-defined]
+                    metrics.mark(conn, "dial_start")
+                    lease = server.upstreams[service].connect(server.dial)  # type: ignore[attr-defined]
+            except DialRejected as e:
+                metrics.error("admission", e.reason, conn)
+                reject_connection(self.request, http=protocol != "tls")
+                return
+            except Exception as e:
+                if not watch.expired:
+                    metrics.error("dial", e, conn)
+                    reject_connection(self.request, http=protocol != "tls", status=502)
+                return
+            first_byte_at = 0.0
+            try:
+                with lease.sock as zsock:
+                    if watch.expired:
+                        return  # the client was given up on while we dialed
+                    # Each direction half-closes independently, so a request body
+                    # can still be uploading while the response streams back.
+                    r = Relay(
+                        self.request,
+                        zsock,
+                        forwarding=server.forwarding,  # type: ignore[attr-defined]
+                        codec=server.codec,  # type: ignore[attr-defined]
+                    )
+                    metrics.dialed(conn, r, lease.service)
+                    reaper.connected(watch, r)
+                    try:
+                        run_relay(r, idle_timeout=None, buffer_size=server.buffer_size)  # type: ignore[attr-defined]
+                    except Exception as e:
+                        if not watch.expired:
+                            metrics.error("relay", e, conn)
+                    first_byte_at = r.directions[1].first_byte_at
+            finally:
+                lease.release(first_byte_at)
+        finally:
+            reaper.release(watch)
+            metrics.closed(conn)
 
 
 class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
     allow_reuse_address = True
+    # A page load opens connections in bursts; the default backlog of 5 drops SYNs.
+    request_queue_size = 1024
 
 
-def run_ziti_http_proxy(identity_path: str, service: str, bind: ProxyBind) -> None:
+def run_ziti_http_proxy(
+    identity_path: str,
+    service: str,
+    bind: ProxyBind,
+    pool: PoolConfig | None = None,
+    engine: str = "threads",
+    loops: int = 1,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    forwarding: str = "buffered",
+    stats: StatsConfig | None = None,
+    mode: str = "tcp",
+    cache_bytes: int = 0,
+    cache_max_entry: int = DEFAULT_CACHE_MAX_ENTRY,
+    routes: list[Route] | None = None,
+    admission: AdmissionConfig | None = None,
+    timeouts: Timeouts = Timeouts(),
+    balancer: BalancerConfig = BalancerConfig(),
+    compression: CompressionConfig | None = None,
+    trace: TraceConfig | None = None,
+) -> None:
     """Expose a local TCP port that forwards HTTP over a Ziti service.
 
     After this is running you can open http://host:port/ in a browser and the
     traffic will be tunneled through OpenZiti to the ghost HTTP server.
+
+    If ``pool`` is given, spare Ziti connections are dialed ahead of time so a
+    new browser connection does not wait for dial/session setup.
+
+    ``engine="threads"`` handles each browser connection on its own thread;
+    ``engine="async"`` multiplexes all of them on ``loops`` selector threads,
+    which scales to thousands of keep-alive connections.
+
+    Bytes are moved through a reusable ``buffer_size`` buffer per connection.
+    ``forwarding="splice"`` moves them with ``os.splice`` instead, falling
+    back to the buffer where unsupported.
+
+    Connection, byte, latency and error metrics are always collected; ``stats``
+    publishes them on a local Prometheus endpoint and/or as periodic log lines.
+
+    ``mode="l7"`` parses HTTP instead of relaying bytes: requests from all
+    browser connections share kept-alive Ziti connections, and with
+    ``cache_bytes`` > 0 cacheable responses (up to ``cache_max_entry`` bytes
+    each) are served from an in-memory LRU cache.
+
+    ``routes`` lets one listener front several services: connections (in l7
+    mode, requests) are sent to the service matching their Host header, path
+    prefix or TLS SNI, and to ``service`` when nothing matches. All routes
+    share the one loaded identity.
+
+    ``admission`` caps how many Ziti dials run at once (overall and per
+    client IP); connections over the cap queue briefly and are answered with
+    503 when the queue is full or their wait expires.
+
+    ``timeouts`` bounds how long a connection may take to reach the service,
+    sit idle, and live in total; all are tracked by one reaper thread.
+
+    ``service`` (and any route target) may list replicas as ``"web-a,web-b"``:
+    connections are spread over them as ``balancer`` says, failing replicas
+    are ejected for a while, and a failed dial moves on to the next replica.
+
+    With ``compression``, every Ziti connection is switched to compressed
+    framing right after the dial; the services' hosts must run with
+    compression enabled, or the dial fails.
+
+    With ``trace``, a sample of connections get their timeline (accept, dial,
+    first byte each way, half-closes, close, bytes) written as JSON lines.
+    SIGUSR2 or ``ZENTRY_PROFILE`` profiles the process (see
+    :func:`zentry_trust_demo.tracing.install_profiler`).
     """
+    if engine not in ("threads", "async"):
+        raise ValueError(f"unknown proxy engine {engine!r} (expected 'threads' or 'async')")
+    check_forwarding(forwarding, buffer_size)
+    check_mode(mode, engine, pool, routes)
+    install_profiler("proxy")
+
+    serve_ziti_http_proxy(
+        load_context(identity_path),
+        service,
+        bind,
+        pool=pool,
+        engine=engine,
+        loops=loops,
+        buffer_size=buffer_size,
+        forwarding=forwarding,
+        stats=stats,
+        mode=mode,
+        cache_bytes=cache_bytes,
+        cache_max_entry=cache_max_entry,
+        routes=routes,
+        admission=admission,
+        timeouts=timeouts,
+        balancer=balancer,
+        codec=Codec(compression) if compression is not None else None,
+        trace=trace,
+    )
 
-    ctx = load_context(identity_path)
 
-    with _ThreadingTCPServer((bind.host, bind.port), _ZitiHttpProxyHandler) as server:
+def check_mode(mode: str, engine: str, pool: PoolConfig | None, routes: list[Route] | None = None) -> None:
+    if mode not in PROXY_MODES:
+        raise ValueError(f"unknown proxy mode {mode!r} (expected 'tcp' or 'l7')")
+    if mode == "l7" and engine != "threads":
+        raise ValueError("the l7 proxy mode only runs on the threads engine")
+    if mode == "l7" and pool is not None:
+        raise ValueError("the l7 proxy mode keeps its own Ziti connections alive; drop the pool options")
+    if mode == "l7" and any(r.kind == "sni" for r in routes or ()):
+        raise ValueError("SNI routes need --mode tcp: the l7 mode cannot see inside TLS")
+
+
+def serve_ziti_http_proxy(
+    ctx: openziti.ZitiContext,
+    service: str,
+    bind: ProxyBind,
+    pool: PoolConfig | None = None,
+    engine: str = "threads",
+    loops: int = 1,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    forwarding: str = "buffered",
+    on_ready: Callable[[tuple[str, int]], None] | None = None,
+    stats: StatsConfig | None = None,
+    metrics: ProxyMetrics | None = None,
+    mode: str = "tcp",
+    cache_bytes: int = 0,
+    cache_max_entry: int = DEFAULT_CACHE_MAX_ENTRY,
+    routes: list[Route] | None = None,
+    admission: AdmissionConfig | None = None,
+    timeouts: Timeouts = Timeouts(),
+    balancer: BalancerConfig = BalancerConfig(),
+    codec: Codec | None = None,
+    trace: TraceConfig | None = None,
+    stop: threading.Event | None = None,
+) -> None:
+    """Run the proxy on an already loaded context (see :func:`run_ziti_http_proxy`).
+
+    ``on_ready`` is called with the bound address once the port is listening,
+    which lets callers bind port 0 and learn the port that was picked. Pass
+    ``metrics`` to read the proxy's counters from the calling code, and a
+    ``codec`` to compress traffic to the services (its stats count the bytes).
+    Setting ``stop`` makes the proxy stop accepting and return. A ``trace``
+    file that cannot be opened raises ValueError before anything starts.
+    """
+    check_mode(mode, engine, pool, routes)
+    metrics = metrics or ProxyMetrics()
+    tracer = Tracer(trace, "proxy") if trace is not None else None
+    if tracer is not None:
+        metrics.tracer = tracer
+    # Closed once the server (and, in the threads engine, its handlers) are done.
+    closing_tracer = tracer if tracer is not None else contextlib.nullcontext()
+    cache = ResponseCache(cache_bytes, cache_max_entry) if mode == "l7" and cache_bytes > 0 else None
+    if cache is not None:
+        metrics.collectors.append(cache.render)
+    gate = DialGate(admission) if admission is not None and admission.enabled else None
+    if gate is not None:
+        metrics.collectors.append(gate.render)
+        metrics.summaries.append(gate.summary)
+    if codec is not None:
+        metrics.collectors.append(codec.stats.render)
+        metrics.summaries.append(codec.stats.summary)
+    if stats is not None:
+        start_stats(metrics, stats)
+    reaper = Reaper(timeouts, metrics)
+    table = RoutingTable(routes, default=service) if routes else None
+    upstreams = Upstreams(table.services if table is not None else [service], balancer)
+    if upstreams.replicated:
+        metrics.collectors.append(upstreams.render)
+        upstreams.start_probes(ctx)
+    zpools = {s: ZitiConnectionPool(ctx, s, pool).start() for s in upstreams.services} if pool is not None else {}
+
+    def dial(name: str) -> socket.socket:
+        zpool = zpools.get(name)
+        sock = zpool.acquire() if zpool is not None else ctx.connect(name)
+        return offer_compression(sock, codec) if codec is not None else sock
+
+    if table is None and not upstreams.replicated:
+        target = f"Ziti service {service!r}"
+    else:
+        target = f"{len(upstreams.services)} Ziti services"
+
+    def announce(suffix: str) -> None:
+        print(f"[proxy] listening on http://{bind.host}:{bind.port} and forwarding to {target}{suffix}")
+        for line in table.describe() if table is not None else ():
+            print(f"[proxy]   {line}")
+        if upstreams.replicated:
+            print(f"[proxy] balancing replicas by {balancer.policy}, retrying failed dials {balancer.retries}x")
+        if gate is not None:
+            c = gate.config
+            print(
+                f"[proxy] admitting {c.max_dials or 'unlimited'} concurrent dials "
+                f"({c.per_client or 'unlimited'} per client), queueing {c.queue_size} for up to {c.queue_timeout:g}s"
+            )
+        if codec is not None:
+            print(f"[proxy] compressing traffic to the services ({codec.describe()})")
+        if trace is not None:
+            print(f"[proxy] tracing {trace.sample:.0%} of connections to {trace.path}")
+
+    def halt_on_stop(halt: Callable[[], None]) -> None:
+        if stop is not None:
+            threading.Thread(target=lambda: (stop.wait(), halt()), name="ziti-proxy-stop", daemon=True).start()
+
+    if engine == "async":
+        try:
+            with closing_tracer, socket.create_server((bind.host, bind.port), backlog=1024) as listener:
+                announce(" (event-loop engine)")
+                if on_ready is not None:
+                    on_ready(listener.getsockname()[:2])
+                # Shutting the listener down wakes the blocked accept().
+                halt_on_stop(lambda: listener.shutdown(socket.SHUT_RDWR))
+                serve_event_loop_proxy(
+                    ctx,
+                    service,
+                    listener,
+                    pools=zpools,
+                    upstreams=upstreams,
+                    loops=loops,
+                    buffer_size=buffer_size,
+                    forwarding=forwarding,
+                    metrics=metrics,
+                    routes=table,
+                    gate=gate,
+                    reaper=reaper,
+                    codec=codec,
+                    stop=stop,
+                )
+        finally:
+            for zpool in zpools.values():
+                zpool.close()
+            reaper.close()
+        return
+
+    handler = L7ProxyHandler if mode == "l7" else _ZitiHttpProxyHandler
+    client = None
+    if mode == "l7":
+        client = ZitiHttpClient(
+            ctx,
+            max_idle_per_service=64,
+            timeout=timeouts.idle or None,
+            gate=gate,
+            upstreams=upstreams,
+            codec=codec,
+        )
+    with closing_tracer, _ThreadingTCPServer((bind.host, bind.port), handler) as server:
         server.ctx = ctx  # type: ignore[attr-defined]
         server.service = service  # type: ignore[attr-defined]
-        print(
-            f"[proxy] listening on http://{bind.host}:{bind.port} "
-            f"and forwarding to Ziti service {service!r}"
-        )
-        server.serve_forever()
+        server.routes = table  # type: ignore[attr-defined]
+        server.pools = zpools  # type: ignore[attr-defined]
+        server.upstreams = upstreams  # type: ignore[attr-defined]
+        server.dial = dial  # type: ignore[attr-defined]
+        server.client = client  # type: ignore[attr-defined]
+        server.cache = cache  # type: ignore[attr-defined]
+        server.buffer_size = buffer_size  # type: ignore[attr-defined]
+        server.forwarding = forwarding  # type: ignore[attr-defined]
+        server.metrics = metrics  # type: ignore[attr-defined]
+        server.gate = gate  # type: ignore[attr-defined]
+        server.reaper = reaper  # type: ignore[attr-defined]
+        server.codec = codec  # type: ignore[attr-defined]
+        announce(" (HTTP-aware)" if mode == "l7" else "")
+        if cache is not None:
+            print(f"[proxy] caching responses in up to {cache_bytes / 2**20:.0f} MiB")
+        if pool is not None:
+            print(f"[proxy] keeping {pool.min_size}-{pool.max_size} pre-dialed Ziti connections warm per service")
+        if on_ready is not None:
+            on_ready(server.server_address[:2])
+        halt_on_stop(server.shutdown)
+        try:
+            server.serve_forever()
+        finally:
+            for zpool in zpools.values():
+                zpool.close()
+            if client is not None:
+                client.close()
+            reaper.close()
@@ -1,10 +1,19 @@
 from __future__ import annotations
 
 import http.server
+import os
 import socket
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-import openziti
+from zentry_trust_demo.compression import Codec, CompressedSocket, CompressionConfig, accept_compression
+from zentry_trust_demo.http1 import format_head, format_request, read_response
+from zentry_trust_demo.supervisor import Supervisor, install_graceful_stop
+
+if TYPE_CHECKING:
+    import openziti
+
+    from zentry_trust_demo.static_site import StaticConfig
 
 
 @dataclass(frozen=True)
@@ -13,10 +22,68 @@ class HttpBind:
     port: int
 
 
-def run_traditional_http_server(bind: HttpBind) -> None:
+@dataclass(frozen=True)
+class KeepAlive:
+    """HTTP/1.1 persistent connection limits.
+
+    A connection is closed after ``max_requests`` responses (0 = no limit) or
+    once it has been idle for ``idle_timeout`` seconds (0 = never).
+    """
+
+    max_requests: int = 100
+    idle_timeout: float = 5.0
+
+
+class PersistentHandler(http.server.BaseHTTPRequestHandler):
+    """``BaseHTTPRequestHandler`` speaking HTTP/1.1, so one connection serves many requests.
+
+    The default HTTP/1.0 handler closes the connection after every response,
+    which through Ziti means a new circuit per request. Subclasses must send a
+    Content-Length (or close) with every response.
+
+    With a ``codec``, a client that offers compressed framing gets it for the
+    whole connection; other clients are served as usual.
+    """
+
+    protocol_version = "HTTP/1.1"
+    keep_alive = KeepAlive()
+    codec: Codec | None = None
+
+    def setup(self) -> None:
+        self.timeout = self.keep_alive.idle_timeout or None
+        if self.codec is not None and accept_compression(self.request, self.timeout):
+            self.request = CompressedSocket(self.request, self.codec)
+        super().setup()
+        self.served = 0
+        # Ziti hands us AF_UNIX sockets; only real TCP has Nagle to turn off.
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_response(self, code: int, message: str | None = None) -> None:
+        super().send_response(code, message)
+        self.served += 1
+        limit = self.keep_alive.max_requests
+        if limit and self.served >= limit:
+            self.send_header("Connection", "close")
+
+    def log_message(self, fmt: str, *args) -> None:  # noqa: D401
+        return
+
+
+def run_traditional_http_server(bind: HttpBind, keep_alive: KeepAlive = KeepAlive()) -> None:
     """A plain HTTP server that is visible on the network (traditional model)."""
+    server = make_traditional_http_server(bind, keep_alive)
+    print(f"[traditional] HTTP listening on http://{bind.host}:{bind.port} (discoverable if reachable)")
+    server.serve_forever()
+
 
-    class Handler(http.server.BaseHTTPRequestHandler):
+def make_traditional_http_server(
+    bind: HttpBind,
+    keep_alive: KeepAlive = KeepAlive(),
+) -> http.server.ThreadingHTTPServer:
+    """Build (but do not start) the server used by :func:`run_traditional_http_server`."""
+
+    class Handler(PersistentHandler):
         def do_GET(self) -> None:  # noqa: N802
             body = b"Welcome to the Traditional Server (public listener)\n"
             self.send_response(200)
@@ -25,22 +92,76 @@ def run_traditional_http_server(bind: HttpBind) -> None:
             self.end_headers()
             self.wfile.write(body)
 
-        def log_message(self, fmt: str, *args) -> None:  # noqa: D401
-            return
+    Handler.keep_alive = keep_alive
+    return http.server.ThreadingHTTPServer((bind.host, bind.port), Handler)
 
-    server = http.server.ThreadingHTTPServer((bind.host, bind.port), Handler)
-    print(f"[traditional] HTTP listening on http://{bind.host}:{bind.port} (discoverable if reachable)")
-    server.serve_forever()
 
-
-def run_zitified_http_server(identity_path: str, service: str, bind: HttpBind) -> None:
+def run_zitified_http_server(
+    identity_path: str,
+    service: str,
+    bind: HttpBind,
+    workers: int = 1,
+    keep_alive: KeepAlive = KeepAlive(),
+    static: StaticConfig | None = None,
+    compression: CompressionConfig | None = None,
+) -> None:
     """Run a normal Python HTTP server, but bind its socket to a Ziti service.
 
     The application still binds to (host, port) in code, but `openziti.monkeypatch`
     remaps that bind() to an OpenZiti service name. Result: no public TCP listener.
-    """
 
-    class Handler(http.server.BaseHTTPRequestHandler):
+    With ``workers > 1`` a parent process supervises that many server processes.
+    Each loads the identity itself and binds the same service, so Ziti spreads
+    incoming circuits across them and request handling is no longer capped at
+    one core by the GIL. SIGHUP restarts the workers one at a time.
+
+    Connections are kept alive per ``keep_alive``, so a browser or the proxy
+    reuses one Ziti circuit for many requests.
+
+    With ``static`` set, the files under ``static.root`` are served instead of
+    the welcome page (see :mod:`zentry_trust_demo.static_site`).
+
+    With ``compression``, clients that offer compressed framing (the proxy or
+    ``ziti-http-get`` with ``--compress``) get it; browsers and other raw
+    clients are unaffected.
+    """
+    if static is not None and not os.path.isdir(static.root):
+        raise ValueError(f"static root {static.root!r} is not a directory")
+    if workers > 1:
+        print(f"[ziti] supervising {workers} HTTP workers for service {service!r}")
+        args = (identity_path, service, bind, keep_alive, static, compression)
+        Supervisor(_zitified_http_worker, args, workers, name="ghost-http").run()
+        return
+    _serve_zitified_http(identity_path, service, bind, keep_alive, static, compression)
+
+
+def _zitified_http_worker(
+    identity_path: str,
+    service: str,
+    bind: HttpBind,
+    keep_alive: KeepAlive,
+    static: StaticConfig | None,
+    compression: CompressionConfig | None,
+) -> None:
+    _serve_zitified_http(identity_path, service, bind, keep_alive, static, compression, graceful=True)
+
+
+def _ghost_handler(
+    keep_alive: KeepAlive,
+    static: StaticConfig | None,
+    codec: Codec | None = None,
+) -> type[PersistentHandler]:
+    if static is not None:
+        from zentry_trust_demo.static_site import StaticHandler, StaticSite
+
+        class StaticGhostHandler(StaticHandler):
+            site = StaticSite(static)
+
+        StaticGhostHandler.keep_alive = keep_alive
+        StaticGhostHandler.codec = codec
+        return StaticGhostHandler
+
+    class Handler(PersistentHandler):
         def do_GET(self) -> None:  # noqa: N802
             body = b"Welcome to the Zentry-Trust Ghost Server (no public listener)\n"
             self.send_response(200)
@@ -49,12 +170,48 @@ def run_zitified_http_server(identity_path: str, service: str, bind: HttpBind) -
             self.end_headers()
             self.wfile.write(body)
 
-        def log_message(self, fmt: str, *args) -> None:  # noqa: D401
-            return
+    Handler.keep_alive = keep_alive
+    Handler.codec = codec
+    return Handler
+
+
+def make_ghost_http_server(
+    bind: HttpBind,
+    keep_alive: KeepAlive = KeepAlive(),
+    static: StaticConfig | None = None,
+    codec: Codec | None = None,
+) -> http.server.ThreadingHTTPServer:
+    """Build (but do not start) the ghost server's handler on a plain TCP listener.
+
+    For offline runs (``zentry soak``) against a loopback stand-in; the real
+    ghost server is bound to its Ziti service by :func:`run_zitified_http_server`.
+    """
+    return http.server.ThreadingHTTPServer((bind.host, bind.port), _ghost_handler(keep_alive, static, codec))
+
+
+def _serve_zitified_http(
+    identity_path: str,
+    service: str,
+    bind: HttpBind,
+    keep_alive: KeepAlive = KeepAlive(),
+    static: StaticConfig | None = None,
+    compression: CompressionConfig | None = None,
+    graceful: bool = False,
+) -> None:
+    # Imported here so the traditional server never loads the Ziti SDK.
+    import openziti
+
+    from zentry_trust_demo.common import load_context
+    from zentry_trust_demo.tracing import install_profiler
+
+    install_profiler("ziti")
+    codec = Codec(compression) if compression is not None else None
+    handler = _ghost_handler(keep_alive, static, codec)
 
     bindings = {
         (bind.host, bind.port): {
-            "ztx": identity_path,
+            # Share the process-wide context with any other service using this identity.
+            "ztx": load_context(identity_path),
             "service": service,
         }
     }
@@ -62,34 +219,37 @@ def run_zitified_http_server(identity_path: str, service: str, bind: HttpBind) -
     # While patched, frameworks that create/bind sockets (Flask/Django/http.server/etc)
     # will bind *inside Ziti* for matching (host, port) pairs.
     with openziti.monkeypatch(bindings=bindings):
-        server = http.server.ThreadingHTTPServer((bind.host, bind.port), Handler)
+        server = http.server.ThreadingHTTPServer((bind.host, bind.port), handler)
+        if graceful:
+            # On SIGTERM stop accepting, then wait for in-flight requests.
+            server.daemon_threads = False
+            install_graceful_stop(server.shutdown)
         print(f"[ziti] HTTP bound to service {service!r} via monkeypatch (no public TCP listener)")
+        if static is not None:
+            print(f"[ziti] serving files from {os.path.abspath(static.root)}")
+        if codec is not None:
+            print(f"[ziti] accepting compressed framing ({codec.describe()})")
         server.serve_forever()
+        server.server_close()
 
 
-def ziti_http_get(ctx: openziti.ZitiContext, service: str, path: str = "/") -> bytes:
-    """Minimal HTTP/1.1 GET over a Ziti service (no intercept config required)."""
-    if not path.startswith("/"):
-        path = "/" + path
-
-    req = (
-        f"GET {path} HTTP/1.1\r\n"
-        f"Host: {service}\r\n"
-        "Connection: close\r\n"
-        "\r\n"
-    ).encode("utf-8")
+def ziti_http_get(ctx: openziti.ZitiContext, service: str, path: str = "/", timeout: float | None = 10.0) -> bytes:
+    """Minimal HTTP/1.1 GET over a Ziti service (no intercept config required).
 
+    Returns the response head followed by the body; a chunked body comes back
+    de-chunked, under a head that frames it with Content-Length instead. The
+    response ends where its Content-Length or chunked framing says, so a
+    kept-open connection does not hold the call up; ``timeout`` only bounds
+    each wait for the server and raises ``socket.timeout`` instead of truncating.
+    """
     with ctx.connect(service) as s:
-        s.settimeout(10)
-        s.sendall(req)
-        chunks: list[bytes] = []
-        while True:
-            try:
-                data = s.recv(4096)
-            except socket.timeout:
-                break
-            if not data:
-                break
-            chunks.append(data)
-
-    return b"".join(chunks)
+        s.settimeout(timeout)
+        s.sendall(format_request("GET", path, service, {"Connection": "close"}))
+        with s.makefile("rb") as rfile:
+            resp = read_response(rfile)
+    head = resp.head
+    if not (head.chunked and head.has_body):
+        return head.raw + resp.body
+    headers = [(k, v) for k, v in head.headers if k.lower() not in ("transfer-encoding", "trailer")]
+    headers.append(("Content-Length", str(len(resp.body))))
+    return format_head(f"{head.version} {head.status} {head.reason}", headers) + resp.body
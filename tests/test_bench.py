@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+pytest.importorskip("openziti")  # imported by the Ziti client code, though the bench never loads an identity
+
+from zentry_trust_demo.bench import CASES, BenchConfig, run_bench  # noqa: E402
+from zentry_trust_demo.compression import MAX_FRAME  # noqa: E402
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_bench_runs_every_case_over_loopback(engine: str) -> None:
+    config = BenchConfig(concurrency=2, duration=0.2, payload_sizes=(64, 4096), proxy_engine=engine)
+    results = run_bench(config)
+
+    assert [(r.case, r.payload) for r in results] == [(case, size) for size in (64, 4096) for case in CASES]
+    for r in results:
+        assert r.ops > 0 and r.errors == 0, r
+    # The in-process proxies were stopped, not left accepting or relaying on daemon threads.
+    proxy_threads = ("ziti-proxy-stop", "ziti-proxy-loop", "ziti-proxy-reaper")
+    assert not [t.name for t in threading.enumerate() if t.name.startswith(proxy_threads)]
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_compressed_proxy_relays_bodies_larger_than_a_frame(engine: str) -> None:
+    # Incompressible frames are MAX_FRAME raw bytes on the wire; a partial one must not stall the relay.
+    size = 2 * MAX_FRAME + 123
+    config = BenchConfig(
+        cases=("ziti-http-proxy-zlib",),
+        concurrency=1,
+        duration=0.2,
+        payload_sizes=(size,),
+        proxy_engine=engine,
+        content="random",
+    )
+    [result] = run_bench(config)
+    assert result.ops > 0 and result.errors == 0, result
+    assert result.bytes == result.ops * size
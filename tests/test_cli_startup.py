@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+# Commands that never touch Ziti; cron jobs and health probes run them constantly.
+COMMANDS = {
+    "zentry --help": ["--help"],
+    "traditional-server --help": ["traditional-server", "--help"],
+    "traditional-client --help": ["traditional-client", "--help"],
+    "traditional-http-server --help": ["traditional-http-server", "--help"],
+    # --help exits before a handler runs; also load what the traditional handlers import.
+    "traditional handler modules": (
+        "import zentry_trust_demo.cli, zentry_trust_demo.traditional, zentry_trust_demo.zitify_http"
+    ),
+}
+
+# Generous, since timing is machine-dependent; STARTUP_BUDGET_MS tightens it (e.g. to 150 on a dev box).
+DEFAULT_BUDGET_MS = 1000.0
+
+# Runs first in the child: any attempt to import the SDK is reported (and fails), whether or not it is installed.
+_BLOCK_OPENZITI = """
+import sys
+
+class _BlockOpenziti:
+    def find_spec(self, name, path=None, target=None):
+        if name == "openziti" or name.startswith("openziti."):
+            print(f"BLOCKED import of {name}", file=sys.stderr)
+            raise ImportError(f"{name} must not be imported by this command")
+        return None
+
+sys.meta_path.insert(0, _BlockOpenziti())
+"""
+
+
+def _program(command: list[str] | str) -> str:
+    if isinstance(command, str):
+        return _BLOCK_OPENZITI + command
+    argv = ["zentry", *command]
+    run = "runpy.run_module('zentry_trust_demo.cli', run_name='__main__')"
+    return _BLOCK_OPENZITI + f"import runpy; sys.argv = {argv!r}; {run}"
+
+
+def _import_times(program: str) -> tuple[dict[str, int], str]:
+    """Cumulative import time in microseconds of every top-level import (``python -X importtime``), and stderr."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(SRC), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", program],
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr
+    times: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        # Nested imports are indented further; keep the outermost ones, which include them.
+        depth = len(name) - len(name.lstrip(" "))
+        times.setdefault(name.strip(), int(parts[1]) if depth == 1 else -1)
+    return times, proc.stderr
+
+
+@pytest.mark.parametrize("command", COMMANDS.values(), ids=COMMANDS.keys())
+def test_non_ziti_commands_do_not_import_openziti(command: list[str] | str) -> None:
+    times, stderr = _import_times(_program(command))
+    assert "BLOCKED import of openziti" not in stderr
+    budget = float(os.environ.get("STARTUP_BUDGET_MS") or DEFAULT_BUDGET_MS)
+    total_ms = sum(t for t in times.values() if t > 0) / 1000
+    assert total_ms <= budget, f"imports took {total_ms:.0f} ms (budget {budget:g} ms)"
+
+
+def test_blocked_openziti_import_is_caught() -> None:
+    # Guards the guard: a command that does import the SDK must fail the check above.
+    _times, stderr = _import_times(_program("try:\n    import openziti\nexcept ImportError:\n    pass"))
+    assert "BLOCKED import of openziti" in stderr
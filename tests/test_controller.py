@@ -0,0 +1,164 @@
+import http.server
+import json
+import stat
+import sys
+import threading
+import types
+import uuid
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from zentry_trust_demo.controller import (
+    API_PREFIX,
+    ControllerConfig,
+    ControllerError,
+    ManagementClient,
+    provision_lab,
+)
+
+PASSWORD = "secret"
+
+
+class _Controller(http.server.ThreadingHTTPServer):
+    """Just enough of the edge management API: password login, list by name, create, get, patch, delete."""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.tokens: set[str] = set()
+        self.entities: dict[str, dict[str, dict[str, Any]]] = {}
+        self.logins = 0
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Controller
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, data: Any = None, error: str = "") -> None:
+        body = json.dumps({"error": {"code": error, "message": error}} if error else {"data": data}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self) -> None:
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        path = url.path.removeprefix(API_PREFIX)
+        if path == "/authenticate":
+            if body["password"] != PASSWORD:
+                return self._reply(401, error="INVALID_AUTH")
+            token = uuid.uuid4().hex
+            self.server.tokens.add(token)
+            self.server.logins += 1
+            return self._reply(200, {"token": token})
+        if self.headers.get("zt-session") not in self.server.tokens:
+            return self._reply(401, error="UNAUTHORIZED")
+        kind, _, entity_id = path.strip("/").partition("/")
+        store = self.server.entities.setdefault(kind, {})
+        if self.command == "POST":
+            entity_id = uuid.uuid4().hex[:8]
+            store[entity_id] = dict(body, id=entity_id)
+            if kind == "identities":
+                store[entity_id]["enrollment"] = {"ott": {"jwt": f"jwt-{body['name']}"}}
+            return self._reply(201, {"id": entity_id})
+        if self.command == "GET" and not entity_id:
+            query = parse_qs(url.query).get("filter", [""])[0]
+            return self._reply(200, [e for e in store.values() if not query or f'"{e["name"]}"' in query])
+        if entity_id not in store:
+            return self._reply(404, error="NOT_FOUND")
+        if self.command == "PATCH":
+            store[entity_id].update(body)
+        elif self.command == "DELETE":
+            del store[entity_id]
+        self._reply(200, store.get(entity_id, {}))
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+
+@pytest.fixture
+def controller() -> Iterator[_Controller]:
+    server = _Controller()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server: _Controller, token_cache: Path | None = None, password: str = PASSWORD) -> ManagementClient:
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    return ManagementClient(ControllerConfig(url=url, password=password), token_cache)
+
+
+def test_provision_lab_creates_enrolls_and_is_idempotent(
+    controller: _Controller,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # enroll() imports the SDK lazily; stand in for it so the test needs no network or identity.
+    sdk = types.SimpleNamespace(enroll=lambda jwt: json.dumps({"enrolled-with": jwt}))
+    monkeypatch.setitem(sys.modules, "openziti", sdk)
+    cache = tmp_path / "sessions.json"
+
+    with _client(controller, cache) as api:
+        provision_lab(api, "web", "host", "client", tmp_path / "ids")
+        assert api.logins == 1
+    names = {kind: sorted(e["name"] for e in found.values()) for kind, found in controller.entities.items()}
+    assert names["identities"] == ["client", "host"]
+    assert names["services"] == ["web"]
+    assert names["service-policies"] == ["web-bind", "web-dial"]
+    for name in ("host", "client"):
+        assert (tmp_path / "ids" / f"{name}.jwt").read_text() == f"jwt-{name}"
+        identity = tmp_path / "ids" / f"{name}.json"
+        assert json.loads(identity.read_text()) == {"enrolled-with": f"jwt-{name}"}
+        assert stat.S_IMODE(identity.stat().st_mode) == 0o600
+    assert stat.S_IMODE(cache.stat().st_mode) == 0o600
+
+    # A second run reuses the cached session and creates nothing new.
+    with _client(controller, cache) as api:
+        provision_lab(api, "web", "host", "client", tmp_path / "ids")
+        assert api.logins == 0 and api.requests > 0
+    assert controller.logins == 1
+    assert len(controller.entities["identities"]) == 2
+
+
+def test_expired_session_logs_in_again(controller: _Controller, tmp_path: Path) -> None:
+    cache = tmp_path / "sessions.json"
+    with _client(controller, cache) as api:
+        api.login()
+    controller.tokens.clear()  # e.g. the controller restarted
+    cache.chmod(0o644)
+
+    with _client(controller, cache) as api:
+        assert api.list("services") == []
+        assert api.logins == 1
+    assert stat.S_IMODE(cache.stat().st_mode) == 0o600
+
+
+def test_wrong_password_is_a_controller_error(controller: _Controller) -> None:
+    with _client(controller, password="wrong") as api:
+        with pytest.raises(ControllerError) as e:
+            api.login()
+    assert e.value.status == 401 and e.value.code == "INVALID_AUTH"
+
+
+def test_tls_verification_is_skipped_only_when_asked(capsys: pytest.CaptureFixture[str]) -> None:
+    assert not ControllerConfig.from_env({}).insecure
+    assert ControllerConfig.from_env({"ZITI_INSECURE": "1"}).insecure
+    with ManagementClient(ControllerConfig()):
+        pass
+    assert "WARNING" not in capsys.readouterr().err
+    with ManagementClient(ControllerConfig(insecure=True)):
+        pass
+    err = capsys.readouterr().err
+    assert "[controller] WARNING: not verifying the TLS certificate of https://localhost:1280" in err
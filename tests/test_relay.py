@@ -0,0 +1,28 @@
+import random
+import socket
+import threading
+
+from zentry_trust_demo.compression import Codec, CompressionConfig
+from zentry_trust_demo.relay import Relay, run_relay
+
+
+def test_codec_relay_completes_frames_larger_than_max_pending() -> None:
+    # Incompressible data goes out as raw frames; while one is half received the relay must keep reading it.
+    codec = Codec(CompressionConfig())
+    payload = random.Random(0).randbytes(200_000)
+    client, client_peer = socket.socketpair()
+    framed, framed_peer = socket.socketpair()
+    client_peer.shutdown(socket.SHUT_WR)
+    thread = threading.Thread(target=run_relay, args=(Relay(client, framed, max_pending=4096, codec=codec), 5))
+    thread.start()
+    framed_peer.sendall(codec.encoder().encode(payload))
+    framed_peer.shutdown(socket.SHUT_WR)
+
+    client_peer.settimeout(10)
+    received = bytearray()
+    while chunk := client_peer.recv(65536):
+        received += chunk
+    thread.join(10)
+    for sock in (client, client_peer, framed, framed_peer):
+        sock.close()
+    assert received == payload
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+import pytest
+
+from zentry_trust_demo.static_site import StaticConfig, StaticSite, accepts_gzip
+
+
+@pytest.fixture
+def site(tmp_path: Path) -> StaticSite:
+    (tmp_path / "index.html").write_text("<h1>hi</h1>")
+    return StaticSite(StaticConfig(root=str(tmp_path)))
+
+
+@pytest.mark.parametrize("url_path", ["/%00", "/index.html%00", "/%00/index.html", "/../etc/passwd", "/%2e%2e/x"])
+def test_lookup_refuses_paths_it_cannot_serve(site: StaticSite, url_path: str) -> None:
+    # A NUL byte used to reach os.stat and raise ValueError instead of a 404.
+    assert site.lookup(url_path, gzip_ok=False) is None
+
+
+def test_lookup_serves_files_under_the_root(site: StaticSite) -> None:
+    found = site.lookup("/", gzip_ok=False)
+    assert found is not None and not isinstance(found, str)
+    assert found.path.endswith("index.html")
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        ("gzip", True),
+        ("br, gzip;q=0.5", True),
+        ("GZIP ; Q=1", True),
+        ("x-gzip", True),
+        ("gzip;q=0", False),
+        ("gzip;q=0.000, *", False),
+        ("*", True),
+        ("*;q=0", False),
+        ("br, *;q=0.1", True),
+        ("identity", False),
+        ("gzipfoo", False),
+        ("gzip;q=bogus", False),
+        ("", False),
+    ],
+)
+def test_accepts_gzip_honours_q_values(header: str, expected: bool) -> None:
+    assert accepts_gzip(header) is expected